@@ -0,0 +1,3 @@
+"""
+Offline benchmark harness: mock upstream servers and a load driver for the RAG pipeline.
+"""
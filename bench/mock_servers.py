@@ -0,0 +1,259 @@
+"""
+Local stand-ins for the Tavily and OpenAI-compatible APIs.
+Responses are synthetic but shaped like the real ones (tool calls, SSE streams,
+usage blocks), with configurable latency, error and 429 rates so the pipeline
+can be benchmarked with no network access.
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Tuple
+
+
+ASPECTS = ["overview", "recent developments", "evidence and data", "criticisms", "practical applications",
+           "history", "comparisons", "future outlook"]
+
+
+class UpstreamProfile:
+    """Behaviour of a mock upstream: lognormal latency around ``latency_median`` seconds with
+    spread ``latency_sigma``, plus the share of requests answered with a 500 or a 429."""
+
+    def __init__(self, latency_median: float = 0.05, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 0.5, stream_chunk_delay: float = 0.005):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunk_delay = stream_chunk_delay
+
+    def latency(self) -> float:
+        return self.latency_median * math.exp(random.gauss(0.0, self.latency_sigma))
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, profile: UpstreamProfile, port: int = 0, **options):
+        super().__init__(("127.0.0.1", port), handler)
+        self.profile = profile
+        self.options = options
+        self.counts: Counter = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def start(self) -> "MockServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.counts))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_fault(self) -> bool:
+        """Sleep for the sampled latency, then maybe answer with a 429 or 500 instead of a result."""
+        profile = self.server.profile
+        time.sleep(profile.latency())
+        roll = random.random()
+        if roll < profile.rate_limit_rate:
+            self.server.count("rate_limited")
+            self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{profile.retry_after:g}"})
+            return True
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            self.server.count("errors")
+            self._send_json(500, {"error": "internal error"})
+            return True
+        return False
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def _page(query: str, index: int) -> Tuple[str, str]:
+    """Deterministic snippet and raw page text about ``query``."""
+    rng = random.Random(_seed(f"{query}/{index}"))
+    words = re.findall(r"\w+", query) or ["topic"]
+    sentences = []
+    for n in range(rng.randint(12, 30)):
+        picked = " ".join(rng.choice(words) for _ in range(3))
+        sentences.append(f"Source {index} notes that {picked} matters for reason {n} with figure {rng.randint(1, 999)}.")
+    return " ".join(sentences[:3]), "\n\n".join(" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4))
+
+
+class TavilyHandler(_MockHandler):
+    """``POST /search`` returning distinct pages per query."""
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.rstrip("/") != "/search":
+            self._send_json(404, {"error": "not found"})
+            return
+        self.server.count("requests")
+        if self._inject_fault():
+            return
+        query = body.get("query", "")
+        results = []
+        for i in range(int(body.get("max_results", 5))):
+            snippet, raw = _page(query, i)
+            results.append({
+                "title": f"{query} - source {i}",
+                "url": f"https://source-{_seed(query) % 100000}-{i}.example/{'-'.join(query.split())[:60]}",
+                "content": snippet,
+                "raw_content": raw if body.get("include_raw_content") else None,
+                "score": round(1.0 - i * 0.1, 2)
+            })
+        self.server.count("ok")
+        self._send_json(200, {"query": query, "results": results, "response_time": 0.0})
+
+
+class OpenAIHandler(_MockHandler):
+    """``POST /chat/completions`` answering the pipeline's tool calls, plain and streamed prompts.
+
+    ``sufficient_rate`` (server option) is the share of evaluations that accept the answer;
+    the rest ask for another round.
+    """
+
+    def do_POST(self):
+        body = self._read_json()
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        self.server.count("requests")
+        if self._inject_fault():
+            return
+        messages = body.get("messages", [])
+        prompt = "\n".join(m.get("content") or "" for m in messages)
+        tools = body.get("tools") or []
+        if tools:
+            name = tools[0]["function"]["name"]
+            self.server.count(name)
+            self._send_completion(body, prompt, tool_call=(name, json.dumps(self._tool_arguments(name, messages))))
+        elif body.get("stream"):
+            self.server.count("stream")
+            self._send_stream(body, prompt, self._answer_text(prompt))
+        else:
+            self.server.count("completion")
+            self._send_completion(body, prompt, content=self._answer_text(prompt))
+
+    def _tool_arguments(self, name: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        system = (messages[0].get("content") or "") if messages else ""
+        user = (messages[-1].get("content") or "") if messages else ""
+        if name == "plan_search_queries":
+            question = user.split("Question:", 1)[-1].strip()
+            match = re.search(r"Plan up to (\d+)", system)
+            count = int(match.group(1)) if match else 3
+            return {"queries": [
+                {"query": f"{question} {aspect}", "intent": f"Find the {aspect}", "priority": max(5 - i, 2),
+                 "expected_depth": "basic"}
+                for i, aspect in enumerate(ASPECTS[:count])
+            ]}
+        if name == "analyze_queries":
+            numbers = re.findall(r"^(\d+)\. ", user.split("Search Results:")[0], re.M)
+            return {"analyses": [{"query_number": int(n), "analysis": f"Findings for query {n} [S1]."}
+                                 for n in numbers]}
+        if name == "evaluate_answer":
+            sufficient = random.random() < self.server.options.get("sufficient_rate", 0.8)
+            score = 8.0 if sufficient else 4.0
+            return {
+                "action": "sufficient_return" if sufficient else "research_again",
+                "accuracy": score, "completeness": score, "relevance": score, "clarity": score,
+                "confidence": score,
+                "reasoning": "Synthetic evaluation",
+                "missing_topics": None if sufficient else ["follow-up details"],
+                "improvement_guidance": None
+            }
+        return {}
+
+    @staticmethod
+    def _answer_text(prompt: str) -> str:
+        rng = random.Random(_seed(prompt))
+        words = re.findall(r"[a-z]{4,}", prompt.lower())[:200] or ["answer"]
+        paragraphs = []
+        for p in range(3):
+            paragraphs.append(" ".join(rng.choice(words) for _ in range(40)) + f" [{p + 1}].")
+        return "\n\n".join(paragraphs)
+
+    @staticmethod
+    def _usage(prompt: str, completion: str) -> Dict[str, int]:
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(completion) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _send_completion(self, body: Dict[str, Any], prompt: str, content: Optional[str] = None,
+                         tool_call: Optional[Tuple[str, str]] = None):
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if tool_call:
+            message["tool_calls"] = [{"id": "call_0", "type": "function",
+                                      "function": {"name": tool_call[0], "arguments": tool_call[1]}}]
+        self.server.count("ok")
+        self._send_json(200, {
+            "id": "mock", "object": "chat.completion", "model": body.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": self._usage(prompt, content or tool_call[1])
+        })
+
+    def _send_stream(self, body: Dict[str, Any], prompt: str, text: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunks = re.findall(r"\S+\s*", text)
+        for chunk in chunks:
+            event = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.profile.stream_chunk_delay)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            event = {"choices": [], "usage": self._usage(prompt, text)}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+        self.server.count("ok")
+
+
+def start_mock_servers(search_profile: UpstreamProfile, llm_profile: UpstreamProfile,
+                       sufficient_rate: float = 0.8) -> Tuple[MockServer, MockServer]:
+    """Start the mock Tavily and LLM servers on free local ports."""
+    search = MockServer(TavilyHandler, search_profile).start()
+    llm = MockServer(OpenAIHandler, llm_profile, sufficient_rate=sufficient_rate).start()
+    return search, llm
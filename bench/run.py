@@ -0,0 +1,331 @@
+"""
+Offline throughput benchmark.
+Starts the mock Tavily and LLM servers in a separate process, then drives
+``research_question`` in-process, the ``/ws`` endpoint of a local server, or the
+CLI as subprocesses at a fixed concurrency, and reports latency percentiles,
+sessions/sec, upstream calls per session and peak memory.
+
+    python -m bench.run --mode research --sessions 50 --concurrency 8
+    python -m bench.run --mode ws --llm-latency 0.3 --rate-limit-rate 0.05
+    python -m bench.run --mode ws --sockets 2 --concurrency 16
+    python -m bench.run --mode cli --sessions 10 --json bench_output.json --max-p95 20
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+import urllib.request
+from typing import List, Dict, Any, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.mock_servers import UpstreamProfile, start_mock_servers
+
+
+def _serve_mocks(search_profile: UpstreamProfile, llm_profile: UpstreamProfile, sufficient_rate: float, conn):
+    search, llm = start_mock_servers(search_profile, llm_profile, sufficient_rate)
+    conn.send((search.url, llm.url))
+    threading.Event().wait()
+
+
+def start_mock_process(args) -> Tuple[multiprocessing.Process, str, str]:
+    """Run the mock servers in a child process so they do not share the GIL or heap with the system under test."""
+    search_profile = UpstreamProfile(args.search_latency, args.search_sigma, args.error_rate, args.rate_limit_rate,
+                                     args.retry_after)
+    llm_profile = UpstreamProfile(args.llm_latency, args.llm_sigma, args.error_rate, args.rate_limit_rate,
+                                  args.retry_after, args.stream_chunk_delay)
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve_mocks, args=(search_profile, llm_profile, args.sufficient_rate,
+                                                                 child), daemon=True)
+    process.start()
+    search_url, llm_url = parent.recv()
+    return process, search_url, llm_url
+
+
+def mock_stats(url: str) -> Dict[str, int]:
+    with urllib.request.urlopen(f"{url}/_stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def bench_environment(search_url: str, llm_url: str, workdir: str, keep_caches: bool) -> Dict[str, str]:
+    env = {
+        "TAVILY_API_KEY": "bench",
+        "TAVILY_BASE_URL": search_url,
+        "LLM_BASE_URL": llm_url,
+        "LLM_API_KEY": "bench",
+        "LLM_MODEL": "mock",
+        "CORPUS_PATH": os.path.join(workdir, "corpus.sqlite"),
+        "SEARCH_CACHE_PATH": os.path.join(workdir, "search_cache.sqlite"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite"),
+        "SESSION_STORE_PATH": os.path.join(workdir, "sessions.sqlite"),
+        "LOGS_DIR": os.path.join(workdir, "logs")
+    }
+    if not keep_caches:
+        # Every session should reach the (mock) upstreams
+        env.update({
+            "SEARCH_CACHE_ENABLED": "false",
+            "LLM_CACHE_ENABLED": "false",
+            "SEMANTIC_CACHE_ENABLED": "false",
+            "CORPUS_ENABLED": "false"
+        })
+    return env
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+async def _run_sessions(questions: List[str], concurrency: int,
+                        run_one) -> Tuple[List[Tuple[float, Optional[str]]], float]:
+    """Run ``run_one(question)`` for every question, ``concurrency`` at a time.
+
+    Returns (seconds, error) per session and the wall time of the whole run.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(question: str) -> Tuple[float, Optional[str]]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await run_one(question)
+                return time.perf_counter() - started, None
+            except Exception as e:
+                return time.perf_counter() - started, f"{type(e).__name__}: {e}"
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(timed(question) for question in questions))
+    return outcomes, time.perf_counter() - started
+
+
+async def bench_research(args, questions: List[str], workdir: str):
+    from src.rag_system import RAGSystem
+
+    rag_system = RAGSystem.from_env()
+
+    async def discard_tokens(delta: str, attempt: int):
+        pass
+
+    async def run_one(question: str):
+        await rag_system.research_question(question, num_searches=args.searches, num_rewordings=args.rewordings,
+                                           token_callback=discard_tokens if args.stream else None)
+
+    try:
+        return await _run_sessions(questions, args.concurrency, run_one)
+    finally:
+        rag_system.close()
+
+
+async def bench_ws(args, questions: List[str], workdir: str):
+    import uvicorn
+    import websockets
+    if args.sockets:
+        # Let each shared connection hold its share of the sessions in flight
+        os.environ["WS_MAX_SESSIONS"] = str(-(-args.concurrency // args.sockets))
+    import main
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    async def run_single(question: str):
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws", max_size=None) as websocket:
+            await websocket.send(json.dumps({
+                "type": "query",
+                "content": question,
+                "settings": {"num_searches": args.searches, "num_rewordings": args.rewordings}
+            }))
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message["type"] == "result":
+                    return
+                if message["type"] == "error":
+                    raise RuntimeError(message.get("content"))
+
+    # With --sockets, sessions are multiplexed over a few shared connections by request id
+    sockets, readers, pending = [], [], {}
+
+    async def read(websocket):
+        async for raw in websocket:
+            message = json.loads(raw)
+            future = pending.get(message.get("request_id"))
+            if future is None or future.done():
+                continue
+            if message["type"] == "result":
+                future.set_result(None)
+            elif message["type"] in ("error", "cancelled"):
+                future.set_exception(RuntimeError(message.get("content")))
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError("Connection closed"))
+
+    async def run_multiplexed(question: str):
+        request_id = f"bench-{len(pending)}"
+        future = pending[request_id] = asyncio.get_running_loop().create_future()
+        index = min(range(len(sockets)), key=in_flight.__getitem__)
+        in_flight[index] += 1
+        try:
+            await sockets[index].send(json.dumps({
+                "type": "query",
+                "id": request_id,
+                "content": question,
+                "settings": {"num_searches": args.searches, "num_rewordings": args.rewordings}
+            }))
+            await future
+        finally:
+            in_flight[index] -= 1
+
+    if args.sockets:
+        in_flight = [0] * args.sockets
+        for _ in range(args.sockets):
+            websocket = await websockets.connect(f"ws://127.0.0.1:{port}/ws", max_size=None)
+            sockets.append(websocket)
+            readers.append(asyncio.create_task(read(websocket)))
+
+    try:
+        return await _run_sessions(questions, args.concurrency, run_multiplexed if args.sockets else run_single)
+    finally:
+        for websocket in sockets:
+            await websocket.close()
+        await asyncio.gather(*readers, return_exceptions=True)
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def bench_cli(args, questions: List[str], workdir: str):
+    env = {**os.environ}
+    output_dir = os.path.join(workdir, "output")
+
+    async def run_one(question: str):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "main_cli.py"), question,
+            "--searches", str(args.searches), "--rewordings", str(args.rewordings), "--output-dir", output_dir,
+            cwd=workdir, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"exit {process.returncode}: {stderr.decode(errors='replace')[-300:]}")
+
+    return await _run_sessions(questions, args.concurrency, run_one)
+
+
+MODES = {"research": bench_research, "ws": bench_ws, "cli": bench_cli}
+
+
+def build_report(args, outcomes: List[Tuple[float, Optional[str]]], elapsed: float,
+                 search_counts: Dict[str, int], llm_counts: Dict[str, int]) -> Dict[str, Any]:
+    latencies = [seconds for seconds, error in outcomes if error is None]
+    errors = [error for _, error in outcomes if error is not None]
+    # ru_maxrss is in KiB on Linux; CLI sessions run in child processes
+    who = resource.RUSAGE_CHILDREN if args.mode == "cli" else resource.RUSAGE_SELF
+    sessions = len(outcomes)
+    return {
+        "mode": args.mode,
+        "sessions": sessions,
+        "concurrency": args.concurrency,
+        "failed": len(errors),
+        "errors": errors[:5],
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_seconds": {
+            name: round(value, 3) if value is not None else None
+            for name, value in (("p50", percentile(latencies, 50)), ("p95", percentile(latencies, 95)),
+                                ("p99", percentile(latencies, 99)), ("max", max(latencies, default=None)))
+        },
+        "upstream_calls_per_session": {
+            "tavily": round(search_counts.get("requests", 0) / sessions, 2) if sessions else None,
+            "llm": round(llm_counts.get("requests", 0) / sessions, 2) if sessions else None
+        },
+        "upstream": {"tavily": search_counts, "llm": llm_counts},
+        "peak_rss_mb": round(resource.getrusage(who).ru_maxrss / 1024, 1)
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency_seconds"]
+    calls = report["upstream_calls_per_session"]
+    print(f"\n📊 Benchmark ({report['mode']}, {report['sessions']} sessions, concurrency {report['concurrency']})")
+    print("-" * 60)
+    print(f"Latency p50/p95/p99: {latency['p50']}s / {latency['p95']}s / {latency['p99']}s (max {latency['max']}s)")
+    print(f"Throughput:          {report['sessions_per_second']} sessions/sec over {report['elapsed_seconds']}s")
+    print(f"Upstream calls:      {calls['tavily']} Tavily, {calls['llm']} LLM per session")
+    print(f"Upstream faults:     Tavily {report['upstream']['tavily'].get('errors', 0)} errors / "
+          f"{report['upstream']['tavily'].get('rate_limited', 0)} 429s, "
+          f"LLM {report['upstream']['llm'].get('errors', 0)} errors / "
+          f"{report['upstream']['llm'].get('rate_limited', 0)} 429s")
+    print(f"Peak RSS:            {report['peak_rss_mb']} MB")
+    print(f"Failed sessions:     {report['failed']}")
+    for error in report["errors"]:
+        print(f"  ❌ {error}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline RAG benchmark against mock Tavily and LLM servers")
+    parser.add_argument("--mode", choices=sorted(MODES), default="research",
+                        help="Drive research_question in-process, the /ws endpoint, or the CLI (default: research)")
+    parser.add_argument("--sessions", "-n", type=int, default=20, help="Research sessions to run (default: 20)")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Sessions in flight at once (default: 4)")
+    parser.add_argument("--sockets", type=int, default=0,
+                        help="In ws mode, multiplex sessions over this many connections instead of one each")
+    parser.add_argument("--searches", type=int, default=3, help="Search queries per session (default: 3)")
+    parser.add_argument("--rewordings", type=int, default=2, help="Max refinement rounds per session (default: 2)")
+    parser.add_argument("--no-stream", dest="stream", action="store_false",
+                        help="Do not stream answers in research mode")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Median mock LLM latency in seconds")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="Lognormal spread of mock LLM latency")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Median mock Tavily latency in seconds")
+    parser.add_argument("--search-sigma", type=float, default=0.5, help="Lognormal spread of mock Tavily latency")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.005, help="Delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of upstream requests given a 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--sufficient-rate", type=float, default=0.8,
+                        help="Share of mock evaluations that accept the answer (default: 0.8)")
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="Leave caches, semantic reuse and the corpus enabled (in a temporary directory)")
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path")
+    parser.add_argument("--max-p95", type=float, help="Exit with status 1 if p95 latency exceeds this many seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    process, search_url, llm_url = start_mock_process(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+            os.environ.update(bench_environment(search_url, llm_url, workdir, args.keep_caches))
+            questions = [f"Benchmark question {i}: how does factor {i} influence outcome {i % 7}?"
+                         for i in range(args.sessions)]
+            outcomes, elapsed = asyncio.run(MODES[args.mode](args, questions, workdir))
+            report = build_report(args, outcomes, elapsed, mock_stats(search_url), mock_stats(llm_url))
+    finally:
+        process.terminate()
+        process.join()
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["failed"] or (args.max_p95 is not None and (report["latency_seconds"]["p95"] or 0) > args.max_p95):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
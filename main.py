@@ -1,40 +1,52 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import asyncio
 import json
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
 import uvicorn
 import os
 from dotenv import load_dotenv
 
 from src.rag_system import RAGSystem
+from src.models import BatchRequest
+from src.batch import BatchRunner
+from src.deadline import Deadline
+from src.connections import Connection, ConnectionManager
+from src.session_store import SessionStore
+from src.instrumentation import METRICS
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="RAG Research System", description="A demo RAG system with Tavily search")
-
-# Setup templates and static files
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One RAG engine per process: clients, connection pools and caches are
+    # shared by every request instead of being rebuilt for each query.
+    app.state.rag_system = RAGSystem.from_env()
+    yield
+    app.state.rag_system.close()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+app = FastAPI(title="RAG Research System", description="A demo RAG system with Tavily search", lifespan=lifespan)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# Setup templates and static files (relative to this file, so the app can be imported from any directory)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
+app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+manager = ConnectionManager(
+    max_sessions=int(os.getenv("WS_MAX_SESSIONS", "4")),
+    max_queue=int(os.getenv("WS_SEND_QUEUE", "256")),
+    send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "10"))
+)
 
-manager = ConnectionManager()
+# Server-side caps on one /research/batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
 
 @app.get("/", response_class=HTMLResponse)
 async def get_home(request: Request):
@@ -50,122 +62,214 @@ async def get_standard_ui(request: Request):
 async def get_chat_ui(request: Request):
     return templates.TemplateResponse("index2.html", {"request": request})
 
+async def run_query(connection: Connection, rag_system: RAGSystem, message: dict, request_id: str):
+    """Research one query message and send progress, answer deltas and the result, tagged with ``request_id``."""
+    query = message["content"]
+    settings = message.get("settings", {})
+    num_searches = settings.get("num_searches", 3)
+    num_rewordings = settings.get("num_rewordings", 3)
+    bypass_cache = bool(settings.get("bypass_cache", False))
+    speculative_candidates = int(settings.get("speculative_candidates", 0))
+    time_budget = settings.get("time_budget") or rag_system.session_time_budget
+    merged_analysis = settings.get("merged_analysis")
+    
+    # Per-request state is passed explicitly; the engine itself is shared
+    session_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    
+    # Progress callback
+    async def progress_callback(progress_update):
+        await connection.send({
+            "type": "progress", 
+            "content": {
+                "step": progress_update.step_number,
+                "total": progress_update.total_steps,
+                "status": progress_update.status,
+                "message": progress_update.message
+            }
+        }, request_id, droppable=True)
+    
+    # Stream answer tokens as they are generated
+    async def token_callback(delta, attempt):
+        await connection.send({
+            "type": "answer_delta",
+            "content": {"attempt": attempt, "delta": delta}
+        }, request_id)
+    
+    # Send initial status
+    await connection.send({"type": "progress", "content": {"message": f"Starting research for: {query}"}}, request_id)
+    
+    try:
+        # Process the query
+        result = await rag_system.research_question(
+            query, 
+            session_id, 
+            progress_callback,
+            num_searches=num_searches,
+            num_rewordings=num_rewordings,
+            bypass_cache=bypass_cache,
+            token_callback=token_callback,
+            speculative_candidates=speculative_candidates,
+            deadline=Deadline(float(time_budget) if time_budget else None),
+            merged_analysis=bool(merged_analysis) if merged_analysis is not None else None
+        )
+    
+        # Send final result
+        response_content = {
+            "answer": result.answer,
+            "session_id": result.session_id,
+            "total_steps": result.total_steps,
+            "partial": result.partial,
+            "research_steps": [
+                {
+                    "step_number": step.step_number,
+                    "query": step.query,
+                    "analysis": step.analysis
+                }
+                for step in result.research_steps
+            ]
+        }
+        if result.metrics:
+            response_content["metrics"] = result.metrics.model_dump(exclude={"spans"})
+    
+        # Add evaluation result if available
+        if result.evaluation_result:
+            response_content["evaluation_result"] = {
+                "action": result.evaluation_result.action.value,
+                "overall_score": result.evaluation_result.overall_score,
+                "reasoning": result.evaluation_result.reasoning,
+                "metrics": {
+                    "accuracy": result.evaluation_result.metrics.accuracy,
+                    "completeness": result.evaluation_result.metrics.completeness,
+                    "relevance": result.evaluation_result.metrics.relevance,
+                    "clarity": result.evaluation_result.metrics.clarity,
+                    "confidence": result.evaluation_result.metrics.confidence
+                }
+            }
+    
+        await connection.send({"type": "result", "content": response_content}, request_id)
+    
+    except Exception as e:
+        await connection.send({"type": "error", "content": f"Error processing query: {str(e)}"}, request_id)
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-    rag_system = None
+    """Research sessions over one socket.
+
+    ``{"type": "query", "id": ..., "content": ..., "settings": {...}}`` starts a session
+    (several may run at once) and ``{"type": "cancel", "id": ...}`` stops one. Every
+    message sent back carries the session's ``request_id``; queries without an id get one.
+    """
+    connection = await manager.connect(websocket)
+    rag_system: RAGSystem = websocket.app.state.rag_system
     
     try:
         while True:
-            # Receive query from client
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            message = json.loads(await websocket.receive_text())
+            request_id = str(message.get("id") or uuid.uuid4())
             
             if message["type"] == "query":
-                query = message["content"]
-                settings = message.get("settings", {})
-                num_searches = settings.get("num_searches", 3)
-                num_rewordings = settings.get("num_rewordings", 3)
-                
-                # Create new RAG system instance for this session
-                session_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                
-                # Initialize RAG system with environment variables
-                rag_system = RAGSystem(
-                    tavily_api_key=os.getenv("TAVILY_API_KEY"),
-                    llm_base_url=os.getenv("LLM_BASE_URL"),
-                    llm_api_key=os.getenv("LLM_API_KEY"),
-                    llm_model=os.getenv("LLM_MODEL", "gpt-3.5-turbo")
-                )
-                
-                # Progress callback
-                async def progress_callback(progress_update):
-                    await manager.send_personal_message(
-                        json.dumps({
-                            "type": "progress", 
-                            "content": {
-                                "step": progress_update.step_number,
-                                "total": progress_update.total_steps,
-                                "status": progress_update.status,
-                                "message": progress_update.message
-                            }
-                        }),
-                        websocket
-                    )
-                
-                # Send initial status
-                await manager.send_personal_message(
-                    json.dumps({"type": "progress", "content": {"message": f"Starting research for: {query}"}}),
-                    websocket
-                )
-                
-                try:
-                    # Process the query
-                    result = await rag_system.research_question(
-                        query, 
-                        session_id, 
-                        progress_callback,
-                        num_searches=num_searches,
-                        num_rewordings=num_rewordings
-                    )
-                    
-                    # Send final result
-                    response_content = {
-                        "answer": result.answer,
-                        "session_id": result.session_id,
-                        "total_steps": result.total_steps,
-                        "research_steps": [
-                            {
-                                "step_number": step.step_number,
-                                "query": step.query,
-                                "analysis": step.analysis
-                            }
-                            for step in result.research_steps
-                        ]
-                    }
-                    
-                    # Add evaluation result if available
-                    if result.evaluation_result:
-                        response_content["evaluation_result"] = {
-                            "action": result.evaluation_result.action.value,
-                            "overall_score": result.evaluation_result.overall_score,
-                            "reasoning": result.evaluation_result.reasoning,
-                            "metrics": {
-                                "accuracy": result.evaluation_result.metrics.accuracy,
-                                "completeness": result.evaluation_result.metrics.completeness,
-                                "relevance": result.evaluation_result.metrics.relevance,
-                                "clarity": result.evaluation_result.metrics.clarity,
-                                "confidence": result.evaluation_result.metrics.confidence
-                            }
-                        }
-                    
-                    await manager.send_personal_message(
-                        json.dumps({
-                            "type": "result", 
-                            "content": response_content
-                        }),
-                        websocket
-                    )
-                    
-                except Exception as e:
-                    await manager.send_personal_message(
-                        json.dumps({
-                            "type": "error", 
-                            "content": f"Error processing query: {str(e)}"
-                        }),
-                        websocket
-                    )
+                refused = connection.start(request_id, run_query(connection, rag_system, message, request_id))
+                if refused:
+                    await connection.send({"type": "error", "content": refused}, request_id)
+            elif message["type"] == "cancel":
+                # Stops the pipeline and, through its deadline, any in-flight upstream calls
+                if connection.cancel(request_id):
+                    await connection.send({"type": "cancelled", "content": "Research cancelled"}, request_id)
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
-        if websocket in manager.active_connections:
-            manager.disconnect(websocket)
+    finally:
+        await manager.disconnect(connection)
+
+@app.post("/research/batch")
+async def research_batch(batch: BatchRequest, request: Request):
+    """Research many questions at once; results stream back as JSON lines as each finishes."""
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} questions per batch (BATCH_MAX_ITEMS)")
+    runner = BatchRunner(request.app.state.rag_system, max_workers=max(min(batch.max_workers, BATCH_MAX_WORKERS), 1))
+    
+    async def stream_results():
+        async for record in runner.run(batch.items):
+            yield json.dumps(record) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def session_store(request: Request) -> SessionStore:
+    store = request.app.state.rag_system.session_store
+    if store is None:
+        raise HTTPException(status_code=503, detail="Session store is disabled (SESSION_STORE_ENABLED)")
+    return store
+
+@app.get("/sessions")
+async def list_sessions(request: Request, limit: int = 50, cursor: Optional[str] = None, status: Optional[str] = None,
+                        question: Optional[str] = None, q: Optional[str] = None, min_score: Optional[float] = None, max_score: Optional[float] = None,
+                        since: Optional[float] = None, until: Optional[float] = None):
+    """Past sessions, newest first, one page at a time.
+
+    Filters: ``status``, ``question`` (same normalized question), ``q`` (substring of the
+    question), ``min_score``/``max_score`` and ``since``/``until`` (Unix times). Pass the
+    returned ``next_cursor`` as ``cursor`` for the next page.
+    """
+    store = session_store(request)
+    try:
+        sessions, next_cursor = await asyncio.to_thread(
+            store.list_sessions, min(max(limit, 1), 500), cursor, status, question, q,
+            min_score, max_score, since, until
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+@app.get("/sessions/export")
+async def export_sessions(request: Request, status: Optional[str] = None, question: Optional[str] = None, q: Optional[str] = None,
+                          min_score: Optional[float] = None, max_score: Optional[float] = None, since: Optional[float] = None,
+                          until: Optional[float] = None, results: bool = False):
+    """Every matching session as JSON lines, newest first, streamed page by page (with ``results``, full results)."""
+    store = session_store(request)
+    
+    async def stream_sessions():
+        cursor = None
+        while True:
+            sessions, cursor = await asyncio.to_thread(
+                store.list_sessions, 200, cursor, status, question, q, min_score, max_score, since, until
+            )
+            for session in sessions:
+                if results:
+                    session = await asyncio.to_thread(store.get_session, session["session_id"]) or session
+                yield json.dumps(session) + "\n"
+            if cursor is None:
+                break
+    
+    return StreamingResponse(stream_sessions(), media_type="application/x-ndjson")
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, request: Request):
+    """One session's summary and full result."""
+    session = await asyncio.to_thread(session_store(request).get_session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return session
+
+@app.get("/sessions/{session_id}/events")
+async def get_session_events(session_id: str, request: Request, after: int = 0, limit: int = 500):
+    """A page of a session's log events; pass the last event's ``id`` as ``after`` for the next page."""
+    rag_system: RAGSystem = request.app.state.rag_system
+    events = await asyncio.to_thread(rag_system.get_session_logs, session_id, after, min(max(limit, 1), 5000))
+    if events is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"events": events, "next_after": events[-1]["id"] if events else after}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage, upstream-call and session latency histograms plus token and cache counters (Prometheus text format)."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "websocket": manager.stats()}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
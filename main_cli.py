@@ -6,6 +6,7 @@ A simple command-line interface for the RAG system that provides research-backed
 import asyncio
 import os
 import sys
+import json
 import argparse
 from datetime import datetime
 from typing import Optional
@@ -13,6 +14,8 @@ from dotenv import load_dotenv
 
 from src.rag_system import RAGSystem
 from src.models import ProgressUpdate
+from src.batch import BatchRunner, load_batch_file
+from src.deadline import Deadline
 
 
 class CLIProgressHandler:
@@ -49,6 +52,8 @@ def print_result(result, verbose: bool = False):
     
     print(f"\n🎯 ANSWER:")
     print("-" * 40)
+    if result.partial:
+        print("⏱️  Time budget reached - this is the best answer available so far.\n")
     print(result.answer)
     
     if verbose and result.research_steps:
@@ -72,15 +77,10 @@ def print_result(result, verbose: bool = False):
 
 
 def save_result_to_file(result, question: str, output_dir: str = "output") -> str:
-    """Save the research result to a timestamped text file."""
+    """Save the research result to a text file named after its session."""
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    # Generate timestamped filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"rag_result_{timestamp}.txt"
-    filepath = os.path.join(output_dir, filename)
-    
     # Prepare content to save
     content_lines = []
     content_lines.append("=" * 80)
@@ -133,39 +133,100 @@ def save_result_to_file(result, question: str, output_dir: str = "output") -> st
     content_lines.append("End of Results")
     content_lines.append("=" * 80)
     
-    # Write to file
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(content_lines))
-    
-    return filepath
+    # Write to a file named after the session (microsecond timestamp); exclusive creation never
+    # overwrites another run's file
+    suffix = 1
+    while True:
+        name = f"rag_result_{result.session_id}.txt" if suffix == 1 else f"rag_result_{result.session_id}_{suffix}.txt"
+        filepath = os.path.join(output_dir, name)
+        try:
+            with open(filepath, 'x', encoding='utf-8') as f:
+                f.write('\n'.join(content_lines))
+            return filepath
+        except FileExistsError:
+            suffix += 1
 
 
-async def run_research(question: str, 
-                      num_searches: int = 3, 
-                      num_rewordings: int = 3, 
-                      verbose: bool = False,
-                      output_dir: str = "output"):
-    """Run the research process with the given parameters."""
-    
-    # Load environment variables
+def check_environment() -> bool:
+    """Load .env and verify the required environment variables are set."""
     load_dotenv()
     
-    # Check for required environment variables
     required_vars = ["TAVILY_API_KEY", "LLM_BASE_URL", "LLM_API_KEY"]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
         print(f"❌ Error: Missing required environment variables: {', '.join(missing_vars)}")
         print("Please set these in your .env file or environment.")
+        return False
+    return True
+
+
+async def run_batch(batch_file: str,
+                    workers: int = 4,
+                    output_dir: str = "output",
+                    batch_output: Optional[str] = None,
+                    **options):
+    """Research every question in a JSONL file, writing one JSON result line per question as it finishes.
+
+    ``options`` (num_searches, bypass_cache, time_budget, ...) apply to every line that does not set its own.
+    """
+    if not check_environment():
+        return 1
+    
+    try:
+        items = load_batch_file(batch_file, options)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error reading batch file: {str(e)}")
+        return 1
+    
+    if not batch_output:
+        os.makedirs(output_dir, exist_ok=True)
+        batch_output = os.path.join(output_dir, f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl")
+    
+    rag_system = RAGSystem.from_env()
+    runner = BatchRunner(rag_system, max_workers=workers)
+    
+    # Keep stdout clean for the JSONL stream when writing results there
+    info = sys.stderr if batch_output == "-" else sys.stdout
+    print(f"\n🚀 Starting batch of {len(items)} questions with {workers} workers", file=info)
+    print(f"💾 Streaming results to: {batch_output}", file=info)
+    print("-" * 60, file=info)
+    
+    failures = 0
+    out = sys.stdout if batch_output == "-" else open(batch_output, 'w', encoding='utf-8')
+    try:
+        async for record in runner.run(items):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if record["status"] != "ok":
+                failures += 1
+            print(f"{'✅' if record['status'] == 'ok' else '❌'} [{record['id']}] {record['question'][:60]}", file=info)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    print("-" * 60, file=info)
+    print(f"📊 Completed {len(items) - failures}/{len(items)} questions "
+          f"({rag_system.search_client.coalesced_searches} duplicate searches shared)", file=info)
+    return 0 if failures == 0 else 1
+
+
+async def run_research(question: str, 
+                      num_searches: int = 3, 
+                      num_rewordings: int = 3, 
+                      verbose: bool = False,
+                      output_dir: str = "output",
+                      bypass_cache: bool = False,
+                      speculative_candidates: int = 0,
+                      time_budget: Optional[float] = None,
+                      merged_analysis: Optional[bool] = None):
+    """Run the research process with the given parameters."""
+    
+    if not check_environment():
         return 1
     
     # Initialize RAG system
-    rag_system = RAGSystem(
-        tavily_api_key=os.getenv("TAVILY_API_KEY"),
-        llm_base_url=os.getenv("LLM_BASE_URL"),
-        llm_api_key=os.getenv("LLM_API_KEY"),
-        llm_model=os.getenv("LLM_MODEL", "gpt-3.5-turbo")
-    )
+    rag_system = RAGSystem.from_env()
     
     # Setup progress handler
     progress_handler = CLIProgressHandler(verbose)
@@ -185,7 +246,11 @@ async def run_research(question: str,
             session_id=session_id,
             progress_callback=progress_handler.handle_progress,
             num_searches=num_searches,
-            num_rewordings=num_rewordings
+            num_rewordings=num_rewordings,
+            bypass_cache=bypass_cache,
+            speculative_candidates=speculative_candidates,
+            deadline=Deadline(time_budget) if time_budget else None,
+            merged_analysis=merged_analysis
         )
         
         # Print results to console
@@ -216,11 +281,13 @@ Examples:
   python main_cli.py "How does machine learning work?" --searches 5 --verbose
   python main_cli.py "Latest AI developments" --searches 4 --rewordings 2
   python main_cli.py "AI ethics" --output-dir ./my_results --verbose
+  python main_cli.py --batch questions.jsonl --workers 8
         """
     )
     
     parser.add_argument(
         "question",
+        nargs="?",
         help="The research question to investigate"
     )
     
@@ -251,6 +318,52 @@ Examples:
         help="Directory to save result files (default: output)"
     )
     
+    parser.add_argument(
+        "--candidates", "-c",
+        type=int,
+        default=0,
+        help="Generate this many candidate answers in parallel per refinement round (default: off)"
+    )
+    
+    parser.add_argument(
+        "--time-budget", "-t",
+        type=float,
+        default=None,
+        help="Stop after this many seconds and return the best answer so far (default: SESSION_TIME_BUDGET or none)"
+    )
+    
+    parser.add_argument(
+        "--merged-analysis", "-m",
+        action="store_true",
+        default=None,
+        help="Analyze all search queries' results in a single LLM call (default: MERGED_ANALYSIS or off)"
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the search cache and always query Tavily"
+    )
+    
+    parser.add_argument(
+        "--batch", "-b",
+        type=str,
+        help="JSONL file of questions to research in one run"
+    )
+    
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=4,
+        help="Questions researched concurrently in batch mode (default: 4)"
+    )
+    
+    parser.add_argument(
+        "--batch-output",
+        type=str,
+        help="JSONL file for batch results, or - for stdout (default: timestamped file in --output-dir)"
+    )
+    
     parser.add_argument(
         "--version",
         action="version",
@@ -260,6 +373,25 @@ Examples:
     # Parse arguments
     args = parser.parse_args()
     
+    if not args.question and not args.batch:
+        parser.error("a question or --batch FILE is required")
+    
+    if args.batch:
+        if args.batch_output != "-":
+            print_banner()
+        sys.exit(asyncio.run(run_batch(
+            batch_file=args.batch,
+            workers=args.workers,
+            output_dir=args.output_dir,
+            batch_output=args.batch_output,
+            num_searches=args.searches,
+            num_rewordings=args.rewordings,
+            bypass_cache=args.no_cache,
+            speculative_candidates=args.candidates,
+            time_budget=args.time_budget,
+            merged_analysis=args.merged_analysis
+        )))
+    
     # Print banner
     print_banner()
     
@@ -269,7 +401,11 @@ Examples:
         num_searches=args.searches,
         num_rewordings=args.rewordings,
         verbose=args.verbose,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        bypass_cache=args.no_cache,
+        speculative_candidates=args.candidates,
+        time_budget=args.time_budget,
+        merged_analysis=args.merged_analysis
     ))
     
     sys.exit(exit_code)
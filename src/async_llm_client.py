@@ -0,0 +1,123 @@
+"""
+Async wrapper around LLMClient.
+Calls run in worker threads over the shared keep-alive pool, so the event loop never blocks.
+"""
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import Executor
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from .llm_client import LLMClient
+from .models import EvaluationResult, SearchQuery
+
+
+async def run_blocking(executor: Optional[Executor], fn: Callable, *args, **kwargs):
+    """Like ``asyncio.to_thread`` but on ``executor`` (the loop's default when None); context variables
+    such as the session deadline and trace still reach the worker thread."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class AsyncLLMClient:
+    """Async variant of LLMClient backed by the shared HTTP connection pool."""
+
+    def __init__(self, client: LLMClient, max_in_flight: Optional[int] = None,
+                 executor: Optional[Executor] = None):
+        self.client = client
+        self.executor = executor
+        # Never queue more worker threads than the pool has connections for this host
+        self.max_in_flight = max_in_flight or client.http_pool.max_connections_per_host
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def create(cls, base_url: str, api_key: str, model: str, **kwargs) -> "AsyncLLMClient":
+        """Build an async client (and its underlying LLMClient) in one step."""
+        return cls(LLMClient(base_url, api_key, model, **kwargs))
+
+    async def _run(self, method_name: str, *args, **kwargs):
+        """Run an LLMClient method in a worker thread, bounded by the pool size."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        method = getattr(self.client, method_name)
+        async with self._semaphore:
+            return await run_blocking(self.executor, method, *args, **kwargs)
+
+    async def _run_streaming(self, method_name: str, *args,
+                             token_callback: Optional[Callable[[str], Awaitable[None]]] = None, **kwargs):
+        """Run a streaming-capable method, forwarding deltas from the worker thread to token_callback."""
+        if token_callback is None:
+            return await self._run(method_name, *args, **kwargs)
+        
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        
+        def on_token(delta: str):
+            loop.call_soon_threadsafe(queue.put_nowait, delta)
+        
+        task = asyncio.create_task(self._run(method_name, *args, on_token=on_token, **kwargs))
+        task.add_done_callback(lambda _: queue.put_nowait(finished))
+        try:
+            done = False
+            while not done:
+                item = await queue.get()
+                if item is finished:
+                    break
+                # Coalesce whatever else has already arrived into one callback
+                parts = [item]
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item is finished:
+                        done = True
+                        break
+                    parts.append(item)
+                await token_callback("".join(parts))
+            return await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def call_llm(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                       max_tokens: int = 1000, tools: Optional[List[Dict]] = None,
+                       cache_as: Optional[str] = None) -> str:
+        return await self._run("call_llm", messages, temperature=temperature, max_tokens=max_tokens,
+                               tools=tools, cache_as=cache_as)
+
+    async def generate_search_queries(self, question: str, num_queries: int = 3) -> List[str]:
+        return await self._run("generate_search_queries", question, num_queries)
+
+    async def plan_search_queries(self, question: str, num_queries: int = 3) -> List[SearchQuery]:
+        return await self._run("plan_search_queries", question, num_queries)
+
+    async def analyze_search_results(self, query: str, search_results: List[Dict[str, Any]]) -> str:
+        return await self._run("analyze_search_results", query, search_results)
+
+    async def analyze_all_search_results(self, queries_with_results: List[Tuple[str, List[Dict[str, Any]]]]) -> List[str]:
+        return await self._run("analyze_all_search_results", queries_with_results)
+
+    async def synthesize_final_answer(self, question: str, research_data: List[Dict[str, Any]],
+                                      token_callback: Optional[Callable[[str], Awaitable[None]]] = None,
+                                      temperature: float = 0.6) -> str:
+        return await self._run_streaming("synthesize_final_answer", question, research_data,
+                                         token_callback=token_callback, temperature=temperature)
+
+    async def evaluate_answer(self, question: str, answer: str, research_context: str) -> EvaluationResult:
+        return await self._run("evaluate_answer", question, answer, research_context)
+
+    async def evaluate_answer_incremental(self, question: str, answer_changes: str, context_summary: str,
+                                          new_research: str, previous: EvaluationResult) -> EvaluationResult:
+        return await self._run("evaluate_answer_incremental", question, answer_changes, context_summary,
+                               new_research, previous)
+
+    async def regenerate_answer_with_guidance(self, question: str, research_data: List[Dict[str, Any]],
+                                              guidance: str,
+                                              token_callback: Optional[Callable[[str], Awaitable[None]]] = None,
+                                              temperature: float = 0.6) -> str:
+        return await self._run_streaming("regenerate_answer_with_guidance", question, research_data, guidance,
+                                         token_callback=token_callback, temperature=temperature)
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Connection pool statistics for the shared HTTP pool."""
+        return self.client.http_pool.stats()
@@ -0,0 +1,105 @@
+"""
+Batch research: run many questions through one shared RAG engine.
+Results are yielded as each question finishes, ready to stream as JSONL.
+"""
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+from .models import BatchItem
+from .rag_system import RAGSystem
+from .deadline import Deadline
+
+# Per-question research options a batch line may set
+BATCH_OPTIONS = ("num_searches", "num_rewordings", "bypass_cache", "speculative_candidates", "time_budget",
+                 "merged_analysis")
+
+
+def load_batch_file(path: str, defaults: Optional[Dict[str, Any]] = None) -> List[BatchItem]:
+    """Read questions from a JSONL file.
+
+    Each line is either a JSON string or an object with ``question`` (or ``content``),
+    optional ``id``/``request_id`` and any of ``BATCH_OPTIONS``; options a line does
+    not set come from ``defaults``.
+    """
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            data = json.loads(line)
+            if isinstance(data, str):
+                data = {"question": data}
+            question = data.get("question") or data.get("content")
+            if not question:
+                raise ValueError(f"{path}:{line_number}: missing 'question'")
+            options = {**(defaults or {}), **{key: data[key] for key in BATCH_OPTIONS if key in data}}
+            items.append(BatchItem(
+                id=str(data.get("id") or data.get("request_id") or line_number),
+                question=question,
+                **options
+            ))
+    return items
+
+
+class BatchRunner:
+    """Runs batch items concurrently with a bounded worker pool."""
+
+    def __init__(self, rag_system: RAGSystem, max_workers: int = 4):
+        self.rag_system = rag_system
+        # Semaphore(0) would never let an item start
+        self.max_workers = max(max_workers, 1)
+        self.logger = logging.getLogger(__name__)
+
+    async def run(self, items: List[BatchItem]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result record per item, in completion order."""
+        semaphore = asyncio.Semaphore(self.max_workers)
+        # Items without an id are numbered by position so every record can be matched up
+        items = [item if item.id else item.model_copy(update={"id": str(i)})
+                 for i, item in enumerate(items, 1)]
+
+        async def run_one(item: BatchItem) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._research(item)
+
+        tasks = [asyncio.create_task(run_one(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _research(self, item: BatchItem) -> Dict[str, Any]:
+        session_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{item.id}"
+        self.logger.info(f"Batch item {item.id}: starting session {session_id}")
+        try:
+            result = await self.rag_system.research_question(
+                item.question,
+                session_id,
+                num_searches=item.num_searches,
+                num_rewordings=item.num_rewordings,
+                bypass_cache=item.bypass_cache,
+                speculative_candidates=item.speculative_candidates,
+                deadline=Deadline(item.time_budget) if item.time_budget else None,
+                merged_analysis=item.merged_analysis
+            )
+            return {
+                "id": item.id,
+                "status": "ok",
+                "question": item.question,
+                "result": result.model_dump(mode="json")
+            }
+        except Exception as e:
+            self.logger.error(f"Batch item {item.id} failed: {e}")
+            return {
+                "id": item.id,
+                "status": "error",
+                "question": item.question,
+                "session_id": session_id,
+                "error": str(e)
+            }
@@ -0,0 +1,211 @@
+"""
+Pluggable key/value caches with TTL and size-capped eviction.
+Values are JSON strings; callers own serialization.
+"""
+import os
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip(" ?.!\"'")
+
+
+def make_cache_key(namespace: str, *parts: Any) -> str:
+    """Build a stable hashed key from a namespace and JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class Cache:
+    """Base cache interface with hit/miss counters."""
+
+    def __init__(self, default_ttl: Optional[float] = None):
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = ttl if ttl is not None else self.default_ttl
+        return time.time() + ttl if ttl else None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class MemoryCache(Cache):
+    """Thread-safe in-memory LRU cache."""
+
+    def __init__(self, max_entries: int = 1000, default_ttl: Optional[float] = None):
+        super().__init__(default_ttl)
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.time()):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, self._expiry(ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "entries": len(self._data), "max_entries": self.max_entries}
+
+
+class SQLiteCache(Cache):
+    """Disk-backed cache that survives restarts; evicts least recently used rows."""
+
+    def __init__(self, path: str, max_entries: int = 50000, default_ttl: Optional[float] = None):
+        super().__init__(default_ttl)
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, self._expiry(ttl), time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {**super().stats(), "entries": count, "max_entries": self.max_entries, "path": self.path}
+
+
+class TieredCache(Cache):
+    """Memory cache in front of a disk cache; disk hits are promoted to memory."""
+
+    def __init__(self, memory: MemoryCache, disk: Optional[Cache] = None):
+        super().__init__(memory.default_ttl)
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {**super().stats(), "memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+def build_cache(max_entries: int, ttl: Optional[float], disk_path: Optional[str] = None) -> TieredCache:
+    """Create a memory cache, optionally backed by a SQLite file at disk_path."""
+    memory = MemoryCache(max_entries=max_entries, default_ttl=ttl)
+    disk = SQLiteCache(disk_path, default_ttl=ttl) if disk_path else None
+    return TieredCache(memory, disk)
+
+
+def cache_from_env(prefix: str, default_path: Optional[str], default_ttl: float = 3600,
+                   default_enabled: bool = True) -> Optional[TieredCache]:
+    """Build a cache from {prefix}_ENABLED/_TTL/_MAX_ENTRIES/_PATH environment variables."""
+    enabled = os.getenv(f"{prefix}_ENABLED", "true" if default_enabled else "false").lower()
+    if enabled not in ("1", "true", "yes", "on"):
+        return None
+    return build_cache(
+        max_entries=int(os.getenv(f"{prefix}_MAX_ENTRIES", "1000")),
+        ttl=float(os.getenv(f"{prefix}_TTL", str(default_ttl))),
+        disk_path=os.getenv(f"{prefix}_PATH", default_path or "") or None
+    )
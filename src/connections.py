@@ -0,0 +1,148 @@
+"""
+WebSocket connection registry.
+Each connection can run several research sessions at once, addressed by the
+request id the client tags its messages with, and sends through a bounded
+outbound queue so one slow client cannot buffer without limit.
+"""
+import json
+import uuid
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Coroutine
+
+from fastapi import WebSocket
+
+
+class Connection:
+    """One WebSocket client: its running research tasks and a bounded outbound queue.
+
+    Messages are written by a single background writer. ``send`` waits while the
+    queue is full, which slows the research feeding it; a client that stays
+    unread for ``send_timeout`` seconds is disconnected. Droppable messages
+    (progress updates) are discarded instead of waiting.
+    """
+
+    def __init__(self, websocket: WebSocket, max_sessions: int = 4, max_queue: int = 256,
+                 send_timeout: float = 10.0):
+        self.id = str(uuid.uuid4())
+        self.websocket = websocket
+        self.max_sessions = max_sessions
+        self.send_timeout = send_timeout
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.dropped_messages = 0
+        self.closed = False
+        self.logger = logging.getLogger(__name__)
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._writer = asyncio.create_task(self._write())
+        self._closing: Optional[asyncio.Task] = None
+
+    async def _write(self):
+        try:
+            while True:
+                await self.websocket.send_text(await self._outbox.get())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The client is gone; the receive loop will notice and clean up
+            self.logger.info(f"Connection {self.id} stopped accepting messages: {e}")
+            self._abort()
+
+    async def send(self, message: Dict[str, Any], request_id: Optional[str] = None, droppable: bool = False):
+        """Queue ``message`` (tagged with ``request_id``) for the client.
+
+        Messages to a closed connection are discarded; raises ``ConnectionError`` if the
+        client is disconnected for not reading.
+        """
+        if self.closed:
+            return
+        if request_id is not None:
+            message = {**message, "request_id": request_id}
+        data = json.dumps(message)
+        if droppable:
+            try:
+                self._outbox.put_nowait(data)
+            except asyncio.QueueFull:
+                self.dropped_messages += 1
+            return
+        try:
+            await asyncio.wait_for(self._outbox.put(data), timeout=self.send_timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Connection {self.id} is not reading its messages; disconnecting")
+            # Closing may itself wait on the client, so it must not run in a task that is about to be cancelled
+            self._closing = asyncio.create_task(self._close_socket(1008, "Client is not reading messages"))
+            self._abort()
+            raise ConnectionError("Client is not reading messages")
+
+    def start(self, request_id: str, coroutine: Coroutine) -> Optional[str]:
+        """Run ``coroutine`` as research session ``request_id``. Returns an error message if refused."""
+        if request_id in self.tasks:
+            coroutine.close()
+            return f"Request {request_id} is already running"
+        if len(self.tasks) >= self.max_sessions:
+            coroutine.close()
+            return f"Too many concurrent research sessions on this connection (limit {self.max_sessions})"
+        task = asyncio.create_task(coroutine)
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda done: self._forget(request_id, done))
+        return None
+
+    def _forget(self, request_id: str, task: asyncio.Task):
+        if self.tasks.get(request_id) is task:
+            del self.tasks[request_id]
+
+    def cancel(self, request_id: str) -> bool:
+        """Cancel a running session; its pipeline stops at the next deadline check."""
+        task = self.tasks.get(request_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def _abort(self):
+        """Stop everything without waiting (safe to call from one of the connection's own tasks)."""
+        if self.closed:
+            return
+        self.closed = True
+        for task in list(self.tasks.values()):
+            task.cancel()
+        if asyncio.current_task() is not self._writer:
+            self._writer.cancel()
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def close(self):
+        """Cancel every session on this connection and wait for them to finish."""
+        self._abort()
+        pending = list(self.tasks.values()) + [self._writer]
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+class ConnectionManager:
+    """Registry of open WebSocket connections keyed by connection id."""
+
+    def __init__(self, max_sessions: int = 4, max_queue: int = 256, send_timeout: float = 10.0):
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.connections: Dict[str, Connection] = {}
+
+    async def connect(self, websocket: WebSocket) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, self.max_sessions, self.max_queue, self.send_timeout)
+        self.connections[connection.id] = connection
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        self.connections.pop(connection.id, None)
+        await connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": len(self.connections),
+            "sessions": sum(len(connection.tasks) for connection in self.connections.values()),
+            "dropped_messages": sum(connection.dropped_messages for connection in self.connections.values())
+        }
@@ -0,0 +1,305 @@
+"""
+Persistent local corpus of fetched web content.
+Every search result is stored once per normalized URL in SQLite, chunked into
+passages and indexed in an on-disk inverted index, so later sessions can answer
+queries from the corpus and only call Tavily for gaps.
+"""
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .models import SearchResult
+from .prompt_packing import split_passages, terms
+
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref")
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL so trivially different links to one page compare equal."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and not (parts.scheme, parts.port) in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    ))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower() or "https", host, path, query, ""))
+
+
+def content_hash(text: str) -> str:
+    """Hash of whitespace-normalized text, used to skip re-indexing unchanged pages."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class CorpusStore:
+    """SQLite document store with a BM25-scored inverted index over passages.
+
+    The passage count and total length BM25 needs are kept in a one-row stats
+    table updated on every change, and at most ``max_postings`` postings (highest
+    term frequency first) are read per query term. Terms in fewer than
+    ``rare_share`` of passages count as rare when judging coverage.
+    """
+
+    def __init__(self, path: str, passage_tokens: int = 120, k1: float = 1.5, b: float = 0.75,
+                 max_postings: int = 2000, rare_share: float = 0.01):
+        self.path = path
+        self.passage_tokens = passage_tokens
+        self.max_postings = max_postings
+        self.rare_share = rare_share
+        self.k1 = k1
+        self.b = b
+        self.local_hits = 0
+        self.gaps = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, original_url TEXT NOT NULL,"
+            " title TEXT NOT NULL, content TEXT NOT NULL, raw_content TEXT,"
+            " content_hash TEXT NOT NULL, fetched_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash);"
+            "CREATE TABLE IF NOT EXISTS passages ("
+            " id INTEGER PRIMARY KEY, doc_id INTEGER NOT NULL, position INTEGER NOT NULL,"
+            " text TEXT NOT NULL, length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_passages_doc ON passages(doc_id);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, passage_id INTEGER NOT NULL, tf INTEGER NOT NULL);"
+            "DROP INDEX IF EXISTS idx_postings_term;"
+            "CREATE INDEX IF NOT EXISTS idx_postings_term_tf ON postings(term, tf DESC);"
+            "CREATE INDEX IF NOT EXISTS idx_postings_passage ON postings(passage_id);"
+            "CREATE TABLE IF NOT EXISTS corpus_stats ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1), passages INTEGER NOT NULL, total_length INTEGER NOT NULL);"
+        )
+        # Seeded from the passages once; kept current by _index_passages and _delete_passages
+        self._conn.execute(
+            "INSERT OR IGNORE INTO corpus_stats (id, passages, total_length)"
+            " SELECT 1, COUNT(*), COALESCE(SUM(length), 0) FROM passages"
+        )
+        self._conn.commit()
+
+    def ingest(self, results: List[SearchResult]) -> int:
+        """Store results, skipping pages already stored with identical content. Returns pages (re)indexed."""
+        indexed = 0
+        now = time.time()
+        with self._lock:
+            for result in results:
+                text = result.raw_content or result.content
+                if not text:
+                    continue
+                url = normalize_url(result.url)
+                digest = content_hash(text)
+                row = self._conn.execute("SELECT id, content_hash FROM documents WHERE url = ?", (url,)).fetchone()
+                if row is not None and row[1] == digest:
+                    self._conn.execute("UPDATE documents SET fetched_at = ? WHERE id = ?", (now, row[0]))
+                    continue
+                # Identical content under another URL (mirrors, syndication) is indexed only once
+                mirror = self._conn.execute(
+                    "SELECT 1 FROM documents WHERE content_hash = ? AND url != ?", (digest, url)
+                ).fetchone()
+                if row is not None:
+                    self._delete_passages(row[0])
+                    self._conn.execute(
+                        "UPDATE documents SET original_url = ?, title = ?, content = ?, raw_content = ?,"
+                        " content_hash = ?, fetched_at = ? WHERE id = ?",
+                        (result.url, result.title, result.content, result.raw_content, digest, now, row[0])
+                    )
+                    doc_id = row[0]
+                else:
+                    doc_id = self._conn.execute(
+                        "INSERT INTO documents (url, original_url, title, content, raw_content, content_hash, fetched_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (url, result.url, result.title, result.content, result.raw_content, digest, now)
+                    ).lastrowid
+                if mirror is None:
+                    self._index_passages(doc_id, text)
+                    indexed += 1
+            self._conn.commit()
+        return indexed
+
+    def _delete_passages(self, doc_id: int):
+        count, length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM passages WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        self._update_stats(-count, -length)
+        self._conn.execute(
+            "DELETE FROM postings WHERE passage_id IN (SELECT id FROM passages WHERE doc_id = ?)", (doc_id,)
+        )
+        self._conn.execute("DELETE FROM passages WHERE doc_id = ?", (doc_id,))
+
+    def _index_passages(self, doc_id: int, text: str):
+        count = length = 0
+        for position, passage in enumerate(split_passages(text, self.passage_tokens)):
+            tokens = terms(passage)
+            count += 1
+            length += len(tokens)
+            passage_id = self._conn.execute(
+                "INSERT INTO passages (doc_id, position, text, length) VALUES (?, ?, ?, ?)",
+                (doc_id, position, passage, len(tokens))
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO postings (term, passage_id, tf) VALUES (?, ?, ?)",
+                [(term, passage_id, tf) for term, tf in Counter(tokens).items()]
+            )
+        self._update_stats(count, length)
+
+    def _update_stats(self, passages: int, length: int):
+        if passages:
+            self._conn.execute(
+                "UPDATE corpus_stats SET passages = passages + ?, total_length = total_length + ? WHERE id = 1",
+                (passages, length)
+            )
+
+    def search(self, query: str, k: int = 10, max_age: Optional[float] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Top ``k`` passages for ``query`` by BM25, each with its document's fields."""
+        query_terms = sorted(set(terms(query)))
+        if not query_terms:
+            return []
+        oldest = time.time() - max_age if max_age else 0.0
+        with self._lock:
+            n, total_length = self._conn.execute(
+                "SELECT passages, total_length FROM corpus_stats WHERE id = 1"
+            ).fetchone()
+            if not n:
+                return []
+            rows = []
+            for term in query_terms:
+                rows.extend(self._conn.execute(
+                    "SELECT postings.term, postings.passage_id, postings.tf, passages.length FROM postings"
+                    " JOIN passages ON passages.id = postings.passage_id"
+                    " JOIN documents ON documents.id = passages.doc_id"
+                    " WHERE postings.term = ? AND documents.fetched_at >= ? ORDER BY postings.tf DESC LIMIT ?",
+                    (term, oldest, self.max_postings)
+                ).fetchall())
+            document_frequency = self._document_frequency(query_terms)
+
+        # Scoring needs no database access, so other threads may use the connection meanwhile
+        avg_length = total_length / n
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, set] = defaultdict(set)
+        for term, passage_id, tf, length in rows:
+            idf = self._idf(n, document_frequency[term])
+            norm = self.k1 * (1 - self.b + self.b * length / (avg_length or 1.0))
+            scores[passage_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            matched[passage_id].add(term)
+
+        top = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        hits = []
+        with self._lock:
+            for passage_id, score in top:
+                row = self._conn.execute(
+                    "SELECT passages.text, documents.original_url, documents.title, documents.raw_content"
+                    " FROM passages JOIN documents ON documents.id = passages.doc_id WHERE passages.id = ?",
+                    (passage_id,)
+                ).fetchone()
+                if row is None:
+                    # Re-indexed by another thread since it was scored
+                    continue
+                text, url, title, raw_content = row
+                hits.append(({"text": text, "url": url, "title": title, "raw_content": raw_content,
+                              "terms": matched[passage_id]}, score))
+        return hits
+
+    def _document_frequency(self, query_terms: List[str]) -> Dict[str, int]:
+        """Passages containing each term; call with the lock held."""
+        placeholders = ",".join("?" * len(query_terms))
+        return dict(self._conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", query_terms
+        ).fetchall())
+
+    @staticmethod
+    def _idf(n: int, df: int) -> float:
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def coverage(self, query_terms: set, covered: set) -> float:
+        """IDF-weighted share of ``query_terms`` in ``covered``; 0 if a number or rare term is missing.
+
+        A query's distinguishing term ("12" in "python 3.12") is usually its rarest,
+        so it must be present however many common terms match.
+        """
+        ordered = sorted(query_terms)
+        with self._lock:
+            n = self._conn.execute("SELECT passages FROM corpus_stats WHERE id = 1").fetchone()[0]
+            document_frequency = self._document_frequency(ordered)
+        if not n:
+            return 0.0
+        weights = {}
+        for term in ordered:
+            df = document_frequency.get(term, 0)
+            if term not in covered and (any(c.isdigit() for c in term) or df < self.rare_share * n):
+                return 0.0
+            weights[term] = self._idf(n, df)
+        total = sum(weights.values())
+        return sum(weights[term] for term in covered & query_terms) / total if total else 0.0
+
+    def lookup(self, query: str, max_results: int = 3, min_coverage: float = 0.75,
+               max_age: Optional[float] = None) -> Optional[List[SearchResult]]:
+        """Serve a search from the corpus, or return None if it does not cover the query well enough.
+
+        Coverage is the IDF-weighted share of query terms found in the best passages
+        (see ``coverage``), and the corpus must supply ``max_results`` distinct pages.
+        """
+        query_terms = set(terms(query))
+        hits = self.search(query, k=max_results * 4, max_age=max_age)
+        sources: Dict[str, Dict[str, Any]] = {}
+        covered = set()
+        for hit, score in hits:
+            source = sources.get(hit["url"])
+            if source is None:
+                if len(sources) >= max_results:
+                    continue
+                source = sources[hit["url"]] = {**hit, "passages": [], "score": score}
+            source["passages"].append(hit["text"])
+            covered |= hit["terms"]
+
+        if not query_terms or len(sources) < max_results or self.coverage(query_terms, covered) < min_coverage:
+            self.gaps += 1
+            return None
+        self.local_hits += 1
+        best = max(source["score"] for source in sources.values())
+        return [
+            SearchResult(
+                title=source["title"],
+                url=source["url"],
+                content=" ".join(source["passages"]),
+                score=source["score"] / best,
+                raw_content=source["raw_content"]
+            )
+            for source in sources.values()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            passages = self._conn.execute("SELECT passages FROM corpus_stats WHERE id = 1").fetchone()[0]
+        return {
+            "documents": documents,
+            "passages": passages,
+            "local_hits": self.local_hits,
+            "gaps": self.gaps,
+            "path": self.path
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def corpus_from_env() -> Optional[CorpusStore]:
+    """Build the corpus from CORPUS_ENABLED/_PATH/_MAX_POSTINGS environment variables."""
+    if os.getenv("CORPUS_ENABLED", "false").lower() not in ("1", "true", "yes", "on"):
+        return None
+    return CorpusStore(os.getenv("CORPUS_PATH", "cache/corpus.sqlite"),
+                       max_postings=int(os.getenv("CORPUS_MAX_POSTINGS", "2000")))
@@ -0,0 +1,71 @@
+"""
+Per-session deadlines and cancellation.
+The active deadline lives in a context variable, so it follows the session into
+asyncio tasks and ``asyncio.to_thread`` workers without being passed explicitly.
+"""
+import time
+import threading
+from contextvars import ContextVar
+from typing import Optional, Callable, List
+
+
+class DeadlineExceeded(Exception):
+    """The session's time budget ran out."""
+
+
+class SessionCancelled(Exception):
+    """The session was cancelled (e.g. the client disconnected)."""
+
+
+class Deadline:
+    """Time budget plus cancellation flag for one research session."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when there is no time limit."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def cancel(self):
+        """Cancel the session; in-flight work stops at its next check."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_cancel_callback(self, callback: Callable[[], None]):
+        """Call ``callback`` on cancellation (immediately if already cancelled)."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self):
+        """Raise if the session was cancelled or is out of time."""
+        if self.cancelled:
+            raise SessionCancelled("Research session was cancelled")
+        if self.expired:
+            raise DeadlineExceeded(f"Research time budget of {self.timeout:g}s exceeded")
+
+
+# The deadline of the session being worked on in the current task/thread, if any
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
@@ -4,7 +4,7 @@ Converts Pydantic models to OpenAI tool call JSON schemas.
 """
 import json
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 
 class EvaluationParams(BaseModel):
@@ -20,6 +20,32 @@ class EvaluationParams(BaseModel):
     improvement_guidance: Optional[str] = Field(default=None, description="Specific guidance for improving the answer")
 
 
+class PlannedQuery(BaseModel):
+    """One web search query and why it is needed."""
+    query: str = Field(description="Search engine query text, without numbering or quotes")
+    intent: str = Field(description="What information this search is expected to find")
+    priority: int = Field(ge=1, le=5, description="How essential this search is to answering the question (1-5)")
+    expected_depth: Literal["basic", "advanced"] = Field(
+        description="basic for simple facts, advanced for topics that need in-depth sources"
+    )
+
+
+class QueryGenerationParams(BaseModel):
+    """Plan the web searches needed to research a question."""
+    queries: List[PlannedQuery] = Field(description="Distinct search queries, most important first")
+
+
+class QueryAnalysis(BaseModel):
+    """Analysis of the sources for one research query."""
+    query_number: int = Field(description="Number of the query being analyzed, as listed in the input")
+    analysis: str = Field(description="Concise but comprehensive analysis of the sources relevant to this query")
+
+
+class MergedAnalysisParams(BaseModel):
+    """Analyze the search results of several research queries at once, one analysis per query."""
+    analyses: List[QueryAnalysis] = Field(description="One entry per research query")
+
+
 def pydantic_to_openai_tool(model_class: BaseModel, function_name: str) -> dict:
     """Convert Pydantic model to OpenAI tool schema."""
     schema = model_class.model_json_schema()
@@ -0,0 +1,70 @@
+"""
+Shared, bounded HTTP connection pool for upstream API calls.
+Built on requests.Session so keep-alive connections are reused across calls.
+"""
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPPool:
+    """Process-wide keep-alive connection pool with per-host limits."""
+
+    def __init__(self, max_connections_per_host: int = 10, max_hosts: int = 10):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_hosts = max_hosts
+        self.logger = logging.getLogger(__name__)
+
+        # pool_block=True makes callers wait for a free connection instead of
+        # opening (and then discarding) connections beyond the per-host limit.
+        adapter = HTTPAdapter(
+            pool_connections=max_hosts,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapters = [adapter]
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST through the shared session."""
+        return self.session.post(url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host pool statistics (requests sent, connections opened, idle connections)."""
+        stats = {}
+        for adapter in self._adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                stats[host] = {
+                    "requests": pool.num_requests,
+                    "connections_opened": pool.num_connections,
+                    "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                    "max_connections": self.max_connections_per_host
+                }
+        return stats
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+_shared_pool: Optional[HTTPPool] = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_http_pool(max_connections_per_host: int = 10) -> HTTPPool:
+    """Return the process-wide HTTP pool, creating it on first use."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = HTTPPool(max_connections_per_host=max_connections_per_host)
+        return _shared_pool
@@ -0,0 +1,282 @@
+"""
+Pipeline instrumentation.
+Per-session traces record stage spans, upstream call latencies, token usage and
+cache hits; process-wide metrics aggregate the same events as Prometheus
+histograms and counters. The active trace lives in a context variable (like the
+session deadline), so spans recorded in asyncio tasks and ``asyncio.to_thread``
+workers land on the right session.
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+from .models import PipelineMetrics, StageTiming, SpanRecord
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SESSION_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, as Prometheus expects."""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: per-bucket (non-cumulative) counts with a final +Inf slot, sum
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                cumulative += counts[-1]
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, INF_LABEL)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, description, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+STAGE_SECONDS = METRICS.histogram(
+    "rag_stage_duration_seconds", "Duration of research pipeline stages.", ("stage",))
+UPSTREAM_SECONDS = METRICS.histogram(
+    "rag_upstream_call_duration_seconds", "Latency of upstream calls, including retries.",
+    ("upstream", "method", "outcome"))
+LLM_TOKENS = METRICS.counter(
+    "rag_llm_tokens_total", "LLM tokens reported in upstream usage blocks.", ("method", "kind"))
+CACHE_LOOKUPS = METRICS.counter(
+    "rag_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+SESSION_SECONDS = METRICS.histogram(
+    "rag_session_duration_seconds", "Duration of research sessions.", ("outcome",), SESSION_BUCKETS)
+
+
+class SessionTrace:
+    """Spans, upstream calls, token usage and cache hits of one research session."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.upstream_calls: Dict[str, int] = defaultdict(int)
+        self.cache_hits: Dict[str, int] = defaultdict(int)
+        self.cache_misses: Dict[str, int] = defaultdict(int)
+        self._spans: List[SpanRecord] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, category: str, start: float, duration: float, attributes: Dict[str, Any]):
+        """Record a span; ``start`` is a ``time.perf_counter()`` reading."""
+        record = SpanRecord(name=name, category=category, start=start - self.started,
+                            duration=duration, attributes=attributes)
+        with self._lock:
+            self._spans.append(record)
+
+    def add_call(self, upstream: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.upstream_calls[upstream] += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def add_cache_lookup(self, cache: str, hit: bool):
+        with self._lock:
+            (self.cache_hits if hit else self.cache_misses)[cache] += 1
+
+    def summary(self) -> PipelineMetrics:
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: span.start)
+            stages: Dict[str, StageTiming] = {}
+            for span in spans:
+                if span.category != "stage":
+                    continue
+                timing = stages.setdefault(span.name, StageTiming(count=0, total_seconds=0.0, max_seconds=0.0))
+                timing.count += 1
+                timing.total_seconds += span.duration
+                timing.max_seconds = max(timing.max_seconds, span.duration)
+            return PipelineMetrics(
+                duration_seconds=time.perf_counter() - self.started,
+                stages=stages,
+                upstream_calls=dict(self.upstream_calls),
+                prompt_tokens=self.prompt_tokens,
+                completion_tokens=self.completion_tokens,
+                cache_hits=dict(self.cache_hits),
+                cache_misses=dict(self.cache_misses),
+                spans=spans
+            )
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace Event Format JSON, loadable in chrome://tracing or Perfetto.
+
+        Concurrent spans are spread over as few rows as possible so that each row's
+        spans nest or follow one another.
+        """
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: (span.start, -span.duration))
+        lanes: List[List[float]] = []  # per lane: end times of the open spans, innermost last
+        events = []
+        for span in spans:
+            end = span.start + span.duration
+            for lane_id, open_ends in enumerate(lanes):
+                while open_ends and open_ends[-1] <= span.start:
+                    open_ends.pop()
+                if not open_ends or end <= open_ends[-1]:
+                    break
+            else:
+                lanes.append([])
+                lane_id = len(lanes) - 1
+            lanes[lane_id].append(end)
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round(span.start * 1e6, 1),
+                "dur": round(span.duration * 1e6, 1),
+                "pid": 1,
+                "tid": lane_id + 1,
+                "args": span.attributes
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"session_id": self.session_id, "started_at": self.started_at}
+        }
+
+    def write_chrome_trace(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.session_id}.trace.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+        return path
+
+
+# The trace of the session being worked on in the current task/thread, if any
+current_trace: ContextVar[Optional[SessionTrace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, category: str = "stage", **attributes) -> Iterator[None]:
+    """Time the enclosed block as a pipeline stage of the current session."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        if category == "stage":
+            STAGE_SECONDS.observe(duration, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(name, category, start, duration, attributes)
+
+
+def record_upstream_call(upstream: str, method: str, start: float, outcome: str,
+                         usage: Optional[Dict[str, Any]] = None, **attributes):
+    """Record one logical upstream call that began at ``start`` (``time.perf_counter()``)."""
+    duration = time.perf_counter() - start
+    prompt_tokens = int((usage or {}).get("prompt_tokens") or 0)
+    completion_tokens = int((usage or {}).get("completion_tokens") or 0)
+    UPSTREAM_SECONDS.observe(duration, upstream=upstream, method=method, outcome=outcome)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, method=method, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, method=method, kind="completion")
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_call(upstream, prompt_tokens, completion_tokens)
+        if usage:
+            attributes = {**attributes, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        trace.add_span(method, upstream, start, duration, {**attributes, "outcome": outcome})
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_cache_lookup(cache, hit)
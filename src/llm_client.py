@@ -2,29 +2,181 @@
 LLM client for making HTTP requests to OpenAI-compatible APIs.
 """
 import requests
+import re
 import json
+import time
 import logging
-from typing import List, Dict, Any, Optional
-from .models import LLMRequest, LLMResponse, EvaluationResult, EvaluationAction, EvaluationMetrics
-from .function_schema import pydantic_to_openai_tool, EvaluationParams
+from typing import List, Dict, Any, Optional, Iterable, Callable, Tuple
+from .models import LLMRequest, LLMResponse, EvaluationResult, EvaluationAction, EvaluationMetrics, SearchQuery
+from .function_schema import pydantic_to_openai_tool, EvaluationParams, MergedAnalysisParams, QueryGenerationParams
+from .http_pool import HTTPPool, get_http_pool
+from .cache import Cache, make_cache_key
+from .rate_limit import UpstreamLimiter, UpstreamError, raise_for_upstream_status
+from .retry import RetryPolicy
+from .deadline import current_deadline
+from .prompt_packing import PromptPacker, count_tokens
+from .instrumentation import record_upstream_call, record_cache_lookup
+
+
+# Preamble lines such as "Here are 3 search queries:" in free-text query lists
+QUERY_PREAMBLE = re.compile(r"^(here (are|is)|sure)\b.*|.*:$", re.IGNORECASE)
+QUERY_BULLET = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s*")
+
+
+def parse_query_lines(text: str) -> List[str]:
+    """Extract search queries from a free-text list, dropping numbering, bullets, quotes and preambles."""
+    queries = []
+    for line in text.split('\n'):
+        line = QUERY_BULLET.sub('', line.strip()).strip().strip('"\'`').strip()
+        if line and not QUERY_PREAMBLE.match(line) and line not in queries:
+            queries.append(line)
+    return queries
+
+
+def parse_planned_query(item: Any) -> Optional[SearchQuery]:
+    """One item of a structured query plan, or None if it has no usable query.
+
+    Plain strings are accepted as queries; a missing or invalid priority defaults to 3
+    and out-of-range values are clamped to 1-5; any depth but "advanced" means basic.
+    """
+    if isinstance(item, str):
+        item = {'query': item}
+    if not isinstance(item, dict) or not isinstance(item.get('query'), str):
+        return None
+    query = item['query'].strip().strip('"\'').strip()
+    if not query:
+        return None
+    try:
+        priority = min(max(int(item.get('priority', 3)), 1), 5)
+    except (TypeError, ValueError):
+        priority = 3
+    intent = item.get('intent')
+    return SearchQuery(
+        query=query,
+        intent=intent if isinstance(intent, str) else None,
+        priority=priority,
+        search_depth='advanced' if item.get('expected_depth') == 'advanced' else 'basic'
+    )
+
+
+EVALUATION_SYSTEM_PROMPT = """You are an expert evaluator. Evaluate the quality of the provided answer based on the original question and research context.
+
+Evaluation criteria:
+- Accuracy (0-10): How factually correct is the information?
+- Completeness (0-10): Does it fully address all aspects of the question?
+- Relevance (0-10): How well does it directly answer what was asked?
+- Clarity (0-10): Is it well-structured and easy to understand?
+- Confidence (0-10): Overall quality and trustworthiness
+
+Actions:
+- sufficient_return: Answer is good enough (average score >= 7.0)
+- redo_final_response: Answer needs improvement but research is sufficient (average score 5.0-6.9)
+- research_again: More research needed (average score < 5.0 or missing key information)
+
+Be honest and critical in your evaluation."""
+
+
+# Methods whose outputs are repeatable enough to cache by default
+DEFAULT_CACHED_METHODS = ("generate_search_queries", "analyze_search_results")
 
 
 class LLMClient:
     """Client for making HTTP requests to LLM APIs."""
     
-    def __init__(self, base_url: str, api_key: str, model: str):
+    def __init__(self, base_url: str, api_key: str, model: str, http_pool: Optional[HTTPPool] = None,
+                 response_cache: Optional[Cache] = None,
+                 cached_methods: Iterable[str] = DEFAULT_CACHED_METHODS,
+                 rate_limiter: Optional[UpstreamLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 prompt_packer: Optional[PromptPacker] = None):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.model = model
+        self.http_pool = http_pool or get_http_pool()
+        self.response_cache = response_cache
+        self.cached_methods = set(cached_methods)
+        # Shared with every other client of the same upstream; no limits unless configured
+        self.rate_limiter = rate_limiter or UpstreamLimiter("llm")
+        self.retry_policy = retry_policy or RetryPolicy("llm", budget=90.0, max_attempt_timeout=60.0)
+        # Keeps the research context of every prompt within a token budget
+        self.prompt_packer = prompt_packer or PromptPacker()
         self.logger = logging.getLogger(__name__)
     
-    def call_llm(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 1000, tools: Optional[List[Dict]] = None) -> str:
-        """Make HTTP request to LLM API."""
+    def call_llm(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 1000,
+                 tools: Optional[List[Dict]] = None, cache_as: Optional[str] = None,
+                 on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Make HTTP request to LLM API.
+        
+        ``cache_as`` names the calling method; if that method is enabled in
+        ``cached_methods``, responses are cached by a hash of the full request.
+        If ``on_token`` is given the response is streamed and each content delta
+        is passed to it as it arrives; the full text is still returned.
+        """
+        cache_key = None
+        if self.response_cache is not None and cache_as in self.cached_methods:
+            cache_key = make_cache_key("llm", self.model, messages, temperature, max_tokens, tools)
+            cached = self.response_cache.get(cache_key)
+            record_cache_lookup("llm", cached is not None)
+            if cached is not None:
+                self.logger.info(f"LLM cache hit for {cache_as}")
+                if on_token:
+                    on_token(cached)
+                return cached
+        
+        started = time.perf_counter()
+        response, outcome = None, "error"
         try:
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
+            response = self._complete(messages, temperature, max_tokens, tools, on_token)
+            outcome = "ok"
+        finally:
+            record_upstream_call("llm", cache_as or "call_llm", started, outcome,
+                                 usage=response.usage if response is not None else None,
+                                 streamed=bool(on_token and not tools))
+        content = response.content
+        if cache_key is not None and content:
+            self.response_cache.set(cache_key, content)
+        return content
+    
+    def _complete(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                  tools: Optional[List[Dict]], on_token: Optional[Callable[[str], None]]) -> LLMResponse:
+        """Run the completion request (streaming if ``on_token`` is given) under the retry policy."""
+        if on_token and not tools:
+            streamed = []
+            deadline = current_deadline.get()
+            
+            def forward(delta: str):
+                # Abandon the stream (closing the connection) once the session is cancelled or out of time
+                if deadline is not None:
+                    deadline.check()
+                streamed.append(delta)
+                on_token(delta)
+            
+            # A stream can only be retried if nothing has reached the caller yet
+            return self.retry_policy.call(
+                lambda timeout: self._stream_completion(messages, temperature, max_tokens, forward, timeout),
+                hedge=False,
+                should_retry=lambda error: not streamed
+            )
+        return self.retry_policy.call(
+            lambda timeout: self._request_completion(messages, temperature, max_tokens, tools, timeout)
+        )
+    
+    def _headers(self) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+    
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Rough prompt + completion token count for the tokens/minute budget (~4 chars per token)."""
+        return sum(len(m.get('content') or '') for m in messages) // 4 + max_tokens
+    
+    def _request_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                            tools: Optional[List[Dict]], timeout: float = 60) -> LLMResponse:
+        """Send a chat completion request and return the content or tool-call arguments with usage."""
+        try:
+            headers = self._headers()
             
             payload = {
                 'model': self.model,
@@ -40,14 +192,15 @@ class LLMClient:
             
             self.logger.info(f"Making LLM request to {self.base_url}/chat/completions")
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            response.raise_for_status()
+            with self.rate_limiter.permit(self._estimate_tokens(messages, max_tokens)) as permit:
+                response = self.http_pool.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    timeout=permit.timeout(timeout)
+                )
+                permit.record_response(response)
+                raise_for_upstream_status(response, "LLM request failed")
             result = response.json()
             
             if 'choices' in result and len(result['choices']) > 0:
@@ -57,28 +210,86 @@ class LLMClient:
                 if 'tool_calls' in message and message['tool_calls']:
                     tool_call = message['tool_calls'][0]
                     if tool_call['type'] == 'function':
-                        return tool_call['function']['arguments']
+                        return LLMResponse(content=tool_call['function']['arguments'], usage=result.get('usage'))
                 
                 # Regular content response
                 content = message.get('content', '')
                 self.logger.info("LLM request successful")
-                return content
+                return LLMResponse(content=content or '', usage=result.get('usage'))
             else:
                 raise Exception("No choices returned from LLM")
                 
         except requests.exceptions.RequestException as e:
             self.logger.error(f"HTTP request failed: {e}")
-            raise Exception(f"LLM request failed: {e}")
+            raise UpstreamError(f"LLM request failed: {e}")
         except Exception as e:
             self.logger.error(f"LLM call failed: {e}")
             raise
     
+    def _stream_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                           on_token: Callable[[str], None], timeout: float = 60) -> LLMResponse:
+        """Send a streaming chat completion request and parse the SSE response."""
+        payload = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'stream': True,
+            # Ask for a final chunk carrying the usage block
+            'stream_options': {'include_usage': True}
+        }
+        
+        self.logger.info(f"Making streaming LLM request to {self.base_url}/chat/completions")
+        
+        try:
+            parts, usage = [], None
+            with self.rate_limiter.permit(self._estimate_tokens(messages, max_tokens)) as permit, \
+                    self.http_pool.post(
+                        f"{self.base_url}/chat/completions",
+                        headers=self._headers(),
+                        json=payload,
+                        timeout=permit.timeout(timeout),
+                        stream=True
+                    ) as response:
+                permit.record_response(response)
+                raise_for_upstream_status(response, "LLM request failed")
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get('usage') or usage
+                    choices = chunk.get('choices') or []
+                    delta = choices[0].get('delta', {}).get('content') if choices else None
+                    if delta:
+                        parts.append(delta)
+                        on_token(delta)
+            
+            self.logger.info("Streaming LLM request successful")
+            return LLMResponse(content=''.join(parts), usage=usage)
+            
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"HTTP request failed: {e}")
+            raise UpstreamError(f"LLM request failed: {e}")
+    
     def generate_search_queries(self, question: str, num_queries: int = 3) -> List[str]:
         """Generate search queries for the given question."""
+        return [planned.query for planned in self.plan_search_queries(question, num_queries)]
+    
+    def plan_search_queries(self, question: str, num_queries: int = 3) -> List[SearchQuery]:
+        """Plan up to ``num_queries`` searches with intent, priority and search depth.
+        
+        Uses a structured tool call; if the model answers in plain text instead,
+        the queries are parsed from its lines with default priority and depth.
+        Invalid items of a structured plan are skipped; if none are usable, the
+        question itself is searched.
+        """
         messages = [
             {
                 "role": "system",
-                "content": f"You are a research assistant. Generate {num_queries} specific search queries to thoroughly research the given question. Return only the queries, one per line."
+                "content": f"You are a research assistant. Plan up to {num_queries} specific, distinct web search queries to thoroughly research the given question. Give each an intent, a priority from 1 (nice to have) to 5 (essential) and the search depth it needs. Do not pad the list with searches that add little."
             },
             {
                 "role": "user",
@@ -86,14 +297,27 @@ class LLMClient:
             }
         ]
         
-        response = self.call_llm(messages, temperature=0.3)
-        queries = [q.strip() for q in response.split('\n') if q.strip()]
-        return queries[:num_queries]  # Limit to specified number of queries
+        planning_tool = pydantic_to_openai_tool(QueryGenerationParams, "plan_search_queries")
+        response = self.call_llm(messages, temperature=0.3, tools=[planning_tool], cache_as="generate_search_queries")
+        
+        try:
+            plan = json.loads(response or '')
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"Query plan was not structured ({e}); parsing queries from text")
+            planned = [SearchQuery(query=query) for query in parse_query_lines(response or '')]
+        else:
+            items = plan.get('queries') if isinstance(plan, dict) else plan
+            planned = [query for query in map(parse_planned_query, items if isinstance(items, list) else [])
+                       if query is not None]
+            if not planned:
+                self.logger.warning("Query plan had no usable queries; searching the question itself")
+                planned = [SearchQuery(query=question, priority=5)]
+        return planned[:num_queries]  # Limit to specified number of queries
     
     def analyze_search_results(self, query: str, search_results: List[Dict[str, Any]]) -> str:
         """Analyze search results and extract key information."""
-        results_text = "\n\n".join([
-            f"Title: {result.get('title', 'N/A')}\nURL: {result.get('url', 'N/A')}\nContent: {result.get('content', 'N/A')}"
+        results_text = self.prompt_packer.pack(query, [
+            (f"Title: {result.get('title', 'N/A')}\nURL: {result.get('url', 'N/A')}\nContent:", result.get('content', 'N/A'))
             for result in search_results
         ])
         
@@ -108,12 +332,60 @@ class LLMClient:
             }
         ]
         
-        return self.call_llm(messages, temperature=0.5)
+        return self.call_llm(messages, temperature=0.5, cache_as="analyze_search_results")
+    
+    def analyze_all_search_results(self, queries_with_results: List[Tuple[str, List[Dict[str, Any]]]]) -> List[str]:
+        """Analyze several queries' search results in one tool call; returns one analysis per query.
+        
+        Sources shared between queries are listed once and referenced by id.
+        Raises ValueError if the response does not cover every query.
+        """
+        source_ids: Dict[str, str] = {}
+        sources = []
+        query_lines = []
+        for number, (query, search_results) in enumerate(queries_with_results, 1):
+            ids = []
+            for result in search_results:
+                key = result.get('url') or result.get('content', '')
+                if key not in source_ids:
+                    source_ids[key] = f"S{len(source_ids) + 1}"
+                    sources.append((f"[{source_ids[key]}] Title: {result.get('title', 'N/A')}\nURL: {result.get('url', 'N/A')}\nContent:",
+                                    result.get('content', 'N/A')))
+                ids.append(source_ids[key])
+            query_lines.append(f"{number}. {query} (sources: {', '.join(ids) or 'none'})")
+        
+        all_queries = " ".join(query for query, _ in queries_with_results)
+        sources_text = self.prompt_packer.pack(all_queries, sources)
+        
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a research analyst. For each research query, analyze the search results listed for it and extract the most relevant information for that query. Be concise but comprehensive. Return exactly one analysis per query."
+            },
+            {
+                "role": "user",
+                "content": "Research Queries:\n" + "\n".join(query_lines) + f"\n\nSearch Results:\n{sources_text}"
+            }
+        ]
+        
+        analysis_tool = pydantic_to_openai_tool(MergedAnalysisParams, "analyze_queries")
+        response = self.call_llm(messages, temperature=0.5, max_tokens=min(700 * len(queries_with_results), 4000),
+                                 tools=[analysis_tool], cache_as="analyze_search_results")
+        
+        try:
+            analyses = {item['query_number']: item['analysis'] for item in json.loads(response)['analyses']}
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise ValueError(f"Failed to parse merged analysis response: {e}")
+        missing = [n for n in range(1, len(queries_with_results) + 1) if not analyses.get(n)]
+        if missing:
+            raise ValueError(f"Merged analysis response is missing queries {missing}")
+        return [analyses[n] for n in range(1, len(queries_with_results) + 1)]
     
-    def synthesize_final_answer(self, question: str, research_data: List[Dict[str, Any]]) -> str:
-        """Synthesize the final answer from all research data."""
-        research_text = "\n\n".join([
-            f"Query: {step['query']}\nAnalysis: {step['analysis']}"
+    def synthesize_final_answer(self, question: str, research_data: List[Dict[str, Any]],
+                                on_token: Optional[Callable[[str], None]] = None, temperature: float = 0.6) -> str:
+        """Synthesize the final answer from all research data, optionally streaming tokens."""
+        research_text = self.prompt_packer.pack(question, [
+            (f"Query: {step['query']}\nAnalysis:", step['analysis'])
             for step in research_data
         ])
         
@@ -128,32 +400,21 @@ class LLMClient:
             }
         ]
         
-        return self.call_llm(messages, temperature=0.6)
+        return self.call_llm(messages, temperature=temperature, cache_as="synthesize_final_answer", on_token=on_token)
     
     def evaluate_answer(self, question: str, answer: str, research_context: str) -> EvaluationResult:
         """Use LLM as a judge to evaluate the quality of an answer."""
         
-        # Generate the function schema using Pydantic
-        evaluation_tool = pydantic_to_openai_tool(EvaluationParams, "evaluate_answer")
+        # The answer is judged in full; the research context gets what is left of the budget
+        research_context = self.prompt_packer.pack(
+            question, [("", research_context)],
+            budget=max(self.prompt_packer.budget - count_tokens(answer), self.prompt_packer.budget // 4)
+        )
         
         messages = [
             {
                 "role": "system",
-                "content": """You are an expert evaluator. Evaluate the quality of the provided answer based on the original question and research context.
-
-Evaluation criteria:
-- Accuracy (0-10): How factually correct is the information?
-- Completeness (0-10): Does it fully address all aspects of the question?
-- Relevance (0-10): How well does it directly answer what was asked?
-- Clarity (0-10): Is it well-structured and easy to understand?
-- Confidence (0-10): Overall quality and trustworthiness
-
-Actions:
-- sufficient_return: Answer is good enough (average score >= 7.0)
-- redo_final_response: Answer needs improvement but research is sufficient (average score 5.0-6.9)
-- research_again: More research needed (average score < 5.0 or missing key information)
-
-Be honest and critical in your evaluation."""
+                "content": EVALUATION_SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -169,8 +430,50 @@ Please evaluate this answer and provide your assessment."""
             }
         ]
         
+        return self._judge(messages)
+    
+    def evaluate_answer_incremental(self, question: str, answer_changes: str, context_summary: str,
+                                    new_research: str, previous: EvaluationResult) -> EvaluationResult:
+        """Re-evaluate a revised answer from what changed since ``previous`` was judged.
+        
+        Sends only the changed answer sections and any new research, plus a compact
+        summary of the research context that was already reviewed.
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": EVALUATION_SYSTEM_PROMPT + "\n\nYou are re-evaluating a revised answer. You are given your previous evaluation, the sections of the answer that changed (unchanged sections are elided), a summary of the research you already reviewed and any research added since. Score the revised answer as a whole."
+            },
+            {
+                "role": "user",
+                "content": f"""Original Question: {question}
+
+Previous Evaluation:
+Score {previous.overall_score:.1f}/10 (accuracy {previous.metrics.accuracy:g}, completeness {previous.metrics.completeness:g}, relevance {previous.metrics.relevance:g}, clarity {previous.metrics.clarity:g}, confidence {previous.metrics.confidence:g}), action {previous.action.value}
+Reasoning: {previous.reasoning}
+
+Changes to the Answer:
+{answer_changes}
+
+Summary of Previously Reviewed Research:
+{context_summary}
+
+New Research Since the Previous Evaluation:
+{new_research or "None"}
+
+Please evaluate the revised answer and provide your assessment."""
+            }
+        ]
+        
+        return self._judge(messages)
+    
+    def _judge(self, messages: List[Dict[str, str]]) -> EvaluationResult:
+        """Run an evaluation prompt through the evaluate_answer tool and parse the result."""
+        # Generate the function schema using Pydantic
+        evaluation_tool = pydantic_to_openai_tool(EvaluationParams, "evaluate_answer")
+        
         try:
-            response = self.call_llm(messages, temperature=0.2, tools=[evaluation_tool])
+            response = self.call_llm(messages, temperature=0.2, tools=[evaluation_tool], cache_as="evaluate_answer")
             
             # Parse the function call response
             evaluation_data = json.loads(response)
@@ -210,10 +513,12 @@ Please evaluate this answer and provide your assessment."""
                 improvement_guidance=None
             )
     
-    def regenerate_answer_with_guidance(self, question: str, research_data: List[Dict[str, Any]], guidance: str) -> str:
-        """Regenerate the final answer with specific improvement guidance."""
-        research_text = "\n\n".join([
-            f"Query: {step['query']}\nAnalysis: {step['analysis']}"
+    def regenerate_answer_with_guidance(self, question: str, research_data: List[Dict[str, Any]], guidance: str,
+                                        on_token: Optional[Callable[[str], None]] = None,
+                                        temperature: float = 0.6) -> str:
+        """Regenerate the final answer with specific improvement guidance, optionally streaming tokens."""
+        research_text = self.prompt_packer.pack(question, [
+            (f"Query: {step['query']}\nAnalysis:", step['analysis'])
             for step in research_data
         ])
         
@@ -232,4 +537,4 @@ Cite relevant information and be factual. Ensure your answer addresses the speci
             }
         ]
         
-        return self.call_llm(messages, temperature=0.6)
+        return self.call_llm(messages, temperature=temperature, cache_as="regenerate_answer_with_guidance", on_token=on_token)
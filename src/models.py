@@ -1,7 +1,7 @@
 """
 Pydantic models for the RAG system.
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -13,6 +13,17 @@ class SearchResult(BaseModel):
     url: str
     content: str
     score: Optional[float] = None
+    # Full page text, when Tavily returns it; only used for passage indexing, so it is left out of API
+    # and step output (the search cache stores it explicitly)
+    raw_content: Optional[str] = Field(default=None, exclude=True)
+
+
+class SearchQuery(BaseModel):
+    """A planned web search generated for a research question."""
+    query: str
+    intent: Optional[str] = None
+    priority: int = 3  # 1 (nice to have) - 5 (essential)
+    search_depth: str = "basic"  # Tavily search_depth: basic or advanced
 
 
 class LLMRequest(BaseModel):
@@ -44,6 +55,52 @@ class RAGRequest(BaseModel):
     session_id: Optional[str] = None
 
 
+class BatchItem(BaseModel):
+    """Model for one question in a batch research run."""
+    id: Optional[str] = None
+    question: str
+    num_searches: int = 3
+    num_rewordings: int = 3
+    bypass_cache: bool = False
+    speculative_candidates: int = 0
+    time_budget: Optional[float] = None  # Seconds; unset uses SESSION_TIME_BUDGET
+    merged_analysis: Optional[bool] = None
+
+
+class BatchRequest(BaseModel):
+    """Model for batch research requests; the server may clamp both limits further."""
+    items: List[BatchItem] = Field(min_length=1, max_length=1000)
+    max_workers: int = Field(default=4, ge=1, le=64)
+
+
+class StageTiming(BaseModel):
+    """Aggregate timing of one pipeline stage within a session."""
+    count: int
+    total_seconds: float
+    max_seconds: float
+
+
+class SpanRecord(BaseModel):
+    """A timed stage or upstream call; ``start`` is seconds since the session began."""
+    name: str
+    category: str  # "stage", or the upstream ("llm", "tavily") for individual calls
+    start: float
+    duration: float
+    attributes: Dict[str, Any] = {}
+
+
+class PipelineMetrics(BaseModel):
+    """Timing, token usage and cache behaviour of one research session."""
+    duration_seconds: float
+    stages: Dict[str, StageTiming]
+    upstream_calls: Dict[str, int]
+    prompt_tokens: int
+    completion_tokens: int
+    cache_hits: Dict[str, int]
+    cache_misses: Dict[str, int]
+    spans: List[SpanRecord]
+
+
 class RAGResponse(BaseModel):
     """Model for RAG system responses."""
     answer: str
@@ -52,6 +109,8 @@ class RAGResponse(BaseModel):
     total_steps: int
     timestamp: datetime
     evaluation_result: Optional['EvaluationResult'] = None
+    partial: bool = False  # True when the time budget ran out and this is the best answer so far
+    metrics: Optional[PipelineMetrics] = None
 
 
 class ProgressUpdate(BaseModel):
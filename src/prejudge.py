@@ -0,0 +1,154 @@
+"""
+Cheap local pre-judge for synthesized answers.
+Scores an answer from surface signals so clearly good answers skip the LLM judge,
+clearly weak ones are rewritten to cover the research they left out, and only the
+ambiguous middle pays for an LLM evaluation.
+"""
+import os
+import re
+import random
+import threading
+from typing import List, Dict, Any, Optional, NamedTuple
+
+from .models import EvaluationResult, EvaluationAction, EvaluationMetrics
+from .prompt_packing import terms
+
+
+CITATION_PATTERN = re.compile(r"https?://\S+|\[(?:S)?\d+\]|\((?:source|via)[^)]*\)", re.IGNORECASE)
+
+# Weights of the individual signals in the combined score
+SIGNAL_WEIGHTS = {"coverage": 0.35, "grounding": 0.3, "length": 0.2, "citations": 0.15}
+
+
+class PreJudgement(NamedTuple):
+    """Heuristic score in [0, 1], its component signals and queries the answer barely covers."""
+    score: float
+    signals: Dict[str, float]
+    uncovered: List[str]
+
+
+class HeuristicJudge:
+    """Local answer scorer that decides confidently good or bad answers without the LLM.
+
+    Signals: coverage of each generated query's key terms, grounding (share of the
+    answer's terms that appear in the analyses), length and citation presence.
+    Scores at or above ``accept_threshold`` are SUFFICIENT, and anything between
+    is left to the LLM. At or below ``reject_threshold`` the answer is sent back
+    as REDO_FINAL_RESPONSE with guidance naming the queries it barely covers: their
+    research is already in hand, so searching them again would add nothing. Only
+    the LLM judge, which can name new topics, asks for more research.
+
+    Agreement with the LLM judge is tracked on the ambiguous answers (comparing the
+    side of the midpoint the score fell on) and on a ``shadow_rate`` sample of
+    confident decisions that are also sent to the LLM.
+    """
+
+    def __init__(self, accept_threshold: float = 0.8, reject_threshold: float = 0.3,
+                 shadow_rate: float = 0.1, min_words: int = 60, target_words: int = 200):
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.shadow_rate = shadow_rate
+        self.min_words = min_words
+        self.target_words = target_words
+        self.accepted = 0
+        self.rejected = 0
+        self.deferred = 0
+        self.compared = 0
+        self.agreed = 0
+        self._lock = threading.Lock()
+
+    def score(self, question: str, answer: str, research_data: List[Dict[str, Any]]) -> PreJudgement:
+        answer_terms = terms(answer)
+        answer_vocabulary = set(answer_terms)
+
+        queries = [question] + [item["query"] for item in research_data]
+        coverages, uncovered = [], []
+        for query in queries:
+            query_terms = set(terms(query))
+            if not query_terms:
+                continue
+            coverage = len(query_terms & answer_vocabulary) / len(query_terms)
+            coverages.append(coverage)
+            if coverage < 0.5 and query != question:
+                uncovered.append(query)
+
+        analysis_vocabulary = set()
+        for item in research_data:
+            analysis_vocabulary.update(terms(item["analysis"]))
+
+        words = len(answer.split())
+        signals = {
+            "coverage": sum(coverages) / len(coverages) if coverages else 0.0,
+            "grounding": (sum(1 for t in answer_terms if t in analysis_vocabulary) / len(answer_terms)
+                          if answer_terms else 0.0),
+            "length": min(max(words - self.min_words, 0) / max(self.target_words - self.min_words, 1), 1.0),
+            "citations": 1.0 if CITATION_PATTERN.search(answer) else 0.0
+        }
+        score = sum(SIGNAL_WEIGHTS[name] * value for name, value in signals.items())
+        return PreJudgement(score, signals, uncovered)
+
+    def judge(self, judgement: PreJudgement) -> Optional[EvaluationResult]:
+        """A confident evaluation for ``judgement``, or None if the LLM judge should decide."""
+        if judgement.score >= self.accept_threshold:
+            action = EvaluationAction.SUFFICIENT
+        elif judgement.score <= self.reject_threshold and judgement.uncovered:
+            # Without uncovered queries there is no guidance to give, so let the LLM decide
+            action = EvaluationAction.REDO_FINAL_RESPONSE
+        else:
+            with self._lock:
+                self.deferred += 1
+            return None
+
+        with self._lock:
+            if action == EvaluationAction.SUFFICIENT:
+                self.accepted += 1
+            else:
+                self.rejected += 1
+        score = round(judgement.score * 10, 1)
+        signals = ", ".join(f"{name} {value:.2f}" for name, value in judgement.signals.items())
+        return EvaluationResult(
+            action=action,
+            metrics=EvaluationMetrics(accuracy=score, completeness=score, relevance=score,
+                                      clarity=score, confidence=score),
+            overall_score=score,
+            reasoning=f"Heuristic pre-judge score {judgement.score:.2f} ({signals})",
+            improvement_guidance=(
+                "The answer barely covers the research gathered for these queries; use their analyses "
+                "to address them: " + "; ".join(judgement.uncovered)
+                if action == EvaluationAction.REDO_FINAL_RESPONSE else None
+            )
+        )
+
+    def should_shadow(self) -> bool:
+        """Whether to also send a confident decision to the LLM judge to measure agreement."""
+        return random.random() < self.shadow_rate
+
+    def record_agreement(self, judgement: PreJudgement, llm_evaluation: EvaluationResult) -> bool:
+        """Compare the pre-judge's verdict with the LLM's (sufficient or not); returns whether they agree."""
+        midpoint = (self.accept_threshold + self.reject_threshold) / 2
+        agrees = (judgement.score >= midpoint) == (llm_evaluation.action == EvaluationAction.SUFFICIENT)
+        with self._lock:
+            self.compared += 1
+            self.agreed += agrees
+        return agrees
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "deferred": self.deferred,
+                "compared": self.compared,
+                "agreement_rate": round(self.agreed / self.compared, 3) if self.compared else None
+            }
+
+
+def heuristic_judge_from_env() -> Optional[HeuristicJudge]:
+    """Build the pre-judge from PREJUDGE_ENABLED/_ACCEPT/_REJECT/_SHADOW_RATE environment variables."""
+    if os.getenv("PREJUDGE_ENABLED", "false").lower() not in ("1", "true", "yes", "on"):
+        return None
+    return HeuristicJudge(
+        accept_threshold=float(os.getenv("PREJUDGE_ACCEPT", "0.8")),
+        reject_threshold=float(os.getenv("PREJUDGE_REJECT", "0.3")),
+        shadow_rate=float(os.getenv("PREJUDGE_SHADOW_RATE", "0.1"))
+    )
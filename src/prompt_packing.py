@@ -0,0 +1,123 @@
+"""
+Fit prompt context into a token budget.
+Uses an approximate local tokenizer, drops near-duplicate passages and keeps
+the passages most relevant to the query when everything does not fit.
+"""
+import re
+from typing import List, Tuple, Set, Optional
+
+from .semantic_cache import STOPWORDS
+
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate BPE token count: one per word or symbol, plus one per extra 6 characters of long words."""
+    return sum(1 + (len(piece) - 1) // 6 for piece in TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` after roughly ``max_tokens`` tokens."""
+    used = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        used += 1 + (len(match.group()) - 1) // 6
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + " …"
+    return text
+
+
+def terms(text: str) -> List[str]:
+    """Lower-cased content words used for relevance scoring."""
+    return [t for t in TERM_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def split_passages(text: str, max_tokens: int = 150) -> List[str]:
+    """Split text into passages of about ``max_tokens``, breaking at paragraph and sentence ends."""
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+|\n\s*\n", text) if s.strip()]
+    passages, current, current_tokens = [], [], 0
+    for sentence in sentences:
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            sentence, tokens = truncate_to_tokens(sentence, max_tokens), max_tokens
+        if current and current_tokens + tokens > max_tokens:
+            passages.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence.strip())
+        current_tokens += tokens
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = TERM_PATTERN.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+class PromptPacker:
+    """Packs ``(header, body)`` sections into at most ``budget`` tokens."""
+
+    def __init__(self, budget: int = 6000, passage_tokens: int = 150, duplicate_threshold: float = 0.8):
+        self.budget = budget
+        self.passage_tokens = passage_tokens
+        self.duplicate_threshold = duplicate_threshold
+
+    def pack(self, query: str, sections: List[Tuple[str, str]], budget: Optional[int] = None,
+             separator: str = "\n\n") -> str:
+        """Render sections as ``header body`` blocks, trimming bodies to fit the budget.
+
+        Output is unchanged when everything already fits. Otherwise bodies are split
+        into passages, near-duplicates are dropped, and the passages most relevant
+        to ``query`` are kept (each section keeps at least its best passage while
+        room remains), in their original order.
+        """
+        budget = self.budget if budget is None else budget
+        full = separator.join(f"{header} {body}" if header else body for header, body in sections)
+        if count_tokens(full) <= budget:
+            return full
+
+        query_terms = set(terms(query))
+        candidates = []  # (score, section index, passage index, text, tokens)
+        for s, (_, body) in enumerate(sections):
+            for p, passage in enumerate(split_passages(body, self.passage_tokens)):
+                passage_terms = terms(passage)
+                overlap = sum(1 for t in passage_terms if t in query_terms)
+                score = overlap / (len(passage_terms) ** 0.5 or 1.0)
+                # Leading passages usually carry the summary of a source
+                score += 0.1 / (p + 1)
+                candidates.append((score, s, p, passage, count_tokens(passage)))
+
+        # Best passage per section first, then everything else by score
+        ordered = sorted(candidates, key=lambda c: -c[0])
+        seen_sections, firsts, rest = set(), [], []
+        for candidate in ordered:
+            (rest if candidate[1] in seen_sections else firsts).append(candidate)
+            seen_sections.add(candidate[1])
+
+        selected, kept_shingles = [], []
+        used = sum(count_tokens(header) + count_tokens(separator) for header, _ in sections)
+        for candidate in firsts + rest:
+            _, s, p, passage, tokens = candidate
+            if used + tokens > budget:
+                continue
+            shingles = _shingles(passage)
+            if any(len(shingles & other) / len(shingles | other) >= self.duplicate_threshold
+                   for other in kept_shingles):
+                continue
+            kept_shingles.append(shingles)
+            selected.append((s, p, passage))
+            used += tokens
+
+        blocks = []
+        for s, (header, _) in enumerate(sections):
+            passages = sorted((p, text) for sec, p, text in selected if sec == s)
+            if not passages:
+                continue
+            body = ""
+            for i, (p, text) in enumerate(passages):
+                gap = i > 0 and p != passages[i - 1][0] + 1
+                body += (" … " if gap else " " if body else "") + text
+            blocks.append(f"{header} {body}" if header else body)
+        return separator.join(blocks)
@@ -2,14 +2,36 @@
 RAG (Retrieval-Augmented Generation) System for web search and analysis.
 """
 import os
+import json
+import time
+import asyncio
 import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Callable
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
 
-from .models import SearchResult, ResearchStep, RAGRequest, RAGResponse, ProgressUpdate, EvaluationResult, EvaluationAction
-from .llm_client import LLMClient
+from .models import SearchResult, ResearchStep, RAGRequest, RAGResponse, SearchQuery
+from .llm_client import LLMClient, DEFAULT_CACHED_METHODS
+from .async_llm_client import AsyncLLMClient, run_blocking
 from .search_client import SearchClient
+from .cache import Cache, cache_from_env, normalize_query
+from .semantic_cache import SemanticCache
+from .research_session import ResearchSession
+from .rate_limit import UpstreamLimiter, upstream_limiter_from_env
+from .retry import RetryPolicy, retry_policy_from_env
+from .refinement import AnswerRefiner
+from .deadline import Deadline, DeadlineExceeded, SessionCancelled, current_deadline
+from .prompt_packing import PromptPacker
+from .corpus import CorpusStore, corpus_from_env
+from .prejudge import HeuristicJudge, heuristic_judge_from_env
+from .session_logs import SessionLogWriter, session_log_writer_from_env
+from .session_store import SessionStore, session_store_from_env
+from .instrumentation import SessionTrace, current_trace, span, record_cache_lookup, SESSION_SECONDS
+
+
+# Analysis recorded for a query whose relevant sources were analyzed under queries whose analyses are unavailable
+ALREADY_ANALYZED = "The sources found for this query were already analyzed under: {queries}."
 
 
 class RAGSystem:
@@ -20,20 +42,177 @@ class RAGSystem:
                  llm_base_url: str,
                  llm_api_key: str,
                  llm_model: str,
-                 logs_dir: str = "logs"):
+                 logs_dir: str = "logs",
+                 max_concurrency: int = 4,
+                 search_cache: Optional[Cache] = None,
+                 llm_cache: Optional[Cache] = None,
+                 llm_cached_methods: Iterable[str] = DEFAULT_CACHED_METHODS,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 search_rate_limiter: Optional[UpstreamLimiter] = None,
+                 llm_rate_limiter: Optional[UpstreamLimiter] = None,
+                 search_retry_policy: Optional[RetryPolicy] = None,
+                 llm_retry_policy: Optional[RetryPolicy] = None,
+                 session_time_budget: Optional[float] = None,
+                 prompt_token_budget: int = 6000,
+                 passages_per_query: int = 8,
+                 corpus: Optional[CorpusStore] = None,
+                 corpus_min_coverage: float = 0.75,
+                 corpus_max_age: Optional[float] = 7 * 24 * 3600,
+                 merged_analysis: bool = False,
+                 min_query_priority: int = 2,
+                 incremental_evaluation: bool = False,
+                 prejudge: Optional[HeuristicJudge] = None,
+                 trace_dir: Optional[str] = None,
+                 tavily_base_url: str = "https://api.tavily.com",
+                 session_logs: Optional[SessionLogWriter] = None,
+                 session_store: Optional[SessionStore] = None,
+                 blocking_workers: Optional[int] = None):
         """Initialize the RAG system with API keys and configuration."""
         self.logs_dir = logs_dir
+        self.max_concurrency = max_concurrency
+        self.session_time_budget = session_time_budget
+        self.passages_per_query = passages_per_query
+        self.corpus = corpus
+        self.corpus_min_coverage = corpus_min_coverage
+        self.corpus_max_age = corpus_max_age
+        self.merged_analysis = merged_analysis
+        self.min_query_priority = min_query_priority
+        self.trace_dir = trace_dir
         
-        # Create logs directory if it doesn't exist
-        os.makedirs(logs_dir, exist_ok=True)
+        # Session logs are written to logs_dir (and as events to the session store) by a background thread
+        self.session_store = session_store
+        self.session_logs = session_logs or SessionLogWriter(logs_dir, store=session_store)
         
         # Initialize clients
-        self.llm_client = LLMClient(llm_base_url, llm_api_key, llm_model)
-        self.search_client = SearchClient(tavily_api_key)
+        self.llm_client = LLMClient(llm_base_url, llm_api_key, llm_model,
+                                    response_cache=llm_cache, cached_methods=llm_cached_methods,
+                                    rate_limiter=llm_rate_limiter, retry_policy=llm_retry_policy,
+                                    prompt_packer=PromptPacker(prompt_token_budget))
+        self.search_client = SearchClient(tavily_api_key, cache=search_cache, rate_limiter=search_rate_limiter,
+                                          retry_policy=search_retry_policy, base_url=tavily_base_url)
+        
+        # Blocking calls (LLM, search, corpus) get their own threads: the loop's default executor
+        # (min(32, cpus + 4) threads) would cap concurrent sessions well below the upstream limits
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers or self._default_blocking_workers(),
+                                           thread_name_prefix="rag-blocking")
+        self.async_llm_client = AsyncLLMClient(self.llm_client, executor=self.executor)
+        
+        # Semantic reuse: one index over past questions, one over generated queries
+        self.semantic_cache = semantic_cache
+        self.query_semantic_cache = None
+        if semantic_cache is not None:
+            self.query_semantic_cache = SemanticCache(
+                embedder=semantic_cache.embedder,
+                threshold=semantic_cache.threshold,
+                approximate=semantic_cache.approximate,
+                max_entries=semantic_cache.max_entries,
+                ttl=semantic_cache.ttl
+            )
+        self.refiner = AnswerRefiner(self.async_llm_client, self._conduct_additional_research,
+                                     incremental_evaluation=incremental_evaluation, prejudge=prejudge)
         
         # Setup logging
         self.logger = self._setup_logger()
     
+    @classmethod
+    def from_env(cls, **kwargs) -> "RAGSystem":
+        """Create a RAG system configured from environment variables."""
+        config = dict(
+            tavily_api_key=os.getenv("TAVILY_API_KEY"),
+            tavily_base_url=os.getenv("TAVILY_BASE_URL", "https://api.tavily.com"),
+            llm_base_url=os.getenv("LLM_BASE_URL"),
+            llm_api_key=os.getenv("LLM_API_KEY"),
+            llm_model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+            logs_dir=os.getenv("LOGS_DIR", "logs"),
+            max_concurrency=int(os.getenv("MAX_CONCURRENCY", "4")),
+            session_time_budget=float(os.getenv("SESSION_TIME_BUDGET")) if os.getenv("SESSION_TIME_BUDGET") else None,
+            prompt_token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "6000")),
+            passages_per_query=int(os.getenv("PASSAGES_PER_QUERY", "8")),
+            corpus_min_coverage=float(os.getenv("CORPUS_MIN_COVERAGE", "0.75")),
+            corpus_max_age=float(os.getenv("CORPUS_MAX_AGE", str(7 * 24 * 3600))) or None,
+            merged_analysis=os.getenv("MERGED_ANALYSIS", "false").lower() in ("1", "true", "yes", "on"),
+            min_query_priority=int(os.getenv("MIN_QUERY_PRIORITY", "2")),
+            incremental_evaluation=os.getenv("INCREMENTAL_EVALUATION", "false").lower() in ("1", "true", "yes", "on"),
+            trace_dir=os.getenv("TRACE_DIR") or None,
+            blocking_workers=int(os.getenv("BLOCKING_WORKERS", "0")) or None
+        )
+        if "session_store" not in kwargs:
+            config["session_store"] = session_store_from_env()
+        if "session_logs" not in kwargs:
+            config["session_logs"] = session_log_writer_from_env(kwargs.get("logs_dir", config["logs_dir"]),
+                                                                 kwargs.get("session_store", config.get("session_store")))
+        if "corpus" not in kwargs:
+            config["corpus"] = corpus_from_env()
+        if "prejudge" not in kwargs:
+            config["prejudge"] = heuristic_judge_from_env()
+        if "search_cache" not in kwargs:
+            config["search_cache"] = cache_from_env("SEARCH_CACHE", "cache/search_cache.sqlite", default_ttl=6 * 3600)
+        if "llm_cache" not in kwargs:
+            config["llm_cache"] = cache_from_env("LLM_CACHE", "cache/llm_cache.sqlite", default_ttl=24 * 3600,
+                                                 default_enabled=False)
+        if "semantic_cache" not in kwargs and os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes", "on"):
+            config["semantic_cache"] = SemanticCache(
+                threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85")),
+                ttl=float(os.getenv("SEMANTIC_CACHE_TTL", str(6 * 3600))) or None,
+                approximate=os.getenv("SEMANTIC_CACHE_APPROXIMATE", "false").lower() in ("1", "true", "yes", "on")
+            )
+        # Process-wide upstream limits: rate buckets plus adaptive (AIMD) concurrency
+        if "search_rate_limiter" not in kwargs:
+            config["search_rate_limiter"] = upstream_limiter_from_env("TAVILY", "tavily")
+        if "llm_rate_limiter" not in kwargs:
+            config["llm_rate_limiter"] = upstream_limiter_from_env("LLM", "llm")
+        # Jittered retries within a per-call time budget, optionally hedged past a latency percentile
+        if "search_retry_policy" not in kwargs:
+            config["search_retry_policy"] = retry_policy_from_env("TAVILY", "tavily", default_budget=45.0,
+                                                                  max_attempt_timeout=30.0)
+        if "llm_retry_policy" not in kwargs:
+            config["llm_retry_policy"] = retry_policy_from_env("LLM", "llm", default_budget=90.0)
+        if os.getenv("LLM_CACHE_METHODS"):
+            config["llm_cached_methods"] = [m.strip() for m in os.getenv("LLM_CACHE_METHODS").split(",") if m.strip()]
+        config.update(kwargs)
+        return cls(**config)
+    
+    def _default_blocking_workers(self) -> int:
+        """Threads for as many LLM and search calls as the HTTP pool and upstream limiters admit at once,
+        as many again waiting on a limiter, and room for corpus lookups."""
+        pool = self.llm_client.http_pool.max_connections_per_host
+        workers = 0
+        for limiter in (self.llm_client.rate_limiter, self.search_client.rate_limiter):
+            cap = limiter.concurrency.max_limit if limiter.concurrency is not None else pool
+            workers += min(int(cap), pool)
+        return 2 * workers + 2 * self.max_concurrency
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics for the configured caches, plus upstream limiter state."""
+        stats = {}
+        if self.search_client.cache is not None:
+            stats["search"] = self.search_client.cache.stats()
+        if self.llm_client.response_cache is not None:
+            stats["llm"] = self.llm_client.response_cache.stats()
+        stats["upstream"] = {
+            "tavily": {**self.search_client.rate_limiter.stats(), **self.search_client.retry_policy.stats()},
+            "llm": {**self.llm_client.rate_limiter.stats(), **self.llm_client.retry_policy.stats()}
+        }
+        if self.corpus is not None:
+            stats["corpus"] = self.corpus.stats()
+        if self.refiner.prejudge is not None:
+            stats["prejudge"] = self.refiner.prejudge.stats()
+        stats["session_logs"] = self.session_logs.stats()
+        if self.semantic_cache is not None:
+            stats["semantic_questions"] = self.semantic_cache.stats()
+            stats["semantic_queries"] = self.query_semantic_cache.stats()
+        return stats
+    
+    def close(self):
+        """Release shared resources (pooled HTTP connections, corpus database, session logs and store)."""
+        self.llm_client.http_pool.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session_logs.close()
+        if self.session_store is not None:
+            self.session_store.close()
+        if self.corpus is not None:
+            self.corpus.close()
+    
     def _setup_logger(self) -> logging.Logger:
         """Setup logger for the RAG system."""
         logger = logging.getLogger("rag_system")
@@ -46,307 +225,542 @@ class RAGSystem:
         
         return logger
     
-    def _setup_session_logger(self, session_id: str) -> logging.Logger:
-        """Setup a session-specific logger that writes to a file."""
-        session_logger = logging.getLogger(f"session_{session_id}")
-        session_logger.setLevel(logging.INFO)
-        
-        # Remove existing handlers
-        for handler in session_logger.handlers[:]:
-            session_logger.removeHandler(handler)
-        
-        # Create file handler for this session
-        log_file = os.path.join(self.logs_dir, f"{session_id}.log")
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.INFO)
-        
-        # Create formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
-        )
-        file_handler.setFormatter(formatter)
-        
-        session_logger.addHandler(file_handler)
-        session_logger.propagate = False
-        
-        return session_logger
-    
-    async def _send_progress_update(self, 
-                            session_id: str, 
-                            step_number: int, 
-                            total_steps: int, 
-                            status: str, 
-                            message: str,
-                            progress_callback: Optional[Callable] = None):
-        """Send progress update via callback if provided."""
-        if progress_callback:
-            update = ProgressUpdate(
-                session_id=session_id,
-                step_number=step_number,
-                total_steps=total_steps,
-                status=status,
-                message=message,
-                timestamp=datetime.now()
-            )
-            await progress_callback(update)
-    
     async def research_question(self, 
                               question: str, 
                               session_id: Optional[str] = None,
                               progress_callback: Optional[Callable] = None,
                               num_searches: int = 3,
-                              num_rewordings: int = 3) -> RAGResponse:
-        """Main method to research a question using the RAG pipeline."""
+                              num_rewordings: int = 3,
+                              max_concurrency: Optional[int] = None,
+                              bypass_cache: bool = False,
+                              token_callback: Optional[Callable] = None,
+                              speculative_candidates: int = 0,
+                              deadline: Optional[Deadline] = None,
+                              merged_analysis: Optional[bool] = None) -> RAGResponse:
+        """Main method to research a question using the RAG pipeline.
+        
+        Blocking HTTP calls run in worker threads so the event loop stays free,
+        and at most ``max_concurrency`` upstream calls are in flight at once.
+        Set ``bypass_cache`` to force fresh searches (results still refresh the cache).
+        ``token_callback(delta, attempt)`` receives answer text as it streams; a new
+        ``attempt`` number means the previous draft is being replaced.
+        With ``speculative_candidates`` > 1, each refinement round generates that many
+        candidate answers in parallel and keeps the best-scoring one.
+        ``deadline`` bounds the whole session (default: ``session_time_budget``) and is
+        checked by every search and LLM call. When it expires, the best partial answer
+        is returned with ``partial=True``; cancelling it raises ``SessionCancelled``.
+        With ``merged_analysis`` (default: ``self.merged_analysis``), all queries' results
+        are analyzed in one LLM call instead of one call per query.
+        Stage timings, upstream calls, token usage and cache hits are returned in
+        ``metrics`` and, with ``trace_dir`` set, written there as a Chrome trace.
+        """
         
         # Generate session ID if not provided
         if not session_id:
             session_id = str(uuid.uuid4())
         
-        # Setup session logger
-        session_logger = self._setup_session_logger(session_id)
+        # Records are written by the session log writer's thread, not on the event loop
+        session_logger = self.session_logs.open_session(session_id)
         session_logger.info(f"Starting research session: {session_id}")
         session_logger.info(f"Question: {question}")
+        if self.session_store is not None:
+            self.session_logs.submit(self.session_store.start_session, session_id, question, time.time())
+        
+        session = ResearchSession(
+            session_id=session_id,
+            logger=session_logger,
+            max_concurrency=max_concurrency or self.max_concurrency,
+            progress_callback=progress_callback,
+            token_callback=token_callback,
+            bypass_cache=bypass_cache,
+            deadline=deadline or Deadline(self.session_time_budget),
+            merged_analysis=self.merged_analysis if merged_analysis is None else merged_analysis
+        )
         
-        research_steps = []
+        trace = SessionTrace(session_id)
         
+        # Tasks and worker threads started by the pipeline inherit the deadline and trace
+        deadline_token = current_deadline.set(session.deadline)
+        trace_token = current_trace.set(trace)
         try:
-            # Step 1: Generate search queries
-            await self._send_progress_update(session_id, 1, 6, "generating_queries", 
-                                     "🤖 Analyzing your question and generating search queries...", progress_callback)
-            session_logger.info("Generating search queries")
-            
-            queries = self.llm_client.generate_search_queries(question, num_queries=num_searches)
-            session_logger.info(f"Generated {len(queries)} queries: {queries}")
-            
-            await self._send_progress_update(session_id, 1, 6, "queries_generated", 
-                                     f"✅ Generated {len(queries)} targeted search queries", progress_callback)
-            
-            # Step 2: Perform searches
-            search_results_by_query = {}
-            total_queries = len(queries)
-            
-            for i, query in enumerate(queries, 1):
-                await self._send_progress_update(session_id, 2, 6, "searching", 
-                                       f"🔍 Searching for: \"{query[:60]}{'...' if len(query) > 60 else ''}\" ({i}/{total_queries})", progress_callback)
-                session_logger.info(f"Searching for query {i}/{total_queries}: {query}")
-                
-                search_results = self.search_client.search(query, max_results=3)
-                search_results_by_query[query] = search_results
-                
-                await self._send_progress_update(session_id, 2, 6, "search_complete", 
-                                       f"📄 Found {len(search_results)} results for search {i}/{total_queries}", progress_callback)
-            
-            await self._send_progress_update(session_id, 3, 6, "searches_complete", 
-                                     f"✅ Completed all {total_queries} web searches", progress_callback)
-            
-            # Step 3: Analyze results for each query
-            await self._send_progress_update(session_id, 4, 6, "analyzing", 
-                                     "🧠 Starting analysis of search results...", progress_callback)
-            session_logger.info("Analyzing search results")
-            
-            for i, (query, search_results) in enumerate(search_results_by_query.items(), 1):
-                await self._send_progress_update(session_id, 4, 6, "analyzing_query", 
-                                       f"🔬 Analyzing results for: \"{query[:50]}{'...' if len(query) > 50 else ''}\" ({i}/{len(search_results_by_query)})", progress_callback)
-                session_logger.info(f"Analyzing results for query: {query}")
-                
-                # Convert SearchResult objects to dict for LLM analysis
-                results_data = [
-                    {
-                        "title": result.title,
-                        "url": result.url,
-                        "content": result.content
-                    }
-                    for result in search_results
-                ]
-                
-                await self._send_progress_update(session_id, 4, 6, "processing_sources", 
-                                       f"📊 Processing {len(results_data)} sources for analysis {i}/{len(search_results_by_query)}", progress_callback)
-                
-                analysis = self.llm_client.analyze_search_results(query, results_data)
-                
-                research_step = ResearchStep(
-                    step_number=i,
-                    query=query,
-                    search_results=search_results,
-                    analysis=analysis,
-                    timestamp=datetime.now()
-                )
-                
-                research_steps.append(research_step)
-                session_logger.info(f"Completed analysis for step {i}")
-                
-                await self._send_progress_update(session_id, 4, 6, "analysis_complete", 
-                                       f"✅ Completed analysis {i}/{len(search_results_by_query)}", progress_callback)
-            
-            await self._send_progress_update(session_id, 5, 6, "all_analysis_complete", 
-                                     "✅ All search result analysis completed", progress_callback)
-            
-            # Step 5: Synthesize and evaluate answers with LLM judge
-            await self._send_progress_update(session_id, 6, 6, "synthesizing", 
-                                     "🔗 Synthesizing answer and evaluating quality...", progress_callback)
-            session_logger.info("Starting synthesis and evaluation loop")
-            
-            # Prepare research data for synthesis
-            research_data = [
-                {
-                    "query": step.query,
-                    "analysis": step.analysis
-                }
-                for step in research_steps
-            ]
-            
-            # Prepare research context for evaluation
-            research_context = "\n\n".join([
-                f"Query: {step.query}\nAnalysis: {step.analysis}"
-                for step in research_steps
-            ])
-            
-            # Main evaluation loop - max iterations to prevent infinite loops
-            max_iterations = num_rewordings
-            current_iteration = 0
-            final_answer = None
-            evaluation_result = None
-            
-            while current_iteration < max_iterations:
-                current_iteration += 1
-                iteration_msg = f" (attempt {current_iteration}/{max_iterations})" if current_iteration > 1 else ""
-                
-                await self._send_progress_update(session_id, 6, 6, "synthesizing", 
-                                       f"📝 Generating comprehensive answer{iteration_msg}...", progress_callback)
-                
-                # Generate answer based on iteration type
-                if current_iteration == 1:
-                    # First attempt - normal synthesis
-                    final_answer = self.llm_client.synthesize_final_answer(question, research_data)
-                    session_logger.info(f"Generated initial answer (iteration {current_iteration})")
-                elif evaluation_result and evaluation_result.action == EvaluationAction.REDO_FINAL_RESPONSE:
-                    # Redo with guidance from previous evaluation
-                    final_answer = self.llm_client.regenerate_answer_with_guidance(
-                        question, research_data, evaluation_result.improvement_guidance or "Improve clarity and completeness"
-                    )
-                    session_logger.info(f"Regenerated answer with guidance (iteration {current_iteration})")
-                elif evaluation_result and evaluation_result.action == EvaluationAction.RESEARCH_AGAIN:
-                    # Research additional topics as suggested by evaluation
-                    await self._send_progress_update(session_id, 6, 6, "additional_research", 
-                                           f"🔍 Conducting additional research{iteration_msg}...", progress_callback)
-                    
-                    if evaluation_result.missing_topics:
-                        additional_research = await self._conduct_additional_research(
-                            evaluation_result.missing_topics, session_id, progress_callback, session_logger
-                        )
-                        # Add new research to existing data
-                        research_data.extend(additional_research)
-                        # Update research context
-                        research_context = "\n\n".join([
-                            f"Query: {item['query']}\nAnalysis: {item['analysis']}"
-                            for item in research_data
-                        ])
-                    
-                    # Now synthesize with enhanced research
-                    final_answer = self.llm_client.synthesize_final_answer(question, research_data)
-                    session_logger.info(f"Generated answer with additional research (iteration {current_iteration})")
-                
-                # Evaluate the answer using LLM as judge
-                await self._send_progress_update(session_id, 6, 6, "evaluating", 
-                                       f"⚖️ Evaluating answer quality{iteration_msg}...", progress_callback)
-                
-                evaluation_result = self.llm_client.evaluate_answer(question, final_answer, research_context)
-                
-                session_logger.info(f"Evaluation result (iteration {current_iteration}): "
-                                  f"Action={evaluation_result.action.value}, "
-                                  f"Score={evaluation_result.overall_score:.1f}, "
-                                  f"Reasoning={evaluation_result.reasoning}")
-                
-                # Check if we should return the answer
-                if evaluation_result.action == EvaluationAction.SUFFICIENT:
-                    await self._send_progress_update(session_id, 6, 6, "evaluation_passed", 
-                                           f"✅ Answer quality approved (score: {evaluation_result.overall_score:.1f}/10)", progress_callback)
-                    break
-                elif current_iteration >= max_iterations:
-                    await self._send_progress_update(session_id, 6, 6, "max_iterations", 
-                                           f"⚠️ Reached maximum iterations - using best available answer", progress_callback)
-                    session_logger.warning(f"Reached maximum evaluation iterations ({max_iterations})")
-                    break
-                else:
-                    action_msg = {
-                        EvaluationAction.REDO_FINAL_RESPONSE: "improving answer structure",
-                        EvaluationAction.RESEARCH_AGAIN: "conducting additional research"
-                    }.get(evaluation_result.action, "refining answer")
-                    
-                    await self._send_progress_update(session_id, 6, 6, "improvement_needed", 
-                                           f"🔄 Score {evaluation_result.overall_score:.1f}/10 - {action_msg}...", progress_callback)
-            
-            session_logger.info("Research and evaluation completed successfully")
-            
-            await self._send_progress_update(session_id, 6, 6, "finalizing", 
-                                     "✨ Finalizing comprehensive research report...", progress_callback)
-            
-            # Create response with evaluation metrics
-            response = RAGResponse(
-                answer=final_answer,
-                research_steps=research_steps,
-                session_id=session_id,
-                total_steps=len(research_steps),
-                timestamp=datetime.now(),
-                evaluation_result=evaluation_result
-            )
-            
-            await self._send_progress_update(session_id, 6, 6, "completed", 
-                                     f"🎉 Research completed! Quality score: {evaluation_result.overall_score:.1f}/10", progress_callback)
-            
-            return response
-            
+            pipeline = asyncio.create_task(self._run_pipeline(
+                question, session, num_searches, num_rewordings, speculative_candidates
+            ))
+        finally:
+            current_trace.reset(trace_token)
+            current_deadline.reset(deadline_token)
+        loop = asyncio.get_running_loop()
+        session.deadline.add_cancel_callback(lambda: loop.call_soon_threadsafe(pipeline.cancel))
+        
+        outcome, response, error = "error", None, None
+        try:
+            response = await asyncio.wait_for(pipeline, timeout=session.deadline.remaining())
+            outcome = "complete"
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            session_logger.warning("Time budget exceeded; returning partial answer")
+            response = await self._partial_response(question, session)
+            outcome = "partial"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            # Already set when Deadline.cancel() stopped the pipeline; otherwise our caller cancelled us
+            cancelled_by_deadline = session.deadline.cancelled
+            # Stop worker threads at their next check, whoever cancelled us
+            session.deadline.cancel()
+            if not cancelled_by_deadline:
+                session_logger.info("Research session cancelled")
+                raise
+            raise SessionCancelled("Research session was cancelled")
         except Exception as e:
+            if isinstance(e, SessionCancelled):
+                outcome = "cancelled"
+            error = str(e)
             session_logger.error(f"Research failed: {e}")
-            await self._send_progress_update(session_id, 0, 4, "error", 
-                                     f"Research failed: {str(e)}", progress_callback)
+            await session.progress(0, 4, "error", f"Research failed: {str(e)}")
             raise
+        finally:
+            self._finish_trace(trace, outcome, session_logger)
+            if response is not None:
+                response.metrics = trace.summary()
+            self._record_session(session_id, outcome, response, error)
+            self.session_logs.close_session(session_logger)
+        
+        return response
     
-    async def _conduct_additional_research(self, 
-                                          missing_topics: List[str], 
-                                          session_id: str,
-                                          progress_callback: Optional[Callable],
-                                          session_logger: logging.Logger) -> List[Dict[str, Any]]:
-        """Conduct additional research on missing topics."""
-        additional_research = []
-        
-        for i, topic in enumerate(missing_topics, 1):
-            await self._send_progress_update(session_id, 6, 6, "additional_search", 
-                                   f"🔍 Researching additional topic: \"{topic[:50]}{'...' if len(topic) > 50 else ''}\" ({i}/{len(missing_topics)})", progress_callback)
-            
-            session_logger.info(f"Conducting additional research on: {topic}")
-            
-            # Search for the missing topic
-            search_results = self.search_client.search(topic, max_results=2)
-            
-            # Convert SearchResult objects to dict for analysis
-            results_data = [
-                {
-                    "title": result.title,
-                    "url": result.url,
-                    "content": result.content
-                }
-                for result in search_results
-            ]
-            
-            # Analyze the additional research
-            analysis = self.llm_client.analyze_search_results(topic, results_data)
+    def _record_session(self, session_id: str, outcome: str, response: Optional[RAGResponse], error: Optional[str]):
+        """Queue the session's outcome and result for the session store (written on the log writer's thread)."""
+        if self.session_store is None:
+            return
+        score = None
+        if response is not None and response.evaluation_result is not None:
+            score = response.evaluation_result.overall_score
+        result = response.model_dump(mode="json") if response is not None else None
+        self.session_logs.submit(self.session_store.finish_session, session_id, outcome, score, result, error)
+    
+    def _finish_trace(self, trace: SessionTrace, outcome: str, session_logger: logging.Logger):
+        """Record the session duration and write its Chrome trace if configured."""
+        SESSION_SECONDS.observe(time.perf_counter() - trace.started, outcome=outcome)
+        if not self.trace_dir:
+            return
+        try:
+            path = trace.write_chrome_trace(self.trace_dir)
+            session_logger.info(f"Wrote Chrome trace to {path}")
+        except OSError as e:
+            session_logger.warning(f"Could not write Chrome trace: {e}")
+    
+    async def _run_pipeline(self,
+                            question: str,
+                            session: ResearchSession,
+                            num_searches: int,
+                            num_rewordings: int,
+                            speculative_candidates: int) -> RAGResponse:
+        """Research, synthesize and evaluate; the body of ``research_question``."""
+        session_logger = session.logger
+        
+        # Reuse research from a near-duplicate earlier question when possible
+        research_steps = None
+        if self.semantic_cache is not None and not session.bypass_cache:
+            match = self.semantic_cache.lookup(question)
+            record_cache_lookup("semantic_question", bool(match))
+            if match:
+                prior_steps, similarity, prior_question = match
+                research_steps = [step.model_copy() for step in prior_steps]
+                session.research_steps = list(research_steps)
+                session_logger.info(f"Reusing research from similar question ({similarity:.2f}): {prior_question}")
+                await session.progress(5, 6, "research_reused", 
+                                       f"♻️ Reusing research from a similar earlier question (similarity {similarity:.2f})")
+        
+        if research_steps is None:
+            research_steps = await self._gather_research(question, num_searches, session)
+            if self.semantic_cache is not None:
+                self.semantic_cache.add(question, research_steps)
+        
+        await session.progress(5, 6, "all_analysis_complete", "✅ All search result analysis completed")
+        
+        # Step 5: Synthesize and evaluate answers with LLM judge
+        await session.progress(6, 6, "synthesizing", "🔗 Synthesizing answer and evaluating quality...")
+        session_logger.info("Starting synthesis and evaluation loop")
+        
+        # Prepare research data for synthesis
+        research_data = [
+            {
+                "query": step.query,
+                "analysis": step.analysis
+            }
+            for step in research_steps
+        ]
+        
+        final_answer, evaluation_result = await self.refiner.refine(
+            question, research_data, session, max_iterations=num_rewordings,
+            speculative_candidates=speculative_candidates
+        )
+        
+        session_logger.info("Research and evaluation completed successfully")
+        if session.retriever.duplicate_sources:
+            session_logger.info(f"Skipped {session.retriever.duplicate_sources} duplicate or near-duplicate sources")
+        
+        await session.progress(6, 6, "finalizing", "✨ Finalizing comprehensive research report...")
+        
+        # Create response with evaluation metrics
+        response = RAGResponse(
+            answer=final_answer,
+            research_steps=research_steps,
+            session_id=session.session_id,
+            total_steps=len(research_steps),
+            timestamp=datetime.now(),
+            evaluation_result=evaluation_result
+        )
+        
+        await session.progress(6, 6, "completed", 
+                               f"🎉 Research completed! Quality score: {evaluation_result.overall_score:.1f}/10")
+        
+        return response
+    
+    async def _partial_response(self, question: str, session: ResearchSession) -> RAGResponse:
+        """Best answer available when the time budget ran out."""
+        research_steps = sorted(session.research_steps, key=lambda step: step.step_number)
+        if session.best_answer:
+            answer = session.best_answer
+        elif research_steps:
+            findings = "\n\n".join(f"**{step.query}**\n{step.analysis}" for step in research_steps)
+            answer = f"The time budget ran out before a final answer was written. Findings so far:\n\n{findings}"
+        else:
+            answer = "The time budget ran out before any research was completed."
+        
+        await session.progress(6, 6, "deadline_exceeded", "⏱️ Time budget reached - returning the best answer so far")
+        return RAGResponse(
+            answer=answer,
+            research_steps=research_steps,
+            session_id=session.session_id,
+            total_steps=len(research_steps),
+            timestamp=datetime.now(),
+            evaluation_result=session.best_evaluation,
+            partial=True
+        )
+    
+    async def _gather_research(self, question: str, num_searches: int, session: ResearchSession) -> List[ResearchStep]:
+        """Generate search queries, then search and analyze each one."""
+        # Step 1: Generate search queries
+        await session.progress(1, 6, "generating_queries", "🤖 Analyzing your question and generating search queries...")
+        session.logger.info("Generating search queries")
+        
+        with span("query_generation"):
+            planned = await self.async_llm_client.plan_search_queries(question, num_searches)
+        search_plan = self._select_queries(planned, session)
+        queries = [planned_query.query for planned_query in search_plan]
+        depths = {planned_query.query: planned_query.search_depth for planned_query in search_plan}
+        session.logger.info(f"Generated {len(queries)} queries: {queries}")
+        
+        await session.progress(1, 6, "queries_generated", f"✅ Generated {len(queries)} targeted search queries")
+        
+        # Steps 2-4: Search and analyze every query concurrently. Each query's
+        # analysis starts as soon as its own search returns.
+        total_queries = len(queries)
+        
+        await session.progress(2, 6, "searching", f"🔍 Running {total_queries} web searches in parallel...")
+        
+        if session.merged_analysis and total_queries > 1:
+            return await self._research_queries_merged(queries, depths, session)
+        
+        return await self._gather_or_cancel([
+            self._research_query(i, query, total_queries, session, depths[query])
+            for i, query in enumerate(queries, 1)
+        ])
+    
+    def _select_queries(self, planned: List[SearchQuery], session: ResearchSession) -> List[SearchQuery]:
+        """Drop duplicate and low-priority planned searches, always keeping the most important one."""
+        selected, seen = set(), set()
+        for index, planned_query in sorted(enumerate(planned), key=lambda item: -item[1].priority):
+            key = normalize_query(planned_query.query)
+            if key in seen:
+                continue
+            seen.add(key)
+            if selected and planned_query.priority < self.min_query_priority:
+                session.logger.info(f"Skipping low-priority search ({planned_query.priority}): {planned_query.query}")
+                continue
+            selected.add(index)
+        # Keep the planner's order for step numbering; compared by position, since equal
+        # models (exact duplicates) would otherwise all be kept
+        return [planned_query for index, planned_query in enumerate(planned) if index in selected]
+    
+    async def _research_query(self,
+                              step_number: int,
+                              query: str,
+                              total_queries: int,
+                              session: ResearchSession,
+                              search_depth: str = "basic") -> ResearchStep:
+        """Search a single query and analyze its results."""
+        short_query = f"{query[:50]}{'...' if len(query) > 50 else ''}"
+        
+        reused_step = await self._reuse_query_research(step_number, query, total_queries, session)
+        if reused_step is not None:
+            return reused_step
+        
+        search_results = await self._search_for_step(step_number, query, total_queries, session, search_depth)
+        
+        await session.progress(4, 6, "analyzing_query", 
+                               f"🔬 Analyzing {len(search_results)} sources for: \"{short_query}\" ({step_number}/{total_queries})")
+        session.logger.info(f"Analyzing results for query: {query}")
+        
+        analysis, shared = await self._analyze(query, search_results, session)
+        
+        session.logger.info(f"Completed analysis for step {step_number}")
+        await session.progress(4, 6, "analysis_complete", f"✅ Completed analysis {step_number}/{total_queries}")
+        
+        return self._record_step(step_number, query, search_results, analysis, session, cacheable=not shared)
+    
+    async def _research_queries_merged(self, queries: List[str], depths: Dict[str, str],
+                                       session: ResearchSession) -> List[ResearchStep]:
+        """Search every query concurrently, then analyze all of their results in a single LLM call."""
+        total_queries = len(queries)
+        
+        async def search_one(step_number: int, query: str):
+            reused_step = await self._reuse_query_research(step_number, query, total_queries, session)
+            if reused_step is not None:
+                return reused_step
+            return await self._search_for_step(step_number, query, total_queries, session, depths[query])
+        
+        fetched = await self._gather_or_cancel([search_one(i, query) for i, query in enumerate(queries, 1)])
+        
+        steps: Dict[int, ResearchStep] = {}
+        pending, shared = [], []
+        for step_number, (query, outcome) in enumerate(zip(queries, fetched), 1):
+            if isinstance(outcome, ResearchStep):
+                steps[step_number] = outcome
+                continue
+            passages = self._select_passages(query, outcome, session)
+            if passages is None:
+                shared.append((step_number, query, outcome))
+            else:
+                pending.append((step_number, query, outcome, passages))
+        
+        loop = asyncio.get_running_loop()
+        futures = {query: loop.create_future() for _, query, _, _ in pending}
+        session.analyses.update(futures)
+        try:
+            await self._analyze_merged(pending, futures, steps, session)
+        finally:
+            # Queries waiting on an analysis that never came fall back to a reference
+            for future in futures.values():
+                if not future.done():
+                    future.cancel()
+        
+        for step_number, query, search_results in shared:
+            analysis = await self._shared_analysis(query, session)
+            steps[step_number] = self._record_step(step_number, query, search_results, analysis, session,
+                                                   cacheable=False)
+        
+        return [steps[step_number] for step_number in sorted(steps)]
+    
+    async def _analyze_merged(self, pending: List[Tuple[int, str, List[SearchResult], List[Dict[str, Any]]]],
+                              futures: Dict[str, asyncio.Future], steps: Dict[int, ResearchStep],
+                              session: ResearchSession):
+        """Analyze every pending query's passages in one LLM call, resolving each query's future."""
+        if not pending:
+            return
+        await session.progress(4, 6, "analyzing_query",
+                               f"🔬 Analyzing sources for {len(pending)} queries in one pass...")
+        try:
+            with span("merged_analysis", queries=len(pending)):
+                async with session.semaphore:
+                    analyses = await self.async_llm_client.analyze_all_search_results(
+                        [(query, passages) for _, query, _, passages in pending]
+                    )
+        except ValueError as e:
+            # Fall back to one analysis call per query
+            session.logger.warning(f"Merged analysis failed, analyzing queries separately: {e}")
+            analyses = await self._gather_or_cancel([
+                self._analyze_passages(query, passages, session) for _, query, _, passages in pending
+            ])
+        for (step_number, query, search_results, _), analysis in zip(pending, analyses):
+            if not futures[query].done():
+                futures[query].set_result(analysis)
+            steps[step_number] = self._record_step(step_number, query, search_results, analysis, session)
+        await session.progress(4, 6, "analysis_complete", f"✅ Completed analysis of {len(pending)} queries")
+    
+    async def _reuse_query_research(self, step_number: int, query: str, total_queries: int,
+                                    session: ResearchSession) -> Optional[ResearchStep]:
+        """Earlier research for a near-duplicate query, if the semantic cache has one."""
+        if self.query_semantic_cache is None or session.bypass_cache:
+            return None
+        match = self.query_semantic_cache.lookup(query)
+        record_cache_lookup("semantic_query", bool(match))
+        if not match:
+            return None
+        prior_step, similarity, prior_query = match
+        short_query = f"{query[:50]}{'...' if len(query) > 50 else ''}"
+        session.logger.info(f"Reusing research for query {step_number} from \"{prior_query}\" ({similarity:.2f})")
+        await session.progress(4, 6, "analysis_complete", 
+                               f"♻️ Reused earlier research for: \"{short_query}\" ({step_number}/{total_queries})")
+        research_step = prior_step.model_copy(update={"step_number": step_number})
+        session.research_steps.append(research_step)
+        return research_step
+    
+    async def _search_for_step(self, step_number: int, query: str, total_queries: int,
+                               session: ResearchSession, search_depth: str = "basic") -> List[SearchResult]:
+        session.logger.info(f"Searching for query {step_number}/{total_queries} ({search_depth}): {query}")
+        search_results = await self._search(query, 3, session, search_depth)
+        await session.progress(3, 6, "search_complete", 
+                               f"📄 Found {len(search_results)} results for search {step_number}/{total_queries}")
+        return search_results
+    
+    def _record_step(self, step_number: int, query: str, search_results: List[SearchResult], analysis: str,
+                     session: ResearchSession, cacheable: bool = True) -> ResearchStep:
+        """Build a ResearchStep and remember it for partial answers and (if ``cacheable``) semantic reuse."""
+        research_step = ResearchStep(
+            step_number=step_number,
+            query=query,
+            # Passages are already indexed; full page text would only bloat the step and the caches holding it
+            search_results=[result.model_copy(update={"raw_content": None}) if result.raw_content else result
+                            for result in search_results],
+            analysis=analysis,
+            timestamp=datetime.now()
+        )
+        if self.query_semantic_cache is not None and cacheable:
+            self.query_semantic_cache.add(query, research_step)
+        session.research_steps.append(research_step)
+        return research_step
+    
+    async def _conduct_additional_research(self, missing_topics: List[str], session: ResearchSession) -> List[Dict[str, Any]]:
+        """Conduct additional research on missing topics concurrently."""
+        
+        async def research_topic(i: int, topic: str) -> Dict[str, Any]:
+            await session.progress(6, 6, "additional_search", 
+                                   f"🔍 Researching additional topic: \"{topic[:50]}{'...' if len(topic) > 50 else ''}\" ({i}/{len(missing_topics)})")
+            session.logger.info(f"Conducting additional research on: {topic}")
             
-            additional_research.append({
-                "query": topic,
-                "analysis": analysis
-            })
+            search_results = await self._search(topic, 2, session)
+            analysis, _ = await self._analyze(topic, search_results, session)
             
-            session_logger.info(f"Completed additional research for: {topic}")
+            session.logger.info(f"Completed additional research for: {topic}")
+            return {"query": topic, "analysis": analysis}
         
-        return additional_research
+        with span("additional_research", topics=len(missing_topics)):
+            return await self._gather_or_cancel([
+                research_topic(i, topic) for i, topic in enumerate(missing_topics, 1)
+            ])
     
-    def get_session_logs(self, session_id: str) -> Optional[str]:
-        """Get the logs for a specific session."""
-        log_file = os.path.join(self.logs_dir, f"{session_id}.log")
-        
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                return f.read()
+    async def _search(self, query: str, max_results: int, session: ResearchSession,
+                      search_depth: str = "basic") -> List[SearchResult]:
+        """Search the local corpus first; call Tavily only when it does not cover the query."""
+        with span("search", query=query):
+            if self.corpus is not None and not session.bypass_cache:
+                local_results = await run_blocking(
+                    self.executor, self.corpus.lookup, query, max_results=max_results,
+                    min_coverage=self.corpus_min_coverage, max_age=self.corpus_max_age
+                )
+                record_cache_lookup("corpus", bool(local_results))
+                if local_results:
+                    session.logger.info(f"Served search from local corpus: {query}")
+                    return local_results
+            
+            async with session.semaphore:
+                search_results = await run_blocking(
+                    self.executor, self.search_client.search, query, max_results=max_results, search_depth=search_depth,
+                    bypass_cache=session.bypass_cache
+                )
+            if self.corpus is not None:
+                await run_blocking(self.executor, self.corpus.ingest, search_results)
+            return search_results
+    
+    def _select_passages(self, query: str, search_results: List[SearchResult],
+                         session: ResearchSession) -> Optional[List[Dict[str, Any]]]:
+        """Index the results' page content and return the passages most relevant to ``query``.
         
-        return None
+        Passages come from every unique page fetched so far in the session, and each
+        passage goes to only one analysis. Returns None when every relevant passage
+        was already analyzed for another query. Falls back to whole result snippets
+        when retrieval is off or finds nothing.
+        """
+        if self.passages_per_query <= 0:
+            return self._results_to_data(search_results)
+        session.retriever.add_results(search_results)
+        passages = session.retriever.retrieve(query, k=self.passages_per_query)
+        if passages is None:
+            session.logger.info(f"All relevant sources already analyzed this session for: {query}")
+            return None
+        session.logger.info(f"Selected top {self.passages_per_query} passages from {len(passages)} sources for: {query}")
+        return passages or self._results_to_data(search_results)
+    
+    async def _analyze(self, query: str, search_results: List[SearchResult],
+                       session: ResearchSession) -> Tuple[str, bool]:
+        """Analyze the passages selected for ``query``; returns the analysis and whether it is shared.
+
+        If every relevant passage was already analyzed for other queries, the LLM is
+        skipped and their analyses are shared instead.
+        """
+        passages = self._select_passages(query, search_results, session)
+        if passages is None:
+            return await self._shared_analysis(query, session), True
+        # Registered before awaiting so later queries covered by these passages can wait for it
+        analysis = asyncio.ensure_future(self._analyze_passages(query, passages, session))
+        session.analyses[query] = analysis
+        return await analysis, False
+    
+    async def _shared_analysis(self, query: str, session: ResearchSession) -> str:
+        """The analyses of the queries that were given ``query``'s passages, or a reference to those queries."""
+        owners = session.retriever.covering_queries(query, self.passages_per_query)
+        futures = [session.analyses[owner] for owner in owners if owner in session.analyses]
+        if futures:
+            # Waiting must not cancel the owners' analyses if this session step is cancelled
+            await asyncio.wait(futures)
+        analyses = [(owner, session.analyses[owner].result()) for owner in owners
+                    if owner in session.analyses and not session.analyses[owner].cancelled()
+                    and session.analyses[owner].exception() is None]
+        if not analyses:
+            return ALREADY_ANALYZED.format(queries=", ".join(f'"{owner}"' for owner in owners) or "other queries")
+        if len(analyses) == 1:
+            return analyses[0][1]
+        return "\n\n".join(f"From the analysis of \"{owner}\":\n{analysis}" for owner, analysis in analyses)
+    
+    async def _analyze_passages(self, query: str, passages: List[Dict[str, Any]], session: ResearchSession) -> str:
+        with span("analysis", query=query):
+            async with session.semaphore:
+                return await self.async_llm_client.analyze_search_results(query, passages)
+    
+    @staticmethod
+    def _results_to_data(search_results: List[SearchResult]) -> List[Dict[str, Any]]:
+        """Convert SearchResult objects to dicts for LLM analysis."""
+        return [
+            {
+                "title": result.title,
+                "url": result.url,
+                "content": result.content
+            }
+            for result in search_results
+        ]
+    
+    @staticmethod
+    async def _gather_or_cancel(coroutines: List) -> List[Any]:
+        """Run coroutines concurrently, preserving order; cancel the rest if one fails."""
+        tasks = [asyncio.create_task(coro) for coro in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    
+    def get_session_logs(self, session_id: str, after: int = 0, limit: int = 500) -> Optional[List[Dict[str, Any]]]:
+        """A page of a session's log events with ids above ``after``, or None if the session is unknown.
+
+        Events come from the session store; without one, they are read from the session's log file.
+        """
+        self.session_logs.flush()
+        if self.session_store is not None:
+            events = self.session_store.get_events(session_id, after, limit)
+            if events or self.session_store.get_session(session_id) is not None:
+                return events
+            return None
+        log_file = self.session_logs.path(session_id)
+        if not os.path.exists(log_file):
+            return None
+        events = []
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if number <= after:
+                    continue
+                if len(events) >= limit:
+                    break
+                events.append({"id": number, **json.loads(line)})
+        return events
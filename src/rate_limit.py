@@ -0,0 +1,264 @@
+"""
+Rate limiting for upstream APIs.
+Limiters are thread-safe because client calls run in worker threads. Every wait
+is bounded by the current session's deadline and stops when it is cancelled.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Iterator
+
+from .deadline import Deadline, current_deadline
+
+# Longest single sleep while waiting, so cancellation is noticed promptly
+WAIT_SLICE = 0.25
+
+
+def _wait_slice(wait: float, deadline: Optional[Deadline]) -> float:
+    """Check ``deadline`` and return how long to sleep before looking again."""
+    if deadline is None:
+        return wait
+    deadline.check()
+    remaining = deadline.remaining()
+    return min(wait, WAIT_SLICE, remaining if remaining is not None else wait)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` requests per second with bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, deadline: Optional[Deadline] = None):
+        """Block until ``tokens`` are available, then consume them; raises if ``deadline`` runs out first."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(_wait_slice(wait, deadline))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class UpstreamError(Exception):
+    """An upstream API answered with an error status."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def overloaded(self) -> bool:
+        """True for responses that mean "slow down" (429 and 5xx)."""
+        return self.status_code is not None and (self.status_code == 429 or self.status_code >= 500)
+
+
+def raise_for_upstream_status(response, message: str):
+    """Raise ``UpstreamError`` (with status and Retry-After) for an HTTP error response."""
+    if response.status_code >= 400:
+        raise UpstreamError(
+            f"{message}: {response.status_code} {response.reason}",
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get("Retry-After"))
+        )
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit: grows by ~1 per window of successes, halves on overload."""
+
+    def __init__(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 backoff_ratio: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._last_backoff = 0.0
+
+    def acquire(self, deadline: Optional[Deadline] = None):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    self._condition.wait(_wait_slice(WAIT_SLICE, deadline))
+            if deadline is not None:
+                deadline.check()
+            self.in_flight += 1
+
+    def release(self, overloaded: bool = False):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                # Back off at most once per second so a burst of failures from the same
+                # window does not collapse the limit to the floor
+                if now - self._last_backoff >= 1.0:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                    self._last_backoff = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class Permit:
+    """Outcome of one request made under an ``UpstreamLimiter.permit``."""
+
+    def __init__(self, waited: float = 0.0, deadline: Optional[Deadline] = None):
+        self.status_code: Optional[int] = None
+        self.retry_after: Optional[float] = None
+        self.waited = waited
+        self.deadline = deadline
+
+    def timeout(self, timeout: float, minimum: float = 1.0) -> float:
+        """``timeout`` (worked out before the permit was granted) less the time spent waiting for it,
+        capped by the session deadline."""
+        timeout = max(timeout - self.waited, min(timeout, minimum))
+        remaining = self.deadline.remaining() if self.deadline is not None else None
+        return min(timeout, remaining) if remaining is not None else timeout
+
+    def record(self, status_code: Optional[int], retry_after: Optional[float] = None):
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def record_response(self, response):
+        """Record the status and any ``Retry-After`` header of an HTTP response."""
+        self.record(response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+
+
+class UpstreamLimiter:
+    """Everything that gates calls to one upstream API, shared by all sessions.
+
+    Combines a requests/second bucket, a tokens/minute bucket, an optional AIMD
+    concurrency limit and a global pause while a ``Retry-After`` is in effect.
+    Use ``with limiter.permit(tokens) as permit`` around each request and report
+    the outcome with ``permit.record(status_code, retry_after)``.
+    """
+
+    def __init__(self, name: str,
+                 requests_per_second: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 concurrency: Optional[AdaptiveConcurrencyLimiter] = None):
+        self.name = name
+        self.request_bucket = RateLimiter(requests_per_second) if requests_per_second else None
+        self.token_bucket = RateLimiter(tokens_per_minute / 60.0, burst=tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = concurrency
+        self.throttled = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        """Hold back every new request for ``seconds`` (e.g. from a Retry-After header)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_for_pause(self, deadline: Optional[Deadline] = None):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(_wait_slice(remaining, deadline))
+
+    def acquire(self, tokens: float = 0, deadline: Optional[Deadline] = None):
+        """Wait for the pause, rate buckets and concurrency limit; raises if ``deadline`` runs out first."""
+        self._wait_for_pause(deadline)
+        if self.request_bucket is not None:
+            self.request_bucket.acquire(deadline=deadline)
+        if self.token_bucket is not None and tokens:
+            self.token_bucket.acquire(min(tokens, self.token_bucket.capacity), deadline=deadline)
+        if self.concurrency is not None:
+            self.concurrency.acquire(deadline)
+        elif deadline is not None:
+            # The session may have been cancelled while the request was held back
+            deadline.check()
+
+    def release(self, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                failed: bool = False):
+        overloaded = status_code is not None and (status_code == 429 or status_code >= 500)
+        if status_code == 429:
+            with self._lock:
+                self.throttled += 1
+        if retry_after:
+            self.pause(retry_after)
+        if self.concurrency is not None:
+            self.concurrency.release(overloaded=overloaded or failed)
+
+    @contextmanager
+    def permit(self, tokens: float = 0) -> Iterator["Permit"]:
+        """Hold a permit for one request, waiting at most until the current session's deadline.
+
+        Send the request with ``permit.timeout(timeout)`` so time spent waiting is
+        taken off the attempt's timeout.
+        """
+        deadline = current_deadline.get()
+        started = time.monotonic()
+        self.acquire(tokens, deadline)
+        permit = Permit(time.monotonic() - started, deadline)
+        try:
+            yield permit
+        except Exception as e:
+            if isinstance(e, UpstreamError) and permit.status_code is None:
+                permit.record(e.status_code, e.retry_after)
+            # Timeouts and dropped connections are treated as overload signals too
+            self.release(permit.status_code, permit.retry_after, failed=permit.status_code is None)
+            raise
+        else:
+            self.release(permit.status_code, permit.retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2) if self.concurrency else None,
+            "in_flight": self.concurrency.in_flight if self.concurrency else None,
+            "throttled": self.throttled,
+            "paused_for": round(max(self._paused_until - time.monotonic(), 0.0), 2)
+        }
+
+
+def upstream_limiter_from_env(prefix: str, name: str, default_max_in_flight: int = 10) -> UpstreamLimiter:
+    """Build an ``UpstreamLimiter`` from ``{prefix}_RATE_LIMIT``, ``{prefix}_TOKENS_PER_MINUTE``,
+    ``{prefix}_MAX_IN_FLIGHT`` and ``ADAPTIVE_CONCURRENCY``."""
+    rate = os.getenv(f"{prefix}_RATE_LIMIT")
+    tokens_per_minute = os.getenv(f"{prefix}_TOKENS_PER_MINUTE")
+    concurrency = None
+    if os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() in ("1", "true", "yes", "on"):
+        max_in_flight = int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", str(default_max_in_flight)))
+        concurrency = AdaptiveConcurrencyLimiter(initial_limit=max(max_in_flight // 2, 1), max_limit=max_in_flight)
+    return UpstreamLimiter(
+        name,
+        requests_per_second=float(rate) if rate else None,
+        tokens_per_minute=float(tokens_per_minute) if tokens_per_minute else None,
+        concurrency=concurrency
+    )
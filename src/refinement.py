@@ -0,0 +1,278 @@
+"""
+Answer refinement loop: synthesize, judge, and improve until the answer is sufficient.
+Supports a speculative mode that races several candidate answers per round, and an
+incremental judge mode that re-evaluates only what changed since the last round.
+"""
+import re
+import asyncio
+import difflib
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from .models import EvaluationResult, EvaluationAction
+from .async_llm_client import AsyncLLMClient
+from .research_session import ResearchSession
+from .prejudge import HeuristicJudge
+from .instrumentation import span
+from .deadline import DeadlineExceeded, SessionCancelled
+
+
+# Speculative candidates vary both sampling temperature and emphasis
+CANDIDATE_TEMPERATURES = [0.6, 0.3, 0.9, 0.45, 0.75]
+CANDIDATE_STYLES = [
+    None,
+    "Prioritize completeness: address every aspect of the question.",
+    "Prioritize clarity: give a well-structured, concise answer.",
+    "Prioritize accuracy: stay close to the research data and cite sources."
+]
+
+
+def format_research_context(research_data: List[Dict[str, Any]]) -> str:
+    """Render research data as the context string given to the judge."""
+    return "\n\n".join([
+        f"Query: {item['query']}\nAnalysis: {item['analysis']}"
+        for item in research_data
+    ])
+
+
+class ResearchContext:
+    """The judge's research context, extended in place as additional research arrives."""
+
+    def __init__(self, research_data: List[Dict[str, Any]]):
+        self.items: List[Dict[str, Any]] = []
+        self.text = ""
+        self._summaries: Dict[int, str] = {}
+        self.extend(research_data)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def extend(self, items: List[Dict[str, Any]]):
+        """Append newly researched items without re-rendering the existing ones."""
+        if not items:
+            return
+        addition = format_research_context(items)
+        self.text = f"{self.text}\n\n{addition}" if self.text else addition
+        self.items.extend(items)
+
+    def since(self, count: int) -> str:
+        """Context for the items added after the first ``count``."""
+        return format_research_context(self.items[count:])
+
+    def summary(self, question: str, count: int, packer, budget: int) -> str:
+        """Compact extractive summary of the first ``count`` items, computed once per ``count``."""
+        if count not in self._summaries:
+            sections = [(f"Query: {item['query']}\nAnalysis:", item['analysis']) for item in self.items[:count]]
+            self._summaries[count] = packer.pack(question, sections, budget=budget)
+        return self._summaries[count]
+
+
+def answer_changes(previous: str, current: str) -> str:
+    """Sections of ``current`` that differ from ``previous``, with unchanged runs elided."""
+    old = [p.strip() for p in re.split(r"\n\s*\n", previous) if p.strip()]
+    new = [p.strip() for p in re.split(r"\n\s*\n", current) if p.strip()]
+    blocks = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=old, b=new, autojunk=False).get_opcodes():
+        if tag == "equal":
+            blocks.append(f"[{j2 - j1} unchanged section(s) omitted]")
+        elif tag == "delete":
+            blocks.append("[Removed]\n" + "\n\n".join(old[i1:i2]))
+        else:
+            blocks.append("\n\n".join(new[j1:j2]))
+    return "\n\n".join(blocks)
+
+
+class AnswerRefiner:
+    """Runs the synthesize -> evaluate -> improve loop for one research session."""
+
+    def __init__(self,
+                 llm: AsyncLLMClient,
+                 research_more: Callable[[List[str], ResearchSession], Awaitable[List[Dict[str, Any]]]],
+                 incremental_evaluation: bool = False,
+                 summary_tokens: int = 800,
+                 prejudge: Optional[HeuristicJudge] = None):
+        self.llm = llm
+        self.prejudge = prejudge
+        self.research_more = research_more
+        self.incremental_evaluation = incremental_evaluation
+        self.summary_tokens = summary_tokens
+
+    async def refine(self,
+                     question: str,
+                     research_data: List[Dict[str, Any]],
+                     session: ResearchSession,
+                     max_iterations: int,
+                     speculative_candidates: int = 0) -> Tuple[str, EvaluationResult]:
+        """Return the final answer and its evaluation. ``research_data`` is extended in place."""
+        research_context = ResearchContext(research_data)
+        final_answer = None
+        evaluation_result = None
+        # (answer, its evaluation, research items it was judged against) from the previous round
+        judged: Optional[Tuple[str, EvaluationResult, int]] = None
+
+        for iteration in range(1, max_iterations + 1):
+            iteration_msg = f" (attempt {iteration}/{max_iterations})" if iteration > 1 else ""
+
+            # Decide how to improve based on the previous judgement
+            guidance = None
+            if evaluation_result and evaluation_result.action == EvaluationAction.REDO_FINAL_RESPONSE:
+                guidance = evaluation_result.improvement_guidance or "Improve clarity and completeness"
+            elif evaluation_result and evaluation_result.action == EvaluationAction.RESEARCH_AGAIN:
+                await session.progress(6, 6, "additional_research",
+                                       f"🔍 Conducting additional research{iteration_msg}...")
+                if evaluation_result.missing_topics:
+                    additional = await self.research_more(evaluation_result.missing_topics, session)
+                    research_data.extend(additional)
+                    research_context.extend(additional)
+
+            await session.progress(6, 6, "synthesizing", f"📝 Generating comprehensive answer{iteration_msg}...")
+
+            if speculative_candidates > 1:
+                final_answer, evaluation_result = await self._speculative_attempt(
+                    question, research_data, research_context, judged, guidance, session, iteration,
+                    speculative_candidates
+                )
+            else:
+                final_answer, evaluation_result = await self._single_attempt(
+                    question, research_data, research_context, judged, guidance, session, iteration, iteration_msg
+                )
+            judged = (final_answer, evaluation_result, len(research_context))
+
+            session.logger.info(f"Evaluation result (iteration {iteration}): "
+                                f"Action={evaluation_result.action.value}, "
+                                f"Score={evaluation_result.overall_score:.1f}, "
+                                f"Reasoning={evaluation_result.reasoning}")
+
+            if evaluation_result.action == EvaluationAction.SUFFICIENT:
+                await session.progress(6, 6, "evaluation_passed",
+                                       f"✅ Answer quality approved (score: {evaluation_result.overall_score:.1f}/10)")
+                break
+            elif iteration >= max_iterations:
+                await session.progress(6, 6, "max_iterations",
+                                       "⚠️ Reached maximum iterations - using best available answer")
+                session.logger.warning(f"Reached maximum evaluation iterations ({max_iterations})")
+                break
+            else:
+                action_msg = {
+                    EvaluationAction.REDO_FINAL_RESPONSE: "improving answer structure",
+                    EvaluationAction.RESEARCH_AGAIN: "conducting additional research"
+                }.get(evaluation_result.action, "refining answer")
+                await session.progress(6, 6, "improvement_needed",
+                                       f"🔄 Score {evaluation_result.overall_score:.1f}/10 - {action_msg}...")
+
+        return final_answer, evaluation_result
+
+    async def _evaluate(self, question: str, answer: str, research_context: ResearchContext,
+                        judged: Optional[Tuple[str, EvaluationResult, int]],
+                        session: ResearchSession) -> EvaluationResult:
+        """Judge ``answer``, locally when the pre-judge is confident and with the LLM otherwise."""
+        if self.prejudge is None:
+            return await self._llm_evaluate(question, answer, research_context, judged)
+
+        judgement = self.prejudge.score(question, answer, research_context.items)
+        decision = self.prejudge.judge(judgement)
+        if decision is not None and not self.prejudge.should_shadow():
+            session.logger.info(f"Pre-judge decided {decision.action.value} without the LLM ({decision.reasoning})")
+            return decision
+
+        evaluation = await self._llm_evaluate(question, answer, research_context, judged)
+        agrees = self.prejudge.record_agreement(judgement, evaluation)
+        session.logger.info(f"Pre-judge score {judgement.score:.2f} vs LLM {evaluation.action.value}: "
+                            f"{'agree' if agrees else 'disagree'}")
+        # A shadowed confident decision stands; the LLM call only measures agreement
+        return decision or evaluation
+
+    async def _llm_evaluate(self, question: str, answer: str, research_context: ResearchContext,
+                            judged: Optional[Tuple[str, EvaluationResult, int]]) -> EvaluationResult:
+        """LLM judge; in incremental mode, only against what changed since the previous round."""
+        if not self.incremental_evaluation or judged is None:
+            return await self.llm.evaluate_answer(question, answer, research_context.text)
+        previous_answer, previous_evaluation, judged_items = judged
+        return await self.llm.evaluate_answer_incremental(
+            question,
+            answer_changes(previous_answer, answer),
+            research_context.summary(question, judged_items, self.llm.client.prompt_packer, self.summary_tokens),
+            research_context.since(judged_items),
+            previous_evaluation
+        )
+
+    async def _single_attempt(self, question: str, research_data: List[Dict[str, Any]],
+                              research_context: ResearchContext,
+                              judged: Optional[Tuple[str, EvaluationResult, int]], guidance: Optional[str], session: ResearchSession, iteration: int,
+                              iteration_msg: str) -> Tuple[str, EvaluationResult]:
+        """Generate one answer (streaming if requested) and judge it."""
+        answer_stream = session.answer_stream(iteration)
+        with span("synthesis", iteration=iteration):
+            if guidance:
+                answer = await self.llm.regenerate_answer_with_guidance(
+                    question, research_data, guidance, token_callback=answer_stream
+                )
+                session.logger.info(f"Regenerated answer with guidance (iteration {iteration})")
+            else:
+                answer = await self.llm.synthesize_final_answer(question, research_data, token_callback=answer_stream)
+                session.logger.info(f"Generated answer (iteration {iteration})")
+        session.record_answer(answer)
+
+        await session.progress(6, 6, "evaluating", f"⚖️ Evaluating answer quality{iteration_msg}...")
+        with span("evaluation", iteration=iteration):
+            evaluation = await self._evaluate(question, answer, research_context, judged, session)
+        session.record_answer(answer, evaluation)
+        return answer, evaluation
+
+    async def _speculative_attempt(self, question: str, research_data: List[Dict[str, Any]],
+                                   research_context: ResearchContext,
+                                   judged: Optional[Tuple[str, EvaluationResult, int]], guidance: Optional[str], session: ResearchSession, iteration: int,
+                                   num_candidates: int) -> Tuple[str, EvaluationResult]:
+        """Generate and judge several candidates concurrently; stop at the first sufficient one."""
+
+        async def candidate(index: int) -> Tuple[str, EvaluationResult]:
+            temperature = CANDIDATE_TEMPERATURES[index % len(CANDIDATE_TEMPERATURES)]
+            style = CANDIDATE_STYLES[index % len(CANDIDATE_STYLES)]
+            hint = " ".join(part for part in (guidance, style) if part)
+            async with session.semaphore:
+                with span("synthesis", iteration=iteration, candidate=index):
+                    if hint:
+                        answer = await self.llm.regenerate_answer_with_guidance(
+                            question, research_data, hint, temperature=temperature
+                        )
+                    else:
+                        answer = await self.llm.synthesize_final_answer(question, research_data,
+                                                                        temperature=temperature)
+            session.record_answer(answer)
+            async with session.semaphore:
+                with span("evaluation", iteration=iteration, candidate=index):
+                    evaluation = await self._evaluate(question, answer, research_context, judged, session)
+            session.record_answer(answer, evaluation)
+            return answer, evaluation
+
+        await session.progress(6, 6, "evaluating",
+                               f"⚖️ Generating and evaluating {num_candidates} candidate answers in parallel...")
+        tasks = [asyncio.create_task(candidate(i)) for i in range(num_candidates)]
+        best = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    answer, evaluation = await next_done
+                except (DeadlineExceeded, SessionCancelled):
+                    # The whole session is out of time or cancelled; the caller returns a partial answer
+                    raise
+                except Exception as e:
+                    session.logger.error(f"Speculative candidate failed: {e}")
+                    continue
+                if best is None or evaluation.overall_score > best[1].overall_score:
+                    best = (answer, evaluation)
+                if evaluation.action == EvaluationAction.SUFFICIENT:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if best is None:
+            raise Exception("All speculative answer candidates failed")
+
+        session.logger.info(f"Selected best of {num_candidates} candidates (iteration {iteration}, "
+                            f"score {best[1].overall_score:.1f})")
+        answer_stream = session.answer_stream(iteration)
+        if answer_stream:
+            await answer_stream(best[0])
+        return best
@@ -0,0 +1,79 @@
+"""
+Per-request state for a single research session.
+The RAG engine is shared across requests; everything request-specific lives here.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Callable, List, Dict
+
+from .models import ProgressUpdate, ResearchStep, EvaluationResult
+from .deadline import Deadline
+from .retrieval import PassageRetriever
+
+
+class ResearchSession:
+    """State threaded through one research_question call."""
+
+    def __init__(self,
+                 session_id: str,
+                 logger: logging.Logger,
+                 max_concurrency: int,
+                 progress_callback: Optional[Callable] = None,
+                 token_callback: Optional[Callable] = None,
+                 bypass_cache: bool = False,
+                 deadline: Optional[Deadline] = None,
+                 merged_analysis: bool = False):
+        self.session_id = session_id
+        self.logger = logger
+        # Bounds the number of upstream calls this session has in flight
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.progress_callback = progress_callback
+        self.token_callback = token_callback
+        self.bypass_cache = bypass_cache
+        self.deadline = deadline or Deadline()
+        self.merged_analysis = merged_analysis
+        
+        # Best work so far, returned as a partial answer if the deadline expires
+        self.research_steps: List[ResearchStep] = []
+        self.best_answer: Optional[str] = None
+        self.best_evaluation: Optional[EvaluationResult] = None
+        
+        # Passages from every page fetched this session, ranked per query with BM25
+        self.retriever = PassageRetriever()
+        # Analysis of each query, awaited by later queries whose passages it already covered
+        self.analyses: Dict[str, asyncio.Future] = {}
+
+    async def progress(self, step_number: int, total_steps: int, status: str, message: str):
+        """Send a progress update via the callback if one was provided."""
+        if self.progress_callback:
+            update = ProgressUpdate(
+                session_id=self.session_id,
+                step_number=step_number,
+                total_steps=total_steps,
+                status=status,
+                message=message,
+                timestamp=datetime.now()
+            )
+            await self.progress_callback(update)
+
+    def record_answer(self, answer: str, evaluation: Optional[EvaluationResult] = None):
+        """Remember ``answer`` if it is the best one seen so far."""
+        if not answer:
+            return
+        if evaluation is None:
+            if self.best_answer is None:
+                self.best_answer = answer
+        elif self.best_evaluation is None or evaluation.overall_score >= self.best_evaluation.overall_score:
+            self.best_answer = answer
+            self.best_evaluation = evaluation
+    
+    def answer_stream(self, attempt: int) -> Optional[Callable]:
+        """Token callback for one answer attempt, or None when not streaming."""
+        if self.token_callback is None:
+            return None
+
+        async def forward(delta: str):
+            await self.token_callback(delta, attempt)
+
+        return forward
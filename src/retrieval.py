@@ -0,0 +1,171 @@
+"""
+Local passage retrieval over fetched page content.
+Pages are chunked into passages and ranked with BM25 so only the most relevant
+passages for a query are sent to the LLM.
+"""
+import math
+import hashlib
+from array import array
+from collections import Counter
+from typing import List, Dict, Tuple, NamedTuple, Any, Optional
+
+import numpy as np
+
+from .models import SearchResult
+from .prompt_packing import split_passages, terms
+from .corpus import normalize_url
+
+
+class Passage(NamedTuple):
+    """A chunk of one source page."""
+    url: str
+    title: str
+    text: str
+
+
+def simhash(text: str, bits: int = 64) -> int:
+    """SimHash fingerprint over word 3-shingles; near-duplicate texts differ in few bits."""
+    words = terms(text)
+    weights = [0] * bits
+    for i in range(max(len(words) - 2, 1)):
+        shingle = " ".join(words[i:i + 3])
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _as_numpy(values: array) -> np.ndarray:
+    return np.frombuffer(values, dtype=np.dtype(f"u{values.itemsize}"))
+
+
+class BM25Index:
+    """In-memory BM25 over passages with an inverted index of array-backed postings.
+
+    Each term maps to two parallel compact arrays (passage ids and term
+    frequencies), so scoring a query is a handful of vectorized NumPy updates.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages: List[Passage] = []
+        self._term_ids: Dict[str, int] = {}
+        self._postings_docs: List[array] = []
+        self._postings_tfs: List[array] = []
+        self._doc_lengths = array("I")
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def add(self, passage: Passage) -> int:
+        doc_id = len(self.passages)
+        tokens = terms(passage.text)
+        for term, tf in Counter(tokens).items():
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                term_id = self._term_ids[term] = len(self._postings_docs)
+                self._postings_docs.append(array("I"))
+                self._postings_tfs.append(array("I"))
+            self._postings_docs[term_id].append(doc_id)
+            self._postings_tfs[term_id].append(tf)
+        self.passages.append(passage)
+        self._doc_lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        return doc_id
+
+    def search(self, query: str, k: int = 8) -> List[Tuple[int, float]]:
+        """Top ``k`` passage ids for ``query`` with their BM25 scores (zero-score passages excluded)."""
+        n = len(self.passages)
+        if n == 0:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        doc_lengths = _as_numpy(self._doc_lengths).astype(np.float32)
+        avg_length = self._total_length / n or 1.0
+        for term in set(terms(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            docs = _as_numpy(self._postings_docs[term_id])
+            tfs = _as_numpy(self._postings_tfs[term_id]).astype(np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[docs] / avg_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        top = np.argsort(-scores)[:k]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+class PassageRetriever:
+    """Per-session passage store.
+
+    Each unique source is indexed once: results are deduplicated by normalized
+    URL and by SimHash of their content, so mirrors and syndicated copies found
+    by different queries collapse into one. Each passage is handed to only one
+    query analysis; later queries get the next most relevant unseen passages.
+    """
+
+    def __init__(self, passage_tokens: int = 120, near_duplicate_bits: int = 3):
+        self.passage_tokens = passage_tokens
+        self.near_duplicate_bits = near_duplicate_bits
+        self.index = BM25Index()
+        self.duplicate_sources = 0
+        self._indexed_urls = set()
+        self._fingerprints: List[int] = []
+        # Passage id -> query whose analysis it was given to
+        self._claimed: Dict[int, str] = {}
+
+    def add_results(self, results: List[SearchResult]):
+        """Chunk and index each new source's raw page content (or its snippet if there is none)."""
+        for result in results:
+            url = normalize_url(result.url)
+            if url in self._indexed_urls:
+                self.duplicate_sources += 1
+                continue
+            self._indexed_urls.add(url)
+            text = result.raw_content or result.content
+            # Very short texts fingerprint too coarsely to compare
+            if len(terms(text)) >= 10:
+                fingerprint = simhash(text)
+                if any(hamming_distance(fingerprint, other) <= self.near_duplicate_bits
+                       for other in self._fingerprints):
+                    self.duplicate_sources += 1
+                    continue
+                self._fingerprints.append(fingerprint)
+            for passage in split_passages(text, self.passage_tokens):
+                self.index.add(Passage(result.url, result.title, passage))
+
+    def retrieve(self, query: str, k: int = 8) -> Optional[List[Dict[str, Any]]]:
+        """Top ``k`` unclaimed passages for ``query``, grouped per source in the shape analyze expects.
+
+        Returns an empty list when nothing matches and None when every matching
+        passage was already given to another query's analysis.
+        """
+        matches = self.index.search(query, k * 4)
+        fresh = [passage_id for passage_id, _ in matches if passage_id not in self._claimed][:k]
+        if matches and not fresh:
+            return None
+        self._claimed.update((passage_id, query) for passage_id in fresh)
+
+        sources: Dict[str, Dict[str, Any]] = {}
+        for passage_id in fresh:
+            passage = self.index.passages[passage_id]
+            source = sources.setdefault(passage.url, {"title": passage.title, "url": passage.url, "passages": []})
+            source["passages"].append(passage.text)
+        return [
+            {"title": source["title"], "url": source["url"], "content": "\n...\n".join(source["passages"])}
+            for source in sources.values()
+        ]
+
+    def covering_queries(self, query: str, k: int = 8) -> List[str]:
+        """Queries whose analyses were given the passages most relevant to ``query``, best match first."""
+        owners: List[str] = []
+        for passage_id, _ in self.index.search(query, k * 4):
+            owner = self._claimed.get(passage_id)
+            if owner is not None and owner != query and owner not in owners:
+                owners.append(owner)
+        return owners
@@ -0,0 +1,182 @@
+"""
+Retry policies for upstream calls: jittered exponential backoff within an overall
+time budget, and optional hedged requests to cut tail latency.
+"""
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+from typing import Callable, Optional, TypeVar
+
+from .rate_limit import UpstreamError
+from .deadline import current_deadline, DeadlineExceeded
+
+T = TypeVar("T")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transport failures (no status), 429 and 5xx are worth another attempt; other 4xx are not."""
+    if isinstance(error, UpstreamError):
+        return error.status_code is None or error.overloaded
+    return False
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies."""
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """The ``pct`` percentile latency, or None until enough samples exist."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)]
+
+
+class RetryPolicy:
+    """Runs ``fn(timeout)`` with retries until it succeeds or the time budget runs out.
+
+    Each attempt gets a timeout carved from what is left of ``budget`` so a stuck
+    call cannot consume the whole request. When ``hedge_percentile`` is set, a
+    second copy of an attempt is fired once it has run longer than that latency
+    percentile, and whichever copy returns first wins.
+    """
+
+    def __init__(self, name: str, max_attempts: int = 3, budget: float = 90.0,
+                 base_delay: float = 0.5, max_delay: float = 8.0,
+                 min_attempt_timeout: float = 5.0, max_attempt_timeout: float = 60.0,
+                 hedge_percentile: Optional[float] = None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_timeout = min_attempt_timeout
+        self.max_attempt_timeout = max_attempt_timeout
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.logger = logging.getLogger(__name__)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number ``attempt`` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def attempt_timeout(self, remaining: float, attempts_left: int) -> float:
+        """Split the remaining budget across the attempts still allowed."""
+        share = remaining / max(attempts_left, 1)
+        return min(max(share, self.min_attempt_timeout), self.max_attempt_timeout, remaining)
+
+    def call(self, fn: Callable[[float], T], hedge: bool = True,
+             should_retry: Optional[Callable[[Exception], bool]] = None) -> T:
+        """Call ``fn(timeout)``, retrying retryable errors. ``hedge=False`` for non-idempotent calls.
+
+        The budget is further capped by the current session deadline, if any.
+        """
+        started = time.monotonic()
+        deadline = current_deadline.get()
+        budget = self.budget
+        if deadline is not None and deadline.remaining() is not None:
+            budget = min(budget, deadline.remaining())
+        for attempt in range(1, self.max_attempts + 1):
+            if deadline is not None:
+                deadline.check()
+            remaining = budget - (time.monotonic() - started)
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{self.name} call ran out of time budget")
+            timeout = self.attempt_timeout(remaining, self.max_attempts - attempt + 1)
+            try:
+                if hedge and self.hedge_percentile:
+                    return self._hedged(fn, timeout)
+                return self._timed(fn, timeout)
+            except Exception as e:
+                retry = is_retryable(e) and (should_retry is None or should_retry(e))
+                delay = self.backoff(attempt)
+                remaining = budget - (time.monotonic() - started)
+                if not retry or attempt >= self.max_attempts or remaining - delay < self.min_attempt_timeout:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                self.logger.warning(f"{self.name} attempt {attempt}/{self.max_attempts} failed ({e}); "
+                                    f"retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _timed(self, fn: Callable[[float], T], timeout: float) -> T:
+        start = time.monotonic()
+        result = fn(timeout)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def _hedged(self, fn: Callable[[float], T], timeout: float) -> T:
+        hedge_after = self.latency.percentile(self.hedge_percentile)
+        if hedge_after is None or hedge_after >= timeout:
+            return self._timed(fn, timeout)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix=f"hedge-{self.name}")
+        # Each attempt runs in its own copy of the caller's context, so the session
+        # deadline and trace reach the limiter waits and timeouts in both copies
+        primary = self._executor.submit(contextvars.copy_context().run, self._timed, fn, timeout)
+        try:
+            return primary.result(timeout=hedge_after)
+        except FutureTimeout:
+            pass
+
+        with self._lock:
+            self.hedges += 1
+        self.logger.info(f"{self.name} call exceeded p{self.hedge_percentile:g} ({hedge_after:.2f}s); sending hedge")
+        # The losing copy cannot be interrupted; it finishes in the background and is discarded
+        backup = self._executor.submit(contextvars.copy_context().run, self._timed, fn,
+                                       max(timeout - hedge_after, self.min_attempt_timeout))
+        pending, error = {primary, backup}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> dict:
+        p95 = self.latency.percentile(95)
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p95_latency": round(p95, 3) if p95 is not None else None
+        }
+
+
+def retry_policy_from_env(prefix: str, name: str, default_budget: float,
+                          max_attempt_timeout: float = 60.0) -> RetryPolicy:
+    """Build a ``RetryPolicy`` from ``{prefix}_RETRY_ATTEMPTS``, ``{prefix}_REQUEST_BUDGET``
+    and ``{prefix}_HEDGE_PERCENTILE`` (unset disables hedging)."""
+    hedge = os.getenv(f"{prefix}_HEDGE_PERCENTILE")
+    return RetryPolicy(
+        name,
+        max_attempts=int(os.getenv(f"{prefix}_RETRY_ATTEMPTS", "3")),
+        budget=float(os.getenv(f"{prefix}_REQUEST_BUDGET", str(default_budget))),
+        max_attempt_timeout=max_attempt_timeout,
+        hedge_percentile=float(hedge) if hedge else None
+    )
@@ -2,21 +2,104 @@
 Search client for Tavily API integration.
 """
 import requests
+import json
+import time
 import logging
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import Future, wait
+from typing import List, Dict, Optional, Tuple
 from .models import SearchResult
+from .http_pool import HTTPPool, get_http_pool
+from .cache import Cache, normalize_query, make_cache_key
+from .rate_limit import UpstreamLimiter, UpstreamError, raise_for_upstream_status
+from .retry import RetryPolicy
+from .deadline import Deadline, DeadlineExceeded, SessionCancelled, current_deadline
+from .instrumentation import record_upstream_call, record_cache_lookup
 
 
 class SearchClient:
     """Client for Tavily search API."""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, http_pool: Optional[HTTPPool] = None, cache: Optional[Cache] = None,
+                 rate_limiter: Optional[UpstreamLimiter] = None, retry_policy: Optional[RetryPolicy] = None,
+                 base_url: str = "https://api.tavily.com"):
         self.api_key = api_key
-        self.base_url = "https://api.tavily.com"
+        self.base_url = base_url.rstrip("/")
+        self.http_pool = http_pool or get_http_pool()
+        self.cache = cache
+        self.rate_limiter = rate_limiter or UpstreamLimiter("tavily")
+        self.retry_policy = retry_policy or RetryPolicy("tavily", budget=45.0, max_attempt_timeout=30.0)
         self.logger = logging.getLogger(__name__)
+        
+        # Identical searches already in flight are shared rather than repeated, keyed to the owner's deadline
+        self._inflight: Dict[str, Tuple[Future, Optional[Deadline]]] = {}
+        self._inflight_lock = threading.Lock()
+        self.coalesced_searches = 0
     
-    def search(self, query: str, max_results: int = 5) -> List[SearchResult]:
-        """Search using Tavily API."""
+    def search(self, query: str, max_results: int = 5, search_depth: str = 'basic',
+               bypass_cache: bool = False) -> List[SearchResult]:
+        """Search using Tavily API, serving repeated queries from the cache when configured."""
+        cache_key = make_cache_key("search", normalize_query(query), max_results, search_depth)
+        if self.cache is not None and not bypass_cache:
+            cached = self.cache.get(cache_key)
+            record_cache_lookup("search", cached is not None)
+            if cached is not None:
+                self.logger.info(f"Search cache hit for: {query}")
+                return [SearchResult(**item) for item in json.loads(cached)]
+        
+        with self._inflight_lock:
+            pending = self._inflight.get(cache_key)
+            if pending is None:
+                owned = Future()
+                self._inflight[cache_key] = (owned, current_deadline.get())
+            else:
+                self.coalesced_searches += 1
+        if pending is not None:
+            self.logger.info(f"Joining in-flight search for: {query}")
+            future, owner_deadline = pending
+            try:
+                return self._wait_for(future)
+            except Exception as e:
+                # The owner's cancellation or time budget is not ours: search again under our own deadline
+                owner_stopped = owner_deadline is not None and (owner_deadline.cancelled or owner_deadline.expired)
+                if future.done() and (owner_stopped or isinstance(e, (SessionCancelled, DeadlineExceeded))):
+                    self.logger.info(f"Shared search stopped with its session; searching again for: {query}")
+                    return self.search(query, max_results, search_depth, bypass_cache)
+                raise
+        
+        started = time.perf_counter()
+        try:
+            results = self.retry_policy.call(
+                lambda timeout: self._request_search(query, max_results, search_depth, timeout)
+            )
+            record_upstream_call("tavily", "search", started, "ok", query=query, search_depth=search_depth)
+            if self.cache is not None:
+                # raw_content is excluded from model_dump but needed for passage retrieval on cache hits
+                self.cache.set(cache_key, json.dumps([{**result.model_dump(), "raw_content": result.raw_content}
+                                                      for result in results]))
+            owned.set_result(results)
+            return results
+        except Exception as e:
+            record_upstream_call("tavily", "search", started, "error", query=query, search_depth=search_depth)
+            owned.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(cache_key, None)
+    
+    @staticmethod
+    def _wait_for(future: Future) -> List[SearchResult]:
+        """Wait for a shared search, stopping at the current session's deadline or cancellation."""
+        deadline = current_deadline.get()
+        while deadline is not None and not future.done():
+            deadline.check()
+            remaining = deadline.remaining()
+            wait([future], timeout=min(remaining, 0.25) if remaining is not None else 0.25)
+        return future.result()
+    
+    def _request_search(self, query: str, max_results: int, search_depth: str,
+                        timeout: float = 30) -> List[SearchResult]:
+        """Call the Tavily search endpoint."""
         try:
             headers = {
                 'Content-Type': 'application/json'
@@ -25,21 +108,22 @@ class SearchClient:
             payload = {
                 'api_key': self.api_key,
                 'query': query,
-                'search_depth': 'basic',
+                'search_depth': search_depth,
                 'max_results': max_results,
                 'include_raw_content': True
             }
             
             self.logger.info(f"Searching Tavily for: {query}")
             
-            response = requests.post(
-                f"{self.base_url}/search",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            response.raise_for_status()
+            with self.rate_limiter.permit() as permit:
+                response = self.http_pool.post(
+                    f"{self.base_url}/search",
+                    headers=headers,
+                    json=payload,
+                    timeout=permit.timeout(timeout)
+                )
+                permit.record_response(response)
+                raise_for_upstream_status(response, "Search request failed")
             data = response.json()
             
             results = []
@@ -48,7 +132,8 @@ class SearchClient:
                     title=item.get('title', 'No title'),
                     url=item.get('url', ''),
                     content=item.get('content', ''),
-                    score=item.get('score')
+                    score=item.get('score'),
+                    raw_content=item.get('raw_content')
                 )
                 results.append(result)
             
@@ -57,7 +142,7 @@ class SearchClient:
             
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Tavily search failed: {e}")
-            raise Exception(f"Search request failed: {e}")
+            raise UpstreamError(f"Search request failed: {e}")
         except Exception as e:
             self.logger.error(f"Search error: {e}")
             raise
@@ -0,0 +1,239 @@
+"""
+Semantic cache for reusing research across near-duplicate questions and queries.
+Embeddings come from a local hashed n-gram embedder, so it works fully offline.
+"""
+import re
+import time
+import zlib
+import bisect
+import threading
+from typing import List, Optional, Tuple, Any, Protocol
+
+import numpy as np
+
+
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "to", "for", "and", "or", "is", "are", "was", "were",
+    "how", "what", "why", "which", "who", "does", "do", "did", "can", "with", "by", "about", "as"
+}
+
+
+def _numbers(text: str) -> List[str]:
+    return sorted(re.findall(r"\d+(?:[.,]\d+)*", text))
+
+
+def _words(text: str) -> List[str]:
+    return [HashingEmbedder._stem(w) for w in re.findall(r"[a-z]+", text.lower()) if w not in STOPWORDS]
+
+
+def same_meaning(a: str, b: str) -> bool:
+    """Guard on top of embedding similarity, which ignores word order and barely weighs numbers.
+
+    Both texts must contain the same numbers ("python 3.11" is not "python 3.12"),
+    and the words they share must appear in the same order ("caffeine on sleep" is
+    not "sleep on caffeine").
+    """
+    if _numbers(a) != _numbers(b):
+        return False
+    words_a, words_b = _words(a), _words(b)
+    shared = set(words_a) & set(words_b)
+    order_a = [w for w in dict.fromkeys(words_a) if w in shared]
+    order_b = [w for w in dict.fromkeys(words_b) if w in shared]
+    return order_a == order_b
+
+
+class Embedder(Protocol):
+    """Anything that maps texts to L2-normalized row vectors."""
+    dim: int
+
+    def embed(self, texts: List[str]) -> np.ndarray: ...
+
+
+class HashingEmbedder:
+    """Hashed word and character n-gram embedder with log-scaled term frequencies."""
+
+    def __init__(self, dim: int = 1024, char_ngrams: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+
+    @staticmethod
+    def _stem(word: str) -> str:
+        for suffix in ("ing", "ed", "es", "s", "ly"):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                return word[:-len(suffix)]
+        return word
+
+    def _features(self, text: str) -> List[str]:
+        words = [self._stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS]
+        features = [f"w:{w}" for w in words]
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                features.extend(f"c:{padded[i:i + n]}" for i in range(max(len(padded) - n + 1, 0)))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # The sign bit keeps hash collisions from systematically inflating similarity
+                vectors[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class BruteForceIndex:
+    """Exact cosine-similarity search over a growable NumPy matrix."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = np.zeros((64, dim), dtype=np.float32)
+        self.size = 0
+
+    def add(self, vector: np.ndarray) -> int:
+        if self.size == len(self._vectors):
+            self._vectors = np.vstack([self._vectors, np.zeros_like(self._vectors)])
+        self._vectors[self.size] = vector
+        self.size += 1
+        return self.size - 1
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        if self.size == 0:
+            return []
+        scores = self._vectors[:self.size] @ vector
+        top = np.argsort(-scores)[:k]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class IVFIndex(BruteForceIndex):
+    """Approximate inverted-file index: k-means centroids, probing the nearest lists only.
+
+    Falls back to exact search until enough vectors exist to train the centroids.
+    """
+
+    def __init__(self, dim: int, n_lists: int = 16, n_probe: int = 3, train_size: int = 512):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+
+    def _train(self):
+        data = self._vectors[:self.size]
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(self.size, self.n_lists, replace=False)]
+        for _ in range(10):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for c in range(self.n_lists):
+                members = data[assignments == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        self._centroids = centroids
+        self._lists = [list(np.flatnonzero(assignments == c)) for c in range(self.n_lists)]
+
+    def add(self, vector: np.ndarray) -> int:
+        idx = super().add(vector)
+        if self._centroids is not None:
+            self._lists[int(np.argmax(self._centroids @ vector))].append(idx)
+        elif self.size >= self.train_size:
+            self._train()
+        return idx
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        if self._centroids is None:
+            return super().search(vector, k)
+        probes = np.argsort(-(self._centroids @ vector))[:self.n_probe]
+        candidates = np.array([i for c in probes for i in self._lists[c]], dtype=np.int64)
+        if len(candidates) == 0:
+            return []
+        scores = self._vectors[candidates] @ vector
+        top = np.argsort(-scores)[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+
+class SemanticCache:
+    """Maps texts to payloads and returns the payload of the most similar stored text.
+
+    Entries older than ``ttl`` seconds are never returned, and are dropped once
+    they make up half the cache. A match must also pass ``same_meaning``.
+    """
+
+    def __init__(self, embedder: Optional[Embedder] = None, threshold: float = 0.85,
+                 approximate: bool = False, max_entries: int = 10000, ttl: Optional[float] = None):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.approximate = approximate
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        dim = self.embedder.dim
+        self._index = IVFIndex(dim) if self.approximate else BruteForceIndex(dim)
+        self._texts: List[str] = []
+        self._payloads: List[Any] = []
+        # Insertion times, ascending, so expired entries are always a prefix
+        self._added: List[float] = []
+
+    def _expired_count(self, now: float) -> int:
+        if not self.ttl:
+            return 0
+        return bisect.bisect_left(self._added, now - self.ttl)
+
+    def add(self, text: str, payload: Any):
+        vector = self.embedder.embed([text])[0]
+        now = time.time()
+        with self._lock:
+            expired = self._expired_count(now)
+            if len(self._payloads) >= self.max_entries or (expired and expired * 2 >= len(self._payloads)):
+                # Rebuild from the newer half (and unexpired entries) rather than paying for per-row deletes
+                start = max(expired, self.max_entries // 2 if len(self._payloads) >= self.max_entries else 0)
+                keep = list(zip(self._texts, self._payloads, self._added))[start:]
+                self._reset()
+                vectors = self.embedder.embed([t for t, _, _ in keep]) if keep else []
+                for (old_text, old_payload, old_added), old_vector in zip(keep, vectors):
+                    self._index.add(old_vector)
+                    self._texts.append(old_text)
+                    self._payloads.append(old_payload)
+                    self._added.append(old_added)
+            self._index.add(vector)
+            self._texts.append(text)
+            self._payloads.append(payload)
+            self._added.append(now)
+
+    def lookup(self, text: str, threshold: Optional[float] = None) -> Optional[Tuple[Any, float, str]]:
+        """Return (payload, similarity, matched_text) for the best match above the threshold."""
+        vector = self.embedder.embed([text])[0]
+        with self._lock:
+            # A few candidates, so an expired or guarded-out best match does not hide a good one
+            matches = self._index.search(vector, k=4)
+            threshold = self.threshold if threshold is None else threshold
+            expired = self._expired_count(time.time())
+            for idx, score in matches:
+                if score < threshold:
+                    break
+                if idx >= expired and same_meaning(text, self._texts[idx]):
+                    self.hits += 1
+                    return self._payloads[idx], score, self._texts[idx]
+            self.misses += 1
+            return None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._payloads),
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "approximate": self.approximate
+        }
@@ -0,0 +1,271 @@
+"""
+Non-blocking per-session logging.
+Session loggers hand records to a ``QueueHandler``; one background thread
+batches them into ``logs/<session_id>.jsonl`` (one JSON object per line), so no
+disk I/O happens on the event loop. Each session has a bounded number of queued
+records, its file is closed when the session ends, and old logs are pruned by
+age and total size. With a ``SessionStore``, the same records are also inserted
+there as searchable events.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+from logging.handlers import QueueHandler
+from typing import Dict, Any, List, Optional, TextIO, Tuple, Callable
+
+from .session_store import SessionStore
+
+LOG_EXTENSIONS = (".jsonl", ".log")
+
+
+class _SessionQueueHandler(QueueHandler):
+    """Queues a session's records for the writer thread, dropping them when the session's buffer is full."""
+
+    def __init__(self, writer: "SessionLogWriter", session_id: str):
+        super().__init__(writer._queue)
+        self.writer = writer
+        self.session_id = session_id
+
+    def enqueue(self, record: logging.LogRecord):
+        self.writer._enqueue(self.session_id, record)
+
+
+class SessionLogWriter:
+    """Background writer of per-session JSONL logs.
+
+    At most ``buffer_size`` records per session wait in the queue; further INFO
+    records are counted and dropped (warnings and errors are always kept), and the
+    count is logged when the session closes. Every ``prune_interval`` seconds,
+    logs older than ``max_age`` seconds are deleted, then the oldest logs until
+    ``logs_dir`` holds at most ``max_bytes``. Files of open sessions are kept.
+    """
+
+    def __init__(self, logs_dir: str = "logs", buffer_size: int = 1000, max_age: Optional[float] = 7 * 24 * 3600,
+                 max_bytes: Optional[int] = 100 * 1024 * 1024, prune_interval: float = 60.0,
+                 batch_size: int = 512, store: Optional[SessionStore] = None):
+        self.logs_dir = logs_dir
+        self.buffer_size = buffer_size
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.batch_size = batch_size
+        self.store = store
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+        os.makedirs(logs_dir, exist_ok=True)
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._dropped: Dict[str, int] = defaultdict(int)
+        # Only touched by the writer thread
+        self._files: Dict[str, TextIO] = {}
+        self._last_prune = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="session-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.logs_dir, f"{session_id}.jsonl")
+
+    def open_session(self, session_id: str) -> logging.Logger:
+        """A logger for ``session_id``; pass it to ``close_session`` when the session ends."""
+        # Not registered with logging.getLogger, so it is freed with the session
+        logger = logging.Logger(f"session.{session_id}", logging.INFO)
+        logger.propagate = False
+        logger.addHandler(_SessionQueueHandler(self, session_id))
+        return logger
+
+    def close_session(self, logger: logging.Logger):
+        """Detach ``logger`` and close its file once its queued records are written."""
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            if isinstance(handler, _SessionQueueHandler):
+                self._queue.put(("close", handler.session_id, None))
+        # Worker threads that outlive the session must not reopen its file
+        logger.disabled = True
+
+    def submit(self, fn: Callable, *args):
+        """Run ``fn(*args)`` on the writer thread, after the records queued so far."""
+        self._queue.put(("call", None, (fn, args)))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued so far is written. Returns False on timeout."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", None, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued, close every file and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(("stop", None, None))
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "open_sessions": len(self._files),
+                "written": self.written,
+                "dropped": self.dropped,
+                "pruned": self.pruned
+            }
+
+    def _enqueue(self, session_id: str, record: logging.LogRecord):
+        with self._lock:
+            if self._pending[session_id] >= self.buffer_size and record.levelno < logging.WARNING:
+                self._dropped[session_id] += 1
+                self.dropped += 1
+                return
+            self._pending[session_id] += 1
+        self._queue.put(("record", session_id, record))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not self._write_batch(batch):
+                break
+            self._maybe_prune()
+        for session_id in list(self._files):
+            self._close_file(session_id)
+
+    def _write_batch(self, batch: List[Tuple[str, Optional[str], Any]]) -> bool:
+        """Write one batch; each touched file is flushed once. Returns False once asked to stop."""
+        touched, waiters, events, running = set(), [], [], True
+        for kind, session_id, payload in batch:
+            if kind == "record":
+                with self._lock:
+                    self._pending[session_id] -= 1
+                self._write(session_id, payload)
+                touched.add(session_id)
+                events.append((session_id, payload.created, payload.levelname, payload.getMessage()))
+            elif kind == "close":
+                self._close_file(session_id)
+                touched.discard(session_id)
+            elif kind == "call":
+                fn, args = payload
+                try:
+                    fn(*args)
+                except (OSError, sqlite3.Error):
+                    pass
+            elif kind == "flush":
+                waiters.append(payload)
+            elif kind == "stop":
+                running = False
+        for session_id in touched:
+            try:
+                self._files[session_id].flush()
+            except (KeyError, OSError):
+                pass
+        if self.store is not None and events:
+            try:
+                self.store.add_events(events)
+            except sqlite3.Error:
+                pass
+        for waiter in waiters:
+            waiter.set()
+        return running
+
+    def _write(self, session_id: str, record: logging.LogRecord):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "session_id": session_id,
+            "message": record.getMessage()
+        }
+        try:
+            f = self._files.get(session_id)
+            if f is None:
+                f = self._files[session_id] = open(self.path(session_id), "a", encoding="utf-8",
+                                                   buffering=64 * 1024)
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.written += 1
+        except OSError:
+            # Logging must never take a session down
+            pass
+
+    def _close_file(self, session_id: str):
+        with self._lock:
+            dropped = self._dropped.pop(session_id, 0)
+            if self._pending.get(session_id) == 0:
+                del self._pending[session_id]
+        if dropped:
+            record = logging.LogRecord(f"session.{session_id}", logging.WARNING, __file__, 0,
+                                       f"Dropped {dropped} log records (session log buffer full)", None, None)
+            self._write(session_id, record)
+        f = self._files.pop(session_id, None)
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        try:
+            self.prune(now)
+        except OSError:
+            pass
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete logs older than ``max_age``, then the oldest until the directory fits ``max_bytes``.
+
+        Runs on the writer thread; returns the number of files removed.
+        """
+        now = now if now is not None else time.time()
+        open_paths = {self.path(session_id) for session_id in list(self._files)}
+        logs = []
+        for entry in os.scandir(self.logs_dir):
+            if entry.is_file() and entry.name.endswith(LOG_EXTENSIONS) and entry.path not in open_paths:
+                stat = entry.stat()
+                logs.append((stat.st_mtime, stat.st_size, entry.path))
+        logs.sort()
+        total = sum(size for _, size, _ in logs)
+        removed = 0
+        for mtime, size, path in logs:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            oversized = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or oversized):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self.pruned += removed
+        return removed
+
+
+def session_log_writer_from_env(logs_dir: str = "logs", store: Optional[SessionStore] = None) -> SessionLogWriter:
+    """Build the session log writer from SESSION_LOG_BUFFER/_MAX_AGE/_MAX_BYTES environment variables."""
+    max_age = float(os.getenv("SESSION_LOG_MAX_AGE", str(7 * 24 * 3600)))
+    max_bytes = int(os.getenv("SESSION_LOG_MAX_BYTES", str(100 * 1024 * 1024)))
+    return SessionLogWriter(
+        logs_dir,
+        buffer_size=int(os.getenv("SESSION_LOG_BUFFER", "1000")),
+        max_age=max_age or None,
+        max_bytes=max_bytes or None,
+        store=store
+    )
@@ -0,0 +1,180 @@
+"""
+Indexed store of past research sessions.
+Every session's question, outcome, score and full result go into SQLite along
+with its log events, indexed by session id, time, question hash and score, so
+past sessions can be paged through and searched without reading log files.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+from .cache import normalize_query
+
+
+SUMMARY_COLUMNS = ("session_id", "question", "question_hash", "status", "score", "started_at", "finished_at",
+                   "duration", "error")
+
+
+def question_hash(question: str) -> str:
+    """Hash of the normalized question; trivially different spellings hash alike."""
+    return hashlib.sha256(normalize_query(question).encode("utf-8")).hexdigest()
+
+
+def encode_cursor(started_at: float, session_id: str) -> str:
+    return f"{started_at!r}:{session_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    started_at, _, session_id = cursor.partition(":")
+    return float(started_at), session_id
+
+
+class SessionStore:
+    """SQLite store of session summaries, results and log events.
+
+    Listings use keyset pagination on (started_at, session_id), newest first, so
+    pages stay cheap however deep the client scrolls. Sessions older than
+    ``max_age`` seconds are deleted with their events as new sessions finish.
+    """
+
+    def __init__(self, path: str, max_age: Optional[float] = 30 * 24 * 3600, prune_every: int = 100):
+        self.path = path
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self._finished = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, question TEXT NOT NULL, question_hash TEXT NOT NULL,"
+            " status TEXT NOT NULL, score REAL, started_at REAL NOT NULL, finished_at REAL,"
+            " duration REAL, error TEXT, result TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at, session_id);"
+            "CREATE INDEX IF NOT EXISTS idx_sessions_question ON sessions(question_hash, started_at);"
+            "CREATE INDEX IF NOT EXISTS idx_sessions_score ON sessions(score);"
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, time REAL NOT NULL,"
+            " level TEXT NOT NULL, message TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_events_session ON events(session_id, id);"
+            "CREATE INDEX IF NOT EXISTS idx_events_time ON events(time);"
+        )
+        self._conn.commit()
+
+    def start_session(self, session_id: str, question: str, started_at: Optional[float] = None):
+        """Record a session as running."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, question, question_hash, status, started_at)"
+                " VALUES (?, ?, ?, 'running', ?)",
+                (session_id, question, question_hash(question), started_at or time.time())
+            )
+            self._conn.commit()
+
+    def finish_session(self, session_id: str, status: str, score: Optional[float] = None,
+                       result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """Record a session's outcome (complete, partial, cancelled or error) and its result."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET status = ?, score = ?, finished_at = ?, duration = ? - started_at,"
+                " error = ?, result = ? WHERE session_id = ?",
+                (status, score, now, now, error, json.dumps(result) if result is not None else None, session_id)
+            )
+            self._conn.commit()
+            self._finished += 1
+            if self.max_age is not None and self._finished % self.prune_every == 1:
+                self._prune(now - self.max_age)
+
+    def add_events(self, events: Iterable[Tuple[str, float, str, str]]):
+        """Append ``(session_id, time, level, message)`` log events."""
+        with self._lock:
+            self._conn.executemany("INSERT INTO events (session_id, time, level, message) VALUES (?, ?, ?, ?)",
+                                   events)
+            self._conn.commit()
+
+    def list_sessions(self, limit: int = 50, cursor: Optional[str] = None, status: Optional[str] = None,
+                      question: Optional[str] = None, search: Optional[str] = None,
+                      min_score: Optional[float] = None, max_score: Optional[float] = None,
+                      since: Optional[float] = None, until: Optional[float] = None
+                      ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of session summaries, newest first, and the cursor of the next page (None at the end).
+
+        ``question`` matches sessions asking the same (normalized) question; ``search``
+        is a case-insensitive substring of the question.
+        """
+        clauses, params = [], []
+        if cursor:
+            clauses.append("(started_at, session_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if question:
+            clauses.append("question_hash = ?")
+            params.append(question_hash(question))
+        if search:
+            clauses.append("question LIKE ? ESCAPE '\\'")
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        for clause, value in (("score >= ?", min_score), ("score <= ?", max_score),
+                              ("started_at >= ?", since), ("started_at < ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM sessions {where}"
+                " ORDER BY started_at DESC, session_id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        sessions = [dict(zip(SUMMARY_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = sessions[-1]
+            next_cursor = encode_cursor(last["started_at"], last["session_id"])
+        return sessions, next_cursor
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """A session's summary with its full result, or None if unknown."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)}, result FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        session = dict(zip(SUMMARY_COLUMNS, row[:-1]))
+        session["result"] = json.loads(row[-1]) if row[-1] else None
+        return session
+
+    def get_events(self, session_id: str, after: int = 0, limit: int = 500) -> List[Dict[str, Any]]:
+        """Log events of a session with ids above ``after``, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, time, level, message FROM events WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (session_id, after, limit)
+            ).fetchall()
+        return [{"id": row[0], "time": row[1], "level": row[2], "message": row[3]} for row in rows]
+
+    def _prune(self, cutoff: float):
+        self._conn.execute("DELETE FROM sessions WHERE started_at < ?", (cutoff,))
+        self._conn.execute("DELETE FROM events WHERE time < ?", (cutoff,))
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def session_store_from_env() -> Optional[SessionStore]:
+    """Build the session store from SESSION_STORE_ENABLED/_PATH/_MAX_AGE environment variables."""
+    if os.getenv("SESSION_STORE_ENABLED", "true").lower() not in ("1", "true", "yes", "on"):
+        return None
+    max_age = float(os.getenv("SESSION_STORE_MAX_AGE", str(30 * 24 * 3600)))
+    return SessionStore(os.getenv("SESSION_STORE_PATH", "cache/sessions.sqlite"), max_age=max_age or None)
@@ -5,6 +5,10 @@ class RAGInterface {
         this.socket = null;
         this.md = null;
         this.currentFile = null;
+        this.currentRequestId = null;
+        this.streamAttempt = null;
+        this.streamedAnswer = '';
+        this.streamRenderPending = false;
         this.initializeElements();
         this.initializeMarkdown();
         this.setupEventListeners();
@@ -68,11 +72,16 @@ class RAGInterface {
         
         this.socket.onmessage = (event) => {
             const data = JSON.parse(event.data);
+            // Ignore messages of earlier questions still winding down on the server
+            if (data.request_id && data.request_id !== this.currentRequestId) return;
             
             switch (data.type) {
                 case 'progress':
                     this.updateProgress(data.content);
                     break;
+                case 'answer_delta':
+                    this.appendAnswerDelta(data.content);
+                    break;
                 case 'result':
                     this.showResult(data.content);
                     break;
@@ -228,7 +237,43 @@ class RAGInterface {
         logItem.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
     }
 
+    appendAnswerDelta(content) {
+        // A new attempt number means the answer is being regenerated from scratch
+        if (this.streamAttempt !== content.attempt) {
+            this.streamAttempt = content.attempt;
+            this.streamedAnswer = '';
+        }
+        this.streamedAnswer += content.delta;
+
+        let answerBody = document.getElementById('streamingAnswerBody');
+        if (!answerBody) {
+            this.resultsSection.innerHTML = `
+                <div class="result-card">
+                    <div class="result-answer">
+                        <h2><i class="fas fa-lightbulb"></i> Answer <span class="progress-spinner" style="display: inline-block;"></span></h2>
+                        <div id="streamingAnswerBody"></div>
+                    </div>
+                </div>
+            `;
+            answerBody = document.getElementById('streamingAnswerBody');
+        }
+
+        // Re-render at most once per animation frame; tokens can arrive much faster
+        if (!this.streamRenderPending) {
+            this.streamRenderPending = true;
+            requestAnimationFrame(() => {
+                this.streamRenderPending = false;
+                const body = document.getElementById('streamingAnswerBody');
+                if (body) {
+                    body.innerHTML = this.md.render(this.streamedAnswer);
+                }
+            });
+        }
+    }
+
     showResult(result) {
+        this.streamAttempt = null;
+        this.streamedAnswer = '';
         this.progressSection.style.display = 'none';
         this.askButton.disabled = false;
         this.askButton.innerHTML = '<i class="fas fa-search"></i> Ask Question';
@@ -308,6 +353,7 @@ class RAGInterface {
             <div class="result-card">
                 <div class="result-answer">
                     <h2><i class="fas fa-lightbulb"></i> Answer</h2>
+                    ${result.partial ? '<p><i class="fas fa-stopwatch"></i> <em>Time budget reached - showing the best answer available so far.</em></p>' : ''}
                     ${processedAnswer}
                 </div>
                 
@@ -441,8 +487,10 @@ class RAGInterface {
         this.resultsSection.innerHTML = '';
 
         if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.currentRequestId = `q${Date.now().toString(36)}`;
             this.socket.send(JSON.stringify({
                 type: 'query',
+                id: this.currentRequestId,
                 content: question,
                 settings: {
                     num_searches: parseInt(this.numSearches.value) || 3,
@@ -4,7 +4,13 @@ class ChatInterface {
     constructor() {
         this.socket = null;
         this.uploadedFile = null;
-        this.isResearching = false;
+        // Research sessions running on this socket, by request id; only the active one streams to the output panel
+        this.requests = new Map();
+        this.activeRequestId = null;
+        this.requestCounter = 0;
+        this.streamAttempt = null;
+        this.streamedAnswer = '';
+        this.streamRenderPending = false;
         this.initializeElements();
         this.setupEventListeners();
         this.initializeSplitter();
@@ -17,6 +23,7 @@ class ChatInterface {
         this.messages = document.getElementById('messages');
         this.messageInput = document.getElementById('messageInput');
         this.sendButton = document.getElementById('sendButton');
+        this.stopButton = document.getElementById('stopButton');
         this.output = document.getElementById('output');
         this.connectionStatus = document.getElementById('connectionStatus');
         this.fileInput = document.getElementById('fileInput');
@@ -29,6 +36,7 @@ class ChatInterface {
 
     setupEventListeners() {
         this.sendButton.addEventListener('click', () => this.sendMessage());
+        this.stopButton.addEventListener('click', () => this.stopResearch());
         this.messageInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter' && !e.shiftKey) {
                 e.preventDefault();
@@ -115,6 +123,13 @@ class ChatInterface {
         };
         
         this.socket.onclose = () => {
+            // The server cancels a connection's sessions when it closes
+            if (this.requests.size > 0) {
+                this.addMessage('error', 'Connection lost - running research was stopped.');
+                this.requests.clear();
+                this.activeRequestId = null;
+                this.updateButtons();
+            }
             this.connectionStatus.textContent = 'Disconnected';
             this.connectionStatus.className = 'connection-status disconnected';
             setTimeout(() => this.connectWebSocket(), 3000);
@@ -133,37 +148,81 @@ class ChatInterface {
     }
 
     handleMessage(data) {
+        const requestId = data.request_id;
+        const request = requestId ? this.requests.get(requestId) : null;
+        // Late messages of a stopped or finished session
+        if (requestId && !request) return;
+        const isActive = !requestId || requestId === this.activeRequestId;
+        const label = request && this.requests.size > 1 ? `**[${request.label}]** ` : '';
+
         switch (data.type) {
             case 'progress':
-                this.addMessage('progress', data.content.message || 'Processing...');
+                this.addMessage('progress', label + (data.content.message || 'Processing...'));
                 break;
             case 'research_step':
-                this.addMessage('research_step', `🔍 ${data.content}`);
+                this.addMessage('research_step', `${label}🔍 ${data.content}`);
                 break;
             case 'search_result':
-                this.addMessage('search_result', `📄 ${data.content}`);
+                this.addMessage('search_result', `${label}📄 ${data.content}`);
                 break;
             case 'thinking':
-                this.addMessage('thinking', data.content);
+                this.addMessage('thinking', label + data.content);
+                break;
+            case 'answer_delta':
+                if (isActive) this.appendAnswerDelta(data.content);
                 break;
             case 'result':
-                this.showFinalResult(data.content);
-                this.addMessage('final_answer', 'Research completed! See results in the right panel.');
-                this.isResearching = false;
-                this.sendButton.disabled = false;
-                this.sendButton.innerHTML = '<i class="fas fa-search"></i> Research';
+                if (isActive) {
+                    this.showFinalResult(data.content);
+                    this.addMessage('final_answer', `${label}Research completed! See results in the right panel.`);
+                } else {
+                    this.addMessage('final_answer', `${label}Research completed:\n\n${data.content.answer || 'No answer provided'}`);
+                }
+                this.finishRequest(requestId);
                 break;
             case 'error':
-                this.addMessage('error', data.content);
-                this.isResearching = false;
-                this.sendButton.disabled = false;
-                this.sendButton.innerHTML = '<i class="fas fa-search"></i> Research';
+                this.addMessage('error', label + data.content);
+                this.finishRequest(requestId);
+                break;
+            case 'cancelled':
+                this.addMessage('system', `${label}Research stopped.`);
+                if (isActive) {
+                    this.streamAttempt = null;
+                    this.streamedAnswer = '';
+                    this.output.textContent = 'Research stopped.';
+                    this.output.className = 'status';
+                }
+                this.finishRequest(requestId);
                 break;
             default:
                 this.addMessage('system', data.content || 'Unknown message type');
         }
     }
 
+    finishRequest(requestId) {
+        if (!requestId) return;
+        this.requests.delete(requestId);
+        if (requestId === this.activeRequestId) {
+            this.activeRequestId = null;
+        }
+        this.updateButtons();
+    }
+
+    updateButtons() {
+        const running = this.requests.size;
+        this.sendButton.innerHTML = running > 0
+            ? `<div class="progress-spinner"></div> Researching (${running})...`
+            : '<i class="fas fa-search"></i> Research';
+        this.stopButton.style.display = running > 0 ? 'flex' : 'none';
+    }
+
+    stopResearch() {
+        if (!this.socket || this.socket.readyState !== WebSocket.OPEN) return;
+        for (const requestId of this.requests.keys()) {
+            this.socket.send(JSON.stringify({ type: 'cancel', id: requestId }));
+        }
+    }
+
     addMessage(type, content) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${type}`;
@@ -226,11 +285,40 @@ class ChatInterface {
         });
     }
 
+    appendAnswerDelta(content) {
+        // A new attempt number means the answer is being regenerated from scratch
+        if (this.streamAttempt !== content.attempt) {
+            this.streamAttempt = content.attempt;
+            this.streamedAnswer = '';
+        }
+        this.streamedAnswer += content.delta;
+
+        // Re-render at most once per animation frame; tokens can arrive much faster
+        if (this.streamRenderPending) return;
+        this.streamRenderPending = true;
+        requestAnimationFrame(() => {
+            this.streamRenderPending = false;
+            if (this.streamAttempt === null) return;
+            this.output.className = 'markdown-content';
+            try {
+                const unsafeHtml = window.markdownit().render(this.streamedAnswer);
+                this.output.innerHTML = DOMPurify.sanitize(unsafeHtml);
+            } catch (e) {
+                this.output.textContent = this.streamedAnswer;
+            }
+        });
+    }
+
     showFinalResult(result) {
+        this.streamAttempt = null;
+        this.streamedAnswer = '';
         this.output.className = 'markdown-content';
         
         try {
-            const markdownInput = result.answer || 'No answer provided';
+            let markdownInput = result.answer || 'No answer provided';
+            if (result.partial) {
+                markdownInput = '*⏱️ Time budget reached - showing the best answer available so far.*\n\n' + markdownInput;
+            }
             const unsafeHtml = window.markdownit().render(markdownInput);
             this.output.innerHTML = DOMPurify.sanitize(unsafeHtml);
         } catch (e) {
@@ -247,7 +335,7 @@ class ChatInterface {
     }
 
     sendMessage() {
-        if (this.isResearching || !this.socket || this.socket.readyState !== WebSocket.OPEN) return;
+        if (!this.socket || this.socket.readyState !== WebSocket.OPEN) return;
         
         let message = this.messageInput.value.trim();
         if (this.uploadedFile) {
@@ -256,17 +344,23 @@ class ChatInterface {
         
         if (!message) return;
         
-        this.isResearching = true;
-        this.sendButton.disabled = true;
-        this.sendButton.innerHTML = '<div class="progress-spinner"></div> Researching...';
+        // Clear messages for new research unless other sessions are still reporting
+        if (this.requests.size === 0) {
+            this.messages.innerHTML = '';
+        }
+
+        const requestId = `q${Date.now().toString(36)}-${++this.requestCounter}`;
+        this.requests.set(requestId, { label: `#${this.requestCounter}` });
+        this.activeRequestId = requestId;
+        this.streamAttempt = null;
+        this.streamedAnswer = '';
         this.output.textContent = 'Research started... waiting for results.';
         this.output.className = 'status';
-        
-        // Clear messages for new research
-        this.messages.innerHTML = '';
-        
+        this.updateButtons();
+
         this.socket.send(JSON.stringify({
             type: 'query',
+            id: requestId,
             content: message,
             settings: {
                 num_searches: parseInt(this.numSearches.value) || 3,